@@ -36,9 +36,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    # Cache middleware should typically be last
-    'django.middleware.cache.UpdateCacheMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    # No site-wide cache middleware: pages are cached by their views, under the data
+    # generation of what they show (see texts.generation.cache_page_per_generation).
 ]
 
 # for newer django
@@ -86,6 +85,9 @@ CORPUS_REPO_OWNER = "CopticScriptorium"
 CORPUS_REPO_NAME = "corpora"
 GITHUB_API_BASE_URL = "https://api.github.com"
 
+# Where `manage.py build_token_index` writes the lemma/norm index read by every process
+TOKEN_INDEX_DIR = os.getenv("TOKEN_INDEX_DIR", os.path.join(BASE_DIR, "token_index"))
+
 DEPRECATED_URNS = {
     "urn:cts:copticLit:shenoute.a22.monbyb_307_320": "urn:cts:copticLit:shenoute.a22.monbyb:801-825",
     "urn:cts:copticLit:shenoute.a22.monbzc_301_308": "urn:cts:copticLit:shenoute.a22.monbzc:1001-1006",
@@ -55,6 +55,12 @@ SEARCH_CONFIG = {
     "MEILI_MASTER_KEY": os.getenv('MEILLI_MASTER_KEY', 'masterKey'),
     "MEILI_COPTIC_INDEX": "texts",
     "DISABLE": False,
+    # "text": one search document per text. "passage": one per chapter, grouped back
+    # into texts at query time. Changing it needs a rebuild: index_corpora --swap
+    "DOCUMENT_LAYOUT": os.getenv('SEARCH_DOCUMENT_LAYOUT', 'text'),
+    # "meilisearch", or "sqlite" for full text search in SQLite FTS5 files under SQLITE_DIR
+    "BACKEND": os.getenv('SEARCH_BACKEND', 'meilisearch'),
+    "SQLITE_DIR": os.getenv('SEARCH_SQLITE_DIR', 'search'),
 }
 
 if "test" in sys.argv:
@@ -70,4 +76,5 @@ CACHE_TTL = 60  # 60 seconds
 LOCAL_REPO_PATH =  "../../corpora" # this is for upsun
 # Control whether we are lazy loading the HTML generation
 # This has effects both on scraping (much faster)  and in
-# production.
\ No newline at end of file
+# production.
+LAZY_HTML_GENERATION = True
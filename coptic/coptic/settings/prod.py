@@ -60,12 +60,21 @@ SEARCH_CONFIG = {
     "MEILI_MASTER_KEY": os.getenv('MEILLI_MASTER_KEY', 'masterKey'),
     "MEILI_COPTIC_INDEX": "texts",
     "DISABLE": False,
+    # "text": one search document per text. "passage": one per chapter, grouped back
+    # into texts at query time. Changing it needs a rebuild: index_corpora --swap
+    "DOCUMENT_LAYOUT": os.getenv('SEARCH_DOCUMENT_LAYOUT', 'text'),
+    # "meilisearch", or "sqlite" for full text search in SQLite FTS5 files under SQLITE_DIR
+    "BACKEND": os.getenv('SEARCH_BACKEND', 'meilisearch'),
+    "SQLITE_DIR": os.getenv('SEARCH_SQLITE_DIR', 'db/search'),
 }
 
 # Use test database if running tests
 if "test" in sys.argv:
     DATABASES["default"]["NAME"] = "db/test_sqlite3.db"
 
+# Keep the token index next to the database and search files, outside the source tree
+TOKEN_INDEX_DIR = os.getenv("TOKEN_INDEX_DIR", "db/token_index")
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 STATIC_URL = "/static/"
@@ -73,4 +82,5 @@ STATICFILES_DIRS = (os.path.join(PROJECT_DIR, "static"),)
 LOCAL_REPO_PATH =  "/app/corpora" # this is for upsun
 
 CACHE_TTL = 60 * 60 * 24 * 7  # 1 week
-# Control whether we are lazy loading the HTML generation
\ No newline at end of file
+# Control whether we are lazy loading the HTML generation
+LAZY_HTML_GENERATION = False
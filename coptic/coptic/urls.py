@@ -59,6 +59,14 @@ urlpatterns = [
         views.text_view,
         name="text_with_format",
     ),
+    path("css/<str:style_hash>.css", views.visualization_css, name="visualization_css"),
+    path("api/occurrences/<str:layer>/", views.occurrences, name="occurrences"),
+    path("api/tokens/", views.tokens, name="tokens"),
+    path("api/frequencies/<slug:corpus>/<str:layer>/", views.frequencies, name="frequencies"),
+    path("api/frequencies/<slug:corpus>/<slug:text>/<str:layer>/", views.frequencies, name="text_frequencies"),
+    path("api/ngrams/<str:layer>/", views.ngrams, name="ngrams"),
+    path("api/concordance/<str:layer>/", views.concordance_api, name="concordance_api"),
+    path("concordance/", views.concordance, name="concordance"),
     # Legacy URL patterns using url()
     re_path(r"^(.*)/(annis|relannis|tei/xml|paula/xml|html)$", _redirect_citation_urls),
     re_path(r"^(?P<urn>urn:.*)/$", views.urn, name="urn"),
@@ -1,23 +1,29 @@
 import logging
 import re
 from django import forms
-from django.http import Http404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
-from django.db.models import Case, F, IntegerField, Q, When
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, When
 from django.shortcuts import get_object_or_404, redirect, render
 from django.db.models.functions import Lower
 from texts.search_fields import SearchField
+from texts.facets import get_catalog
+from texts.generation import cache_page_per_generation
 from texts.ft_search import Search
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import never_cache
+from django.utils.cache import patch_cache_control
 from django.core.cache import cache
 from django.conf import settings
 import texts.models as models
 import texts.urn
+from texts.token_index import get_token_index, DEFAULT_CONTEXT
+from texts.urn_resolver import get_resolver
 import base64
+import csv
+import itertools
 
 from django.template.defaulttags import register
 
-HTML_TAG_REGEX = re.compile(r"<[^>]*?>")
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +31,12 @@ logger = logging.getLogger(__name__)
 def keyvalue(dict, key):
     return dict.get(key)
 
-@cache_page(settings.CACHE_TTL)
+def _navigation_key():
+    # Corpus and text pages render the facet navigation of all corpora (_base_context).
+    return get_catalog().fingerprint
+
+
+@cache_page_per_generation(settings.CACHE_TTL)
 def home_view(request):
     "Home"
     context = _base_context()
@@ -33,7 +44,7 @@ def home_view(request):
     return render(request, "home.html", context)
 
 
-@cache_page(settings.CACHE_TTL)
+@cache_page_per_generation(settings.CACHE_TTL, corpus_kwarg="corpus", key_parts=_navigation_key)
 def corpus_view(request, corpus=None):
     corpus_object = get_object_or_404(models.Corpus, slug=corpus)
 
@@ -49,10 +60,14 @@ def corpus_view(request, corpus=None):
     return render(request, "corpus.html", context)
 
 
-@cache_page(settings.CACHE_TTL)
+@cache_page_per_generation(settings.CACHE_TTL, corpus_kwarg="corpus", key_parts=_navigation_key)
 def text_view(request, corpus=None, text=None, format=None):
     corpus_object = get_object_or_404(models.Corpus, slug=corpus)
-    text_object = get_object_or_404(models.Text, corpus=corpus_object.id, slug=text)
+    text_object = get_object_or_404(
+        models.Text.objects.select_related("corpus", "next_text__corpus", "previous_text__corpus"),
+        corpus=corpus_object.id,
+        slug=text,
+    )
     
 
     if not format:
@@ -66,7 +81,7 @@ def text_view(request, corpus=None, text=None, format=None):
     # this is probably wrong?
     visualization = text_object.get_visualization_by_slug(format)
     
-    doc_urn = text_object.text_meta.get(name="document_cts_urn").value
+    doc_urn = text_object.document_cts_urn
 
     text_object.edition_urn = doc_urn
     text_object.urn_cts_work = texts.urn.cts_work(doc_urn)
@@ -74,29 +89,6 @@ def text_view(request, corpus=None, text=None, format=None):
     text_object.corpus_urn = texts.urn.corpus_urn(doc_urn)
     text_object.text_url = "texts/" + text_object.corpus.slug + "/" + text_object.slug
 
-    try:
-        next_text_urn = text_object.text_meta.get(name="next").value.strip()
-        slug = models.Text.objects.get(
-            text_meta__name="document_cts_urn", text_meta__value=next_text_urn
-        ).slug
-        text_object.next = slug
-    except (models.TextMeta.DoesNotExist, models.Text.DoesNotExist):
-        logger.error("Next text not found")  # Debug statement
-        pass
-    try:
-        previous_text_urn = text_object.text_meta.get(name="previous").value.strip()
-        slug = models.Text.objects.get(
-            text_meta__name="document_cts_urn", text_meta__value=previous_text_urn
-        ).slug
-        text_object.previous = slug
-    except (models.TextMeta.DoesNotExist, models.Text.DoesNotExist):
-        logger.error("Previous text not found") # Debug statement
-        pass
-    try:
-        text_object.endnote = text_object.text_meta.get(name="endnote").value
-    except (models.TextMeta.DoesNotExist, models.Text.DoesNotExist):
-        logger.warning("Endnote not found")  # Debug statement
-        pass
     visualizations = text_object.html_visualizations.all()
     
     context = _base_context()
@@ -106,23 +98,265 @@ def text_view(request, corpus=None, text=None, format=None):
     return render(request, "text.html", context)
 
 
-def not_found(request):
-    return render(request, "404.html", {})
+def visualization_css(request, style_hash):
+    "The stylesheet of a visualization. The URL is content addressed, so browsers can keep it."
+    style = get_object_or_404(models.VisualizationStyle, hash=style_hash)
+    response = HttpResponse(style.css, content_type="text/css")
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
+
 
-def _resolve_urn(urn):
+OCCURRENCES_PER_PAGE = 100
+CONCORDANCE_PER_PAGE = 50
+MAX_CONCORDANCE_CONTEXT = 25
+# The token index views are not cached: lookups are cheap and builds change under them.
+CONCORDANCE_CSV_COLUMNS = ["corpus_slug", "slug", "title", "chapter", "offset", "left", "match", "right"]
+
+
+def _page_number(request):
     try:
-        text = models.Text.objects.get(
-            text_meta__name="document_cts_urn", text_meta__value=urn
+        return max(1, int(request.GET.get("page", "1")))
+    except ValueError:
+        return 1
+
+
+@never_cache
+def occurrences(request, layer):
+    """JSON list of the occurrences of an exact lemma, norm or norm_group, paginated with ?page="""
+    index = get_token_index()
+    if index is None:
+        return JsonResponse({"error": "The token index has not been built."}, status=503)
+    if layer not in index.layers:
+        raise Http404(f"Unknown layer: {layer}")
+    term = request.GET.get("q", "").strip()
+    page = _page_number(request)
+    start = (page - 1) * OCCURRENCES_PER_PAGE
+    total = index.frequency(layer, term)
+    return JsonResponse(
+        {
+            "layer": layer,
+            "query": term,
+            "total": total,
+            "page": page,
+            "total_pages": (total + OCCURRENCES_PER_PAGE - 1) // OCCURRENCES_PER_PAGE,
+            "occurrences": index.lookup(layer, term, start, start + OCCURRENCES_PER_PAGE),
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@never_cache
+def ngrams(request, layer):
+    """JSON occurrences of an n-gram of norm, norm_group or pos values, given as ?q= separated
+    by spaces, with its frequency in every corpus. Paginated with ?page="""
+    index = get_token_index()
+    if index is None:
+        return JsonResponse({"error": "The token index has not been built."}, status=503)
+    if layer not in index.ngram_layers:
+        raise Http404(f"No n-gram index for layer: {layer}")
+    words = request.GET.get("q", "").split()
+    if not 1 <= len(words) <= index.max_n:
+        return JsonResponse({"error": f"N-grams have 1 to {index.max_n} words."}, status=400)
+    positions = index.ngram_occurrences(layer, words)
+    page = _page_number(request)
+    start = (page - 1) * OCCURRENCES_PER_PAGE
+    return JsonResponse(
+        {
+            "layer": layer,
+            "query": words,
+            "total": len(positions),
+            "corpora": index.corpus_distribution(positions),
+            "page": page,
+            "total_pages": (len(positions) + OCCURRENCES_PER_PAGE - 1) // OCCURRENCES_PER_PAGE,
+            "occurrences": [index.locate_occurrence(position) for position in positions[start : start + OCCURRENCES_PER_PAGE]],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@never_cache
+def tokens(request):
+    """JSON citations of the words matching annotation filters, e.g.
+    ?pos=N&lang=Greek&author=Shenoute. Every parameter named after a layer of the token
+    index is a condition; repeating it allows any of its values. ?corpus= (slugs) and
+    ?author= restrict the texts searched. Paginated with ?page="""
+    index = get_token_index()
+    if index is None:
+        return JsonResponse({"error": "The token index has not been built."}, status=503)
+    conditions = {layer: request.GET.getlist(layer) for layer in index.layers if layer in request.GET}
+    if not conditions:
+        return JsonResponse({"error": f"Filter on at least one of: {', '.join(index.layers)}."}, status=400)
+    texts = None
+    if "author" in request.GET:
+        texts = models.Text.objects.filter(text_meta__name="author", text_meta__value__in=request.GET.getlist("author"))
+    if "corpus" in request.GET:
+        texts = (texts if texts is not None else models.Text.objects).filter(corpus__slug__in=request.GET.getlist("corpus"))
+    text_ids = None if texts is None else texts.values_list("id", flat=True)
+    positions = index.query(conditions, text_ids=text_ids)
+    page = _page_number(request)
+    start = (page - 1) * OCCURRENCES_PER_PAGE
+    return JsonResponse(
+        {
+            "conditions": conditions,
+            "total": len(positions),
+            "corpora": index.corpus_distribution(positions),
+            "page": page,
+            "total_pages": (len(positions) + OCCURRENCES_PER_PAGE - 1) // OCCURRENCES_PER_PAGE,
+            "tokens": [index.cite(position) for position in positions[start : start + OCCURRENCES_PER_PAGE]],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+FREQUENCIES_PER_PAGE = 100
+
+
+@cache_page_per_generation(settings.CACHE_TTL, corpus_kwarg="corpus")
+def frequencies(request, corpus, layer, text=None):
+    """The lemma or norm frequency list of a corpus or of one of its texts, as JSON paginated
+    with ?page=, or whole as CSV with ?format=csv. Served from rows computed at ingest."""
+    if layer not in models.TermFrequency.LAYERS:
+        raise Http404(f"No frequency lists for layer: {layer}")
+    corpus_object = get_object_or_404(models.Corpus, slug=corpus)
+    text_object = get_object_or_404(models.Text, corpus=corpus_object, slug=text) if text else None
+    rows = models.TermFrequency.ranked(corpus_object, layer, text_object)
+    if request.GET.get("format") == "csv":
+        writer = csv.writer(_Echo())
+        lines = itertools.chain(
+            [writer.writerow(["term", "count"])],
+            (writer.writerow(row) for row in rows.values_list("term", "count").iterator()),
         )
-        return text
-    except models.Text.DoesNotExist:
-        try:
-            corpus = models.Corpus.objects.get(urn_code=urn)
-            return corpus
-        except models.Corpus.DoesNotExist:
-            return None
+        response = StreamingHttpResponse(lines, content_type="text/csv; charset=utf-8")
+        filename = f"{corpus}-{text}-{layer}" if text else f"{corpus}-{layer}"
+        response["Content-Disposition"] = f'attachment; filename="frequencies-{filename}.csv"'
+        return response
+    totals = rows.aggregate(types=Count("id"), tokens=Sum("count"))
+    page = _page_number(request)
+    start = (page - 1) * FREQUENCIES_PER_PAGE
+    return JsonResponse(
+        {
+            "corpus": corpus,
+            "text": text,
+            "layer": layer,
+            "types": totals["types"],
+            "tokens": totals["tokens"] or 0,
+            "page": page,
+            "total_pages": (totals["types"] + FREQUENCIES_PER_PAGE - 1) // FREQUENCIES_PER_PAGE,
+            "frequencies": [
+                {"term": term, "count": count}
+                for term, count in rows.values_list("term", "count")[start : start + FREQUENCIES_PER_PAGE]
+            ],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+def _concordance_params(request):
+    term = request.GET.get("q", "").strip()
+    try:
+        context = int(request.GET.get("context", DEFAULT_CONTEXT))
+    except ValueError:
+        context = DEFAULT_CONTEXT
+    return term, min(max(context, 0), MAX_CONCORDANCE_CONTEXT), _page_number(request)
+
+
+def _concordance_page(index, layer, term, context, page):
+    start = (page - 1) * CONCORDANCE_PER_PAGE
+    total = index.frequency(layer, term)
+    return {
+        "layer": layer,
+        "query": term,
+        "context": context,
+        "total": total,
+        "page": page,
+        "total_pages": (total + CONCORDANCE_PER_PAGE - 1) // CONCORDANCE_PER_PAGE,
+        "hits": index.concordance(layer, term, context, start, start + CONCORDANCE_PER_PAGE),
+    }
+
 
+class _Echo:
+    def write(self, value):
+        return value
 
+
+def _concordance_csv(index, layer, term, context):
+    """Every hit, streamed in pages so exports of frequent lemmas start right away."""
+    writer = csv.writer(_Echo())
+    total = index.frequency(layer, term)
+
+    def rows():
+        yield writer.writerow(CONCORDANCE_CSV_COLUMNS)
+        for start in range(0, total, CONCORDANCE_PER_PAGE):
+            for hit in index.concordance(layer, term, context, start, start + CONCORDANCE_PER_PAGE):
+                hit.update(left=" ".join(hit["left"]), match=" ".join(hit["match"]), right=" ".join(hit["right"]))
+                yield writer.writerow([hit[column] for column in CONCORDANCE_CSV_COLUMNS])
+
+    response = StreamingHttpResponse(rows(), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="concordance-{layer}.csv"'
+    return response
+
+
+@never_cache
+def concordance_api(request, layer):
+    """Keyword in context hits of an exact lemma, norm or norm_group as JSON, paginated with
+    ?page=, or all of them as CSV with ?format=csv. ?context= is the number of words shown
+    on either side."""
+    index = get_token_index()
+    if index is None:
+        return JsonResponse({"error": "The token index has not been built."}, status=503)
+    if layer not in index.layers:
+        raise Http404(f"Unknown layer: {layer}")
+    term, context, page = _concordance_params(request)
+    if request.GET.get("format") == "csv":
+        return _concordance_csv(index, layer, term, context)
+    return JsonResponse(_concordance_page(index, layer, term, context, page), json_dumps_params={"ensure_ascii": False})
+
+
+@never_cache
+def concordance(request):
+    context = _base_context()
+    index = get_token_index()
+    layer = request.GET.get("layer", "lemma")
+    term, words, page = _concordance_params(request)
+    results = None
+    if index is not None and term:
+        if layer not in index.layers:
+            raise Http404(f"Unknown layer: {layer}")
+        results = _concordance_page(index, layer, term, words, page)
+    context.update(
+        {
+            "page_title": "Concordance",
+            "layers": index.layers if index else [],
+            "index_built": index is not None,
+            "layer": layer,
+            "query_text": term,
+            "context_words": words,
+            "results": results,
+            "current_page": page,
+            "total_pages": results["total_pages"] if results else 0,
+            "has_previous": page > 1,
+            "has_next": bool(results) and page < results["total_pages"],
+            "previous_page": page - 1,
+            "next_page": page + 1,
+        }
+    )
+    return render(request, "concordance.html", context)
+
+
+def not_found(request):
+    return render(request, "404.html", {})
+
+def _redirect_to_urn(urn):
+    """A redirect to the text or corpus page of a (possibly deprecated) URN, or None."""
+    obj = get_resolver().resolve(urn)
+    if isinstance(obj, models.Corpus):
+        return redirect("corpus", corpus=obj.slug)
+    if obj is not None:
+        return redirect("text", corpus=obj.corpus.slug, text=obj.slug)
+    return None
+
+
+@cache_page_per_generation(settings.CACHE_TTL)
 def urn(request, urn=None):
     # https://github.com/CopticScriptorium/cts/issues/112
     if re.match(r"urn:cts:copticLit:ot.*.crosswire", urn):
@@ -130,28 +364,21 @@ def urn(request, urn=None):
             "https://github.com/CopticScriptorium/corpora/releases/tag/v2.5.0"
         )
 
-    # check to see if the URN is deprecated and redirect if so
-    urn = settings.DEPRECATED_URNS.get(urn, urn)
-    obj = _resolve_urn(urn)
-
-    if obj.__class__.__name__ == "Text":
-        return redirect("text", corpus=obj.corpus.slug, text=obj.slug)
-    elif obj.__class__.__name__ == "Corpus":
-        return redirect("corpus", corpus=obj.slug)
-    return redirect(reverse("search") + f"?text={urn}")
+    # Deprecated URNs redirect to the text or corpus of their replacement
+    return _redirect_to_urn(urn) or redirect(reverse("search") + f"?text={get_resolver().canonical(urn)}")
 
-@cache_page(settings.CACHE_TTL)
+@cache_page_per_generation(settings.CACHE_TTL)
 def index_view(request, special_meta=None):
     context = _base_context()
     try:
         # FIXME hack are the inconsistency in meta names.
         if special_meta=="msName":
             special_meta="ms_name"
-        meta = settings.METAS.get(special_meta)
+        meta = settings.METAS[special_meta]
     except KeyError:
         raise Http404(f'Special metadata type "{special_meta}" not found')
     
-    value_corpus_pairs = models.Text.get_value_corpus_pairs(meta)
+    value_corpus_pairs = get_catalog().value_corpus_pairs(meta["name"])
 
     b64_meta_values = {
         meta_value: str(base64.b64encode(('identity="'+meta_value+'"').encode("ascii")).decode("ascii"))
@@ -202,26 +429,12 @@ class SearchForm(forms.Form):
         special_metas = dict(
             sorted(settings.METAS.items(), key=lambda x: x[1]["name"].lower())
         )
+        catalog = get_catalog()
         for sm in special_metas:
-            meta_values = models.Text.get_meta_values(special_metas[sm]) # So this is how we actually do "faceting"
-            choices = []
-            for v in meta_values:
-                if special_metas[sm]["name"] == "corpus":
-                    try:
-                        human_name = models.Corpus.objects.get(
-                            annis_corpus_name=v
-                        ).title
-                    except models.Corpus.DoesNotExist:
-                        human_name = v
-                else:
-                    human_name = v
-                human_name = re.sub(HTML_TAG_REGEX, "", human_name)
-                choices.append((v, human_name))
-
             self.fields[special_metas[sm]["name"]] = forms.MultipleChoiceField(
                 label=special_metas[sm]["name"],
                 required=False,
-                choices=choices,
+                choices=catalog.choices(special_metas[sm]["name"]),
                 widget=forms.SelectMultiple(attrs={"class": "search-choice-field"}),
             )
 
@@ -245,9 +458,7 @@ def _build_queries_for_special_metadata(params):
             if meta_value:
                 if meta_name == "document_cts_urn":
                     regex = "^" + meta_value.replace(".", r"\.").replace("*", ".*")
-                    meta_name_query = meta_name_query | Q(
-                        text_meta__name__iexact=meta_name, text_meta__value__regex=regex
-                    )
+                    meta_name_query = meta_name_query | Q(document_cts_urn__regex=regex)
                 else:
                     meta_name_query = meta_name_query | Q(
                         text_meta__name__iexact=meta_name,
@@ -260,11 +471,12 @@ def _build_queries_for_special_metadata(params):
 
 def _fetch_and_filter_texts_for_special_metadata_query(queries):
     if queries:
-        texts = models.Text.objects.all().order_by(Lower("title"))
+        # Each metadata query joins text_meta once more, so a text can match several times.
+        # Author and URN are columns of Text; the content is not needed to list results.
+        texts = models.Text.objects.select_related("corpus").defer("content").order_by(Lower("title"))
         for query in queries:
             texts = texts.filter(query)
-        add_author_and_urn(texts)
-        return texts
+        return texts.distinct()
     else:
         return models.Text.objects.none()
 
@@ -275,16 +487,8 @@ def _build_explanation(params):
         if meta_name == "text":
             continue
         if meta_name == "corpus":
-            new_meta_values = []
-            for meta_value in meta_values:
-                try:
-                    meta_value = models.Corpus.objects.get(
-                        annis_corpus_name=meta_value
-                    ).title
-                except models.Corpus.DoesNotExist:
-                    pass
-                new_meta_values.append(meta_value)
-            meta_values = new_meta_values
+            corpus_titles = dict(get_catalog().choices("corpus"))
+            meta_values = [corpus_titles.get(meta_value, meta_value) for meta_value in meta_values]
 
         # indicate the special logic used for document_cts_urn
         sep = "=" if meta_name != "document_cts_urn" else "matching"
@@ -313,7 +517,6 @@ def _build_result_for_query_text(query_text, texts, explanation):
                 text_meta__name__iexact=meta_name,
                 text_meta__value__icontains=query_text,
             )
-        add_author_and_urn(text_results)
         results.append({"texts": text_results, "explanation": complete_explanation})
     all_empty_explanation = f'<span class="meta_pair">{query_text}</span> in metadata'
     all_empty_explanation += " with " if explanation else ""
@@ -322,23 +525,25 @@ def _build_result_for_query_text(query_text, texts, explanation):
 
 
 def _base_context():
+    catalog = get_catalog()
     context = {
         "search_fields": [
-            SearchField("corpus"),
-            SearchField("author"),
-            SearchField("msName"),
-            SearchField("people"),
-            SearchField("places"),
-            # SearchField("annotation"),
+            SearchField("corpus", catalog),
+            SearchField("author", catalog),
+            SearchField("msName", catalog),
+            SearchField("people", catalog),
+            SearchField("places", catalog),
+            # SearchField("annotation", catalog),
         ],
         "secondary_search_fields": [
-            SearchField("translation"),
-            SearchField("arabic_translation"),
+            SearchField("translation", catalog),
+            SearchField("arabic_translation", catalog),
         ],
     }
     return context
 
 
+@cache_page_per_generation(settings.CACHE_TTL)
 def search(request):
     context = _base_context()
 
@@ -410,6 +615,9 @@ def search(request):
     else:
         results = [{"texts": texts, "explanation": explanation}]
         all_empty_explanation = explanation
+    # Evaluate every result set once, here, rather than again for each len(), count and loop.
+    for result in results:
+        result["texts"] = list(result["texts"])
 
     context.update(
         {
@@ -418,7 +626,7 @@ def search(request):
             "fulltext_results": fulltext_results,
             "form": SearchForm(request.GET),
             "no_query": not any(len(v) for v in request.GET.dict().values()),
-            "all_empty": not any(len(r["texts"]) for r in results),
+            "all_empty": not any(r["texts"] for r in results),
             "all_empty_explanation": all_empty_explanation,
             "query_text": query_text,
         }
@@ -436,6 +644,7 @@ def _build_remove_query_url(request):
         del params['page']
     return f"?{params.urlencode()}"
 
+@cache_page_per_generation(settings.CACHE_TTL)
 def faceted_search(request):
     context = _base_context()
     params = dict(request.GET.lists())
@@ -568,6 +777,14 @@ def _build_add_facet_url(request, facet, value):
         del params['page']
     return f"?{params.urlencode()}"
 
+# (matched attribute, label, field of the chapter), in order of preference
+CHAPTER_HIT_FIELDS = [
+    ("text.normalized", "Normalized text", "normalized"),
+    ("text.normalized_group", "Normalized text group", "normalized_group"),
+    ("text.lemmatized", "Lemmatized", "lemmatized"),
+    ("text.english_translation", "English Translation", "english_translation"),
+]
+
 def _process_search_hits(hits):
     """Process search hits into a consistent format."""
     results = []
@@ -579,20 +796,16 @@ def _process_search_hits(hits):
         # we can also output the indice as a property (it should represent the paragraph number)
         
         
-        # Process hits based on matched fields
+        # Process hits based on matched fields. For the chapter fields, the first match
+        # index is the position of the matching chapter in the document's text array.
         hits_dict = {}
-        if "text.normalized" in attrs:
-            indice = mathches_positions.get("text.normalized")[0]["indices"][0]
-            hits_dict["Normalized text"] = hit["_formatted"]["text"][indice]["normalized"]
-        elif "text.normalized_group" in attrs:
-            indice = mathches_positions.get("text.normalized_group")[0]["indices"][0]
-            hits_dict["Normalized text group"] = hit["_formatted"]["text"][indice]["normalized_group"]
-        elif "text.lemmatized" in attrs:
-            indice = mathches_positions.get("text.lemmatized")[0]["indices"][0]
-            hits_dict["Lemmatized"] = hit["_formatted"]["text"][indice]["lemmatized"]
-        elif "text.english_translation" in attrs:
-            indice = mathches_positions.get("text.english_translation")[0]["indices"][0]
-            hits_dict["English Translation"] = hit["_formatted"]["text"][indice]["english_translation"]
+        chapter = None
+        for attr, label, field in CHAPTER_HIT_FIELDS:
+            if attr in attrs:
+                indice = mathches_positions.get(attr)[0]["indices"][0]
+                hits_dict[label] = hit["_formatted"]["text"][indice][field]
+                chapter = hit["_formatted"]["text"][indice].get("chapter")
+                break
         else:
             for attr in attrs:
                 if "slug" not in attr:
@@ -605,33 +818,15 @@ def _process_search_hits(hits):
             "urn": hit["text_meta"]["document_cts_urn"],
             "slug": hit["slug"],
             "corpus_slug": hit["corpus_slug"],
+            "chapter": chapter,
             "hits": hits_dict
         })
     
     return results
 
-def add_author_and_urn(texts):
-    for text in texts:
-        try:
-            text.author = text.text_meta.get(name="author").value
-        except models.TextMeta.DoesNotExist:
-            logger.debug("Authors for Corpus not found")  # Debug statement
-            pass
-        try:
-            text.urn_code = text.text_meta.get(name="document_cts_urn").value
-        except models.TextMeta.DoesNotExist:
-            pass
-
-
 def texts_for_urn(urn):
-    # Find texts matching the URN using their metadata
-    matching_tm_ids = models.TextMeta.objects.filter(
-        name="document_cts_urn", value__iregex="^" + urn + r"($|[\.:])"
-    ).values_list("id", flat=True)
-    texts = models.Text.objects.filter(
-        text_meta__name="document_cts_urn", text_meta__id__in=matching_tm_ids
-    ).order_by("slug")
-    return texts
+    # Texts whose URN is the given one or lies under it, as UrnTexts
+    return get_resolver().texts_under(urn)
 
 def handle_urn(query_text):
     query_text = query_text.strip() # Strip whitespace
@@ -643,10 +838,5 @@ def handle_urn(query_text):
             return redirect(
                 "https://github.com/CopticScriptorium/corpora/releases/tag/v2.5.0"
             )
-        urn = settings.DEPRECATED_URNS.get(urn, urn)
-        obj = _resolve_urn(urn)
-        if obj.__class__.__name__ == "Text":
-            return redirect("text", corpus=obj.corpus.slug, text=obj.slug)
-        elif obj.__class__.__name__ == "Corpus":
-            return redirect("corpus", corpus=obj.slug)
+        return _redirect_to_urn(urn)
     return None
\ No newline at end of file
@@ -1,32 +1,69 @@
 from html import unescape
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import logging
 import re
 import csv
 from io import StringIO
 from xml.dom import NotFoundErr
+import django
 from django.conf import settings
-from django.db import transaction
+from django.db import connections, transaction
 from django.utils.text import slugify
 from tqdm import tqdm
 from gh_ingest.corpus_transaction import CorpusTransaction
+from gh_ingest.repository import Repository
 
 from texts.models import (
     Corpus,
     Text,
     TextMeta,
     HtmlVisualization,
+    VisualizationStyle,
 )
 
 import texts.urn as urn
 from .scraper_exceptions import *
-from .htmlvis import generate_visualization
+from .htmlvis import generate_visualization, HtmlGenerationException
 import os
 import csv
 
+
+def _init_worker(local_repo_path):
+    # Under the "spawn" start method workers start from a blank interpreter.
+    django.setup()
+    settings.LOCAL_REPO_PATH = local_repo_path
+    Repository(update=False)
+
+
+def _parse_corpus_in_worker(corpus_dirname):
+    try:
+        transaction = CorpusScraper().parse_corpus(corpus_dirname)
+        if not settings.LAZY_HTML_GENERATION:
+            # Rendering is the slow part of an ingest, so do it here rather than when the
+            # parent process executes the transactions one by one.
+            transaction.render_visualizations()
+        return transaction
+    except (ScraperException, HtmlGenerationException) as e:
+        # Most scraper exceptions take several arguments and can't be unpickled by the
+        # parent process, so send the message across in the base class.
+        raise ScraperException(str(e)) from None
+
+
+def _corpus_size(corpus_dirname):
+    corpus_path = os.path.join(settings.LOCAL_REPO_PATH, corpus_dirname)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(corpus_path)
+        for name in names
+    )
+
 class CorpusScraper:
     def __init__(self):
+        self._reset()
 
+    def _reset(self):
+        """Drops everything held for the corpus parsed last."""
         self._current_corpus = None
         self._current_transaction = None
         self._current_text_contents = None
@@ -35,13 +72,80 @@ class CorpusScraper:
         self._text_next = defaultdict(lambda: None)
         self._text_prev = defaultdict(lambda: None)
         self._text_urn = defaultdict(lambda: None)
-
+        # (config, css) -> VisualizationStyle, shared by all visualizations of the corpus
+        self._styles = {}
 
     def parse_corpora(self, corpus_dirnames):
-        corpora = []
+        return list(self.iter_corpora(corpus_dirnames))
+
+    def iter_corpora(self, corpus_dirnames):
+        """Yields one transaction at a time. The next corpus is only parsed once the caller
+        asks for it, so a caller that executes and drops each transaction before moving on
+        only ever holds a single corpus in memory."""
         for corpus_dirname in corpus_dirnames:
-            corpora.append(self.parse_corpus(corpus_dirname))
-        return corpora
+            transaction = self.parse_corpus(corpus_dirname)
+            self._reset()
+            yield transaction
+            # Otherwise this frame would keep the corpus alive while the next one is parsed.
+            del transaction
+
+    def parse_corpora_in_parallel(self, corpus_dirnames, jobs):
+        """Parses corpora in a pool of `jobs` worker processes and yields their transactions
+        as they complete. Nothing is written in the workers: the caller executes the
+        transactions one by one in this process, so SQLite only ever sees one writer.
+
+        The largest corpora are submitted first so that they don't end up as the tail.
+        At most `2 * jobs` corpora are in flight, so parsed transactions don't pile up
+        when executing them is slower than parsing."""
+        # Pull the repository once here rather than in every worker, and don't let the
+        # workers inherit our database connection.
+        Repository()
+        connections.close_all()
+        pending_dirnames = iter(sorted(corpus_dirnames, key=_corpus_size, reverse=True))
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(settings.LOCAL_REPO_PATH,)
+        ) as executor:
+            in_flight = set()
+            try:
+                while True:
+                    for corpus_dirname in pending_dirnames:
+                        in_flight.add(executor.submit(_parse_corpus_in_worker, corpus_dirname))
+                        if len(in_flight) >= 2 * jobs:
+                            break
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    # Pop each future rather than loop over them, so that no reference to a
+                    # yielded transaction stays behind in this frame.
+                    while done:
+                        yield done.pop().result()
+            except BaseException:
+                # A failed parse, or the caller giving up on us: don't start the corpora
+                # still queued, which leaving the with block would wait for.
+                executor.shutdown(cancel_futures=True)
+                raise
+
+    def corpus_is_unchanged(self, corpus_dirname):
+        """True if every text we have for this corpus directory was ingested from the
+        git tree the directory has at HEAD, i.e. re-ingesting it would change nothing."""
+        try:
+            tree_id = Repository()._get_tree_id(corpus_dirname)
+        except TTDirMissing:
+            return False
+        stored_tree_ids = set(
+            Text.objects.filter(tt_dir=corpus_dirname).values_list("tt_dir_tree_id", flat=True).distinct()
+        )
+        return stored_tree_ids == {tree_id}
+
+    def filter_changed_corpora(self, corpus_dirnames):
+        """Drops the corpus directories whose git tree hasn't moved since they were ingested."""
+        changed = []
+        for corpus_dirname in corpus_dirnames:
+            if self.corpus_is_unchanged(corpus_dirname):
+                logging.info(f"Corpus '{corpus_dirname}' is unchanged since the last ingest. Skipping.")
+            else:
+                changed.append(corpus_dirname)
+        return changed
 
     def _infer_dirs(self, corpus, corpus_dirname):
         dirs = corpus.repository._get_dirs(corpus_dirname)    
@@ -147,11 +251,17 @@ class CorpusScraper:
         
     @transaction.atomic
     def parse_corpus(self, corpus_dirname):
-    
+        self._reset()
         corpus = Corpus(read_repository=True)
         if corpus_dirname not in corpus.repository._corpora:
             raise CorpusNotFound(corpus_dirname, settings.LOCAL_REPO_PATH)
 
+        # Every text reads the same configs and stylesheets out of the relANNIS archive.
+        with corpus.repository.open_archives():
+            return self._parse_corpus(corpus, corpus_dirname)
+
+    def _parse_corpus(self, corpus, corpus_dirname):
+
         self._current_corpus = corpus
         self._current_transaction = CorpusTransaction(corpus_dirname, corpus)
 
@@ -218,6 +328,7 @@ class CorpusScraper:
             corpus.urn_code = urn.textgroup_urn(self._latest_meta_dict["document_cts_urn"])
         # lastly let's add the corpus author
         corpus.author = ', '.join(list(self._latest_meta_dict.get("author", [])))
+        self._current_transaction.count_terms()
         return self._current_transaction
 
     def _scrape_texts_and_add_to_tx(self, corpus, corpus_dirname, texts, tree_id):
@@ -247,8 +358,11 @@ class CorpusScraper:
             
             if filename=="norm":
                 filename="verses"
-            vis.config = self.get_file_content(corpus, corpus_dirname, "ExtData/" + filename + ".config")
-            vis.css = self.get_file_content(corpus, corpus_dirname, "ExtData/" + filename + ".css")
+            config = self.get_file_content(corpus, corpus_dirname, "ExtData/" + filename + ".config")
+            css = self.get_file_content(corpus, corpus_dirname, "ExtData/" + filename + ".css")
+            if (config, css) not in self._styles:
+                self._styles[(config, css)] = VisualizationStyle.build(config, css)
+            vis.style = self._styles[(config, css)]
             self._current_transaction.add_vis((text, vis))
 
     def _scrape_text_and_add_to_tx(self, corpus_dirname, contents, tree_id, filename, vis_formats):
@@ -276,9 +390,9 @@ class CorpusScraper:
         self._text_urn[text.title] = (
             meta_split_and_cleaned["document_cts_urn"] if "document_cts_urn" in meta_split_and_cleaned else None
         )
-        self.document_cts_urn=meta_split_and_cleaned["document_cts_urn"]
-        
-        if not self.document_cts_urn:
+        text.document_cts_urn = meta_split_and_cleaned["document_cts_urn"]
+
+        if not text.document_cts_urn:
             raise "Missing URN"
 
         text_metas=[]
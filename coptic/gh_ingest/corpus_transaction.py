@@ -1,13 +1,23 @@
 from collections import defaultdict
+import datetime
 import logging
+import time
 from django.db import transaction
+from django.db.models import Q
 from django.conf import settings
 
-from texts.models import HtmlVisualization
+from texts.models import HtmlVisualization, RenderedVisualization, TermFrequency, Text, TextMeta, VisualizationStyle
+from texts import generation
+from .htmlvis import content_hash
 from .scraper_exceptions import *
 from texts.ft_search import Search
 from tqdm import tqdm
 
+# Keeps "pk IN (...)" deletes below SQLite's limit on query parameters.
+DELETE_BATCH_SIZE = 500
+FREQUENCY_BATCH_SIZE = 5000
+
+
 class CorpusTransaction:
     """Keeps track of every object that needs to be added to the SQL database for a given corpus,
     and atomically saves all of them."""
@@ -21,6 +31,8 @@ class CorpusTransaction:
         self._vis_formats = []
         self._vises = []
         self._to_delete = []
+        self._rendered = None
+        self._term_counts = None
 
     def add_objs_to_be_deleted(self, objs):
         self._to_delete = objs
@@ -34,6 +46,17 @@ class CorpusTransaction:
     def add_vis(self, text_and_vis):
         self._vises.append(text_and_vis)
 
+    def count_terms(self):
+        """Counts the terms of every text, for execute() to save. The scraper calls this while
+        parsing, in the worker processes of a parallel ingest, rather than in execute()'s
+        database transaction."""
+        self._term_counts = [TermFrequency.count_text(text.content) for text, _ in self._text_pairs]
+
+    def render_visualizations(self):
+        """Renders the visualizations that are not in the store yet, for execute() to save.
+        Parallel ingest calls this in the worker processes."""
+        self._rendered = RenderedVisualization.render_missing(self._vises)
+
     def sort_texts(self, text_next, text_prev, text_urn):
         """
         Sorts texts based on next and previous metadata. Only actually changes their order if the next and previous
@@ -112,16 +135,39 @@ class CorpusTransaction:
             "Successfully inferred proper ordering of corpus based on next/prev attrs."
         )
 
+    def _delete_existing(self):
+        """Deletes the previous upload with one query per model (and batch) rather than per object."""
+        pks_by_model = defaultdict(list)
+        for obj in self._to_delete:
+            pks_by_model[type(obj)].append(obj.pk)
+        for model, pks in pks_by_model.items():
+            for i in range(0, len(pks), DELETE_BATCH_SIZE):
+                model.objects.filter(pk__in=pks[i : i + DELETE_BATCH_SIZE]).delete()
+
+    def _links_from_other_corpora(self):
+        """{text id: (corpus slug, next and previous corpus and text slugs)} of the texts of
+        other corpora that link into this one, i.e. what their pages show of it."""
+        slug = self._corpus.slug
+        texts = Text.objects.filter(Q(next_text__corpus__slug=slug) | Q(previous_text__corpus__slug=slug))
+        return {
+            text_id: links
+            for text_id, *links in texts.exclude(corpus__slug=slug).values_list(
+                "id", "corpus__slug", "next_text__corpus__slug", "next_text__slug",
+                "previous_text__corpus__slug", "previous_text__slug",
+            )
+        }
+
     @transaction.atomic
     def execute(self):
+        started = time.perf_counter()
+        links_before = self._links_from_other_corpora()
         # Delete existing objects first
         if len(self._to_delete) > 0:
             logging.info(
                 f"Found an already existing upload of '{self.corpus_name}'. "
                 f"It will be automatically deleted if this transaction succeeds."
             )
-            for obj in self._to_delete:
-                obj.delete()
+            self._delete_existing()
 
         # Set visualization formats before initial save
         vis_format_instances = []
@@ -143,35 +189,74 @@ class CorpusTransaction:
 
         self._corpus.save()
         logging.info(f"Saved corpus '{self.corpus_name}'")
-        for text, text_metas in tqdm(self._text_pairs, desc="Processing text pairs", unit="metas"):
-            for text_meta in text_metas:
-                text_meta.save()
-
-            # Temporarily remove the corpus association to bypass constraints or trigger signals
-            # FIXME: this should not be needed.
-            corpus = text.corpus
-            text.corpus = None
-            text.save()
-            logging.info(f"Saved text '{text.title}'")
-
-            # Restore the corpus association
-            text.corpus = corpus
-            text.save()
-            logging.info(f"Re-saved text '{text.title}'")
-
-            for text_meta in text_metas:
-                text.text_meta.add(text_meta)
-            text.save()
-            logging.info(f"Re-Re-saved text '{text.title}'")
-            
-        for text, vis in tqdm(self._vises, desc="Saving visualisations", unit="visualisations"):
-            vis.save()
-            logging.info(f"Saved visualization '{vis.visualization_format_slug}'")
-            text.html_visualizations.add(vis)
-            text.save()
+
+        # bulk_create bypasses Model.save(), so fill in what Text.save() and
+        # HtmlVisualization.save() would have set.
+        now = datetime.datetime.today()
+        texts = []
+        text_metas = []
+        for text, metas in self._text_pairs:
+            text.created = now
+            text.modified = now
+            text.content_hash = content_hash(text.content)
+            text.copy_meta_columns(metas)
+            texts.append(text)
+            text_metas.extend(metas)
+        TextMeta.objects.bulk_create(text_metas)
+        Text.objects.bulk_create(texts)
+        TextMetaLink = Text.text_meta.through
+        TextMetaLink.objects.bulk_create(
+            [
+                TextMetaLink(text_id=text.id, textmeta_id=text_meta.id)
+                for text, metas in self._text_pairs
+                for text_meta in metas
+            ]
+        )
+        logging.info(f"Saved {len(texts)} texts and {len(text_metas)} pieces of metadata")
+        # Texts of other corpora may link to this one, and lost those links when it was replaced.
+        logging.info(f"Linked {Text.link_neighbours()} texts to their next and previous texts")
+        links_after = self._links_from_other_corpora()
+        relinked_corpora = sorted(
+            {corpus for text_id, (corpus, *_) in (links_before | links_after).items()
+             if links_before.get(text_id) != links_after.get(text_id)}
+        )
+        if relinked_corpora:
+            logging.info(f"Links of {', '.join(relinked_corpora)} into '{self.corpus_name}' changed")
+
+        # The frequencies of the corpus we replaced went with its texts and corpus row.
+        frequencies = TermFrequency.for_corpus(self._corpus, texts, self._term_counts)
+        TermFrequency.objects.bulk_create(frequencies, batch_size=FREQUENCY_BATCH_SIZE)
+        logging.info(f"Saved {len(frequencies)} term frequencies")
+
+        vises = [vis for _, vis in self._vises]
+        # All visualizations of a format normally share one config and stylesheet.
+        VisualizationStyle.save_all([vis.style for vis in vises if vis.style is not None])
+        HtmlVisualization.objects.bulk_create(vises)
+        VisualizationLink = Text.html_visualizations.through
+        VisualizationLink.objects.bulk_create(
+            [VisualizationLink(text_id=text.id, htmlvisualization_id=vis.id) for text, vis in self._vises]
+        )
+        logging.info(f"Saved {len(vises)} visualizations")
+
+        if not settings.LAZY_HTML_GENERATION:
+            if self._rendered is None:
+                self.render_visualizations()
+            # Another corpus may have rendered the same text and config in the meantime.
+            RenderedVisualization.objects.bulk_create(self._rendered, ignore_conflicts=True)
+            logging.info(f"Pre-rendered {len(self._rendered)} visualizations for '{self.corpus_name}'")
+        # Visualizations of the texts we replaced, then styles nothing uses anymore,
+        # then renders of texts or configs that are gone
+        HtmlVisualization.prune()
+        VisualizationStyle.prune()
+        RenderedVisualization.prune()
+        # Tells running processes to rebuild what they keep in memory (URN trie, ...), and
+        # invalidates the cached pages of this corpus and of those whose links into it changed.
+        generation.bump(self._corpus.slug, *relinked_corpora)
 
         return {
             "texts": len(self._text_pairs),
             "text_metas": sum(map(lambda x: len(x[1]), self._text_pairs)),
             "vises": len(self._vises),
-        }
\ No newline at end of file
+            "term_frequencies": len(frequencies),
+            "seconds": time.perf_counter() - started,
+        }
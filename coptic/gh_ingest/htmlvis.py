@@ -2,9 +2,11 @@
 `generate_visualization` consumes TreeTagger SGML text and renders it into HTML according to an ANNIS
 htmlvis config file."""
 
+import hashlib
 import re
+import threading
 from enum import Enum
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 class HtmlGenerationException(BaseException):
     def __init__(self, message):
@@ -36,7 +38,7 @@ class Directive:
         )
         self._type = triggering_condition_dict["type"]
         self._trigger_name = triggering_condition_dict.get("name", None)
-        self._trigger_val = triggering_condition_dict.get("val", None)
+        self._trigger_val = triggering_condition_dict.get("value", None)
 
         generated_element_dict = Directive.parse_generated_element(generated_element)
         self._generated_name = generated_element_dict.get("name", None)
@@ -77,6 +79,8 @@ class Directive:
                 raise HtmlGenerationException(
                     f"Malformed target element in config: {text}"
                 ) from e
+            if len(val) > 1 and val[0] == '"' and val[-1] == '"':
+                val = val[1:-1]
 
             if elt != "":
                 return {"type": TriggerTypes.ANN_AND_VALUE, "name": elt, "value": val}
@@ -199,24 +203,25 @@ class AnnDirective(Directive):
 class ValueDirective(Directive):
     """For a triggering condition like '="God"'"""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._triggered_attr_name = None
+    def triggered_attr_name(self, elt):
+        "The name of the first attr of elt with the trigger value, or None"
+        # there could in principle be multiple matches, but only apply the rule once at most
+        for name, value in elt.attrs.items():
+            if value == self._trigger_val:
+                return name
+        return None
 
     def applies(self, elt):
-        for name, value in elt.attrs:
-            if value == self._trigger_val:
-                # there could in principle be multiple matches, but only apply the rule once at most
-                self._triggered_attr_name = name
-                return True
-        return False
+        return self.triggered_attr_name(elt) is not None
 
     def apply_left(self, elt, text):
+        # Directives are shared through the parsed config cache, so work out the triggering
+        # attr here instead of remembering it from applies().
         if self._content_type == ContentTypes.VALUE:
-            content = elt.attrs.get(elt.name, "")
+            content = self._trigger_val
         elif self._content_type == ContentTypes.STRING:
-            content = self._content_value.replace("%%name%%", elt.name)
-            content = content.replace("%%value%%", elt.attrs.get(elt.name, ""))
+            content = self._content_value.replace("%%name%%", self.triggered_attr_name(elt) or elt.name)
+            content = content.replace("%%value%%", self._trigger_val)
         else:
             content = None
 
@@ -309,6 +314,50 @@ DIRECTIVE_MAP = {
 }
 
 
+class DirectiveTable(list):
+    """The directives of a config, in config order, plus hash indexes over the non-tok
+    directives so that an element only meets the directives that can fire on it:
+
+        by_name             AnnDirective, keyed by the element name
+        by_name_and_value   AnnAndValueDirective, keyed by (attr name, attr value)
+        by_value            ValueDirective, keyed by attr value
+
+    Each indexed directive is stored with its rank, its position in the order in which
+    `render_html` applies directives, so that lookups can be replayed in that order."""
+
+    def __init__(self, directives=()):
+        super().__init__(directives)
+        self.tok_directives = list(reversed([d for d in self if isinstance(d, TokDirective)]))
+        self.by_name = defaultdict(list)
+        self.by_name_and_value = defaultdict(list)
+        self.by_value = defaultdict(list)
+        other_directives = reversed([d for d in self if not isinstance(d, TokDirective)])
+        for rank, directive in enumerate(other_directives):
+            if isinstance(directive, AnnAndValueDirective):
+                key = (directive._trigger_name, directive._trigger_val)
+                self.by_name_and_value[key].append((rank, directive))
+            elif isinstance(directive, ValueDirective):
+                self.by_value[directive._trigger_val].append((rank, directive))
+            elif isinstance(directive, AnnDirective):
+                self.by_name[directive._trigger_name].append((rank, directive))
+            else:
+                raise HtmlGenerationException(f"Cannot index directive {directive}")
+
+    def matching(self, elt):
+        """All (rank, directive) pairs that apply to elt, each directive at most once."""
+        matches = list(self.by_name.get(elt.name, ()))
+        if self.by_name_and_value or self.by_value:
+            for name, value in elt.attrs.items():
+                matches.extend(self.by_name_and_value.get((name, value), ()))
+                for rank, directive in self.by_value.get(value, ()):
+                    # there could in principle be multiple matches, but only apply the rule once at most.
+                    # Directives are shared through the parsed config cache, so don't record on
+                    # them which attr triggered.
+                    if all(rank != r for r, _ in matches):
+                        matches.append((rank, directive))
+        return matches
+
+
 def parse_config(config_text):
     directives = []
     for line in config_text.strip().split("\n"):
@@ -324,7 +373,7 @@ def parse_config(config_text):
         ]
         directives.append(DIRECTIVE_MAP[trigger_type](*line))
 
-    return directives
+    return DirectiveTable(directives)
 
 CLOSE_TAG_REGEX = re.compile(r"^</([^\s<>/]*)")
 NAME_REGEX = re.compile(r"^<([^\s<>/]*)")
@@ -420,18 +469,17 @@ def render_html(toks, elts, directives, config_name):
     Args:
         toks (list of str): A list of token strings.
         elts (list): A list of elements.
-        directives (list): A list of directives to apply.
+        directives (list): A list of directives to apply, ideally the DirectiveTable
+            returned by `parse_config`.
 
     Returns:
         str: The rendered HTML string.
     """
-    # Separate token directives and other directives, reversing their order
-    tok_directives = list(
-        reversed([d for d in directives if isinstance(d, TokDirective)])
-    )
-    other_directives = list(
-        reversed([d for d in directives if not isinstance(d, TokDirective)])
-    )
+    if not isinstance(directives, DirectiveTable):
+        directives = DirectiveTable(directives)
+    # toks may be shared through the parsed text cache, so never render into it in place.
+    toks = list(toks)
+    tok_directives = directives.tok_directives
 
     # Apply token directives to tokens
     for directive in tok_directives:
@@ -451,15 +499,20 @@ def render_html(toks, elts, directives, config_name):
         for elts in elts_by_len:
             if len(elts) == 0:
                 continue
-            for directive in other_directives:
-                for elt in elts:
-                    if directive.applies(elt):
-                        toks[elt.open_line] = directive.apply_left(
-                            elt, toks[elt.open_line]
-                        )
-                        toks[elt.close_line] = directive.apply_right(
-                            elt, toks[elt.close_line]
-                        )
+            # Look up the directives that fire on each element, then apply them directive by
+            # directive, and element by element within a directive, as a full scan would.
+            applications = []
+            for i, elt in enumerate(elts):
+                for rank, directive in directives.matching(elt):
+                    applications.append((rank, i, directive, elt))
+            applications.sort(key=lambda application: application[:2])
+            for _, _, directive, elt in applications:
+                toks[elt.open_line] = directive.apply_left(
+                    elt, toks[elt.open_line]
+                )
+                toks[elt.close_line] = directive.apply_right(
+                    elt, toks[elt.close_line]
+                )
 
     # Join tokens with HTML comment to form the final HTML
     inner_html = "".join(toks)
@@ -476,10 +529,65 @@ def render_html(toks, elts, directives, config_name):
 
 DEBUG = False
 
+# Parsed configs are small and shared by every text of a corpus, parsed texts are large
+# but shared by the 3-5 visualization formats of a single text.
+CONFIG_CACHE_SIZE = 128
+TEXT_CACHE_SIZE = 8
+
+
+class LRUCache:
+    """A bounded mapping that evicts its least recently used entry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_config_cache = LRUCache(CONFIG_CACHE_SIZE)
+_text_cache = LRUCache(TEXT_CACHE_SIZE)
+
+
+def content_hash(text):
+    """A stable digest of a TT document or a config, used to address rendered output."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def get_parsed_config(config_text, config_hash=None):
+    """`parse_config`, memoized on the hash of the config."""
+    key = config_hash or content_hash(config_text)
+    return _config_cache.get_or_compute(key, lambda: parse_config(config_text))
+
+
+def get_parsed_text(text_content, text_hash=None):
+    """`parse_text`, memoized on the hash of the text. The result is shared: don't mutate it."""
+    key = text_hash or content_hash(text_content)
+    return _text_cache.get_or_compute(key, lambda: parse_text(text_content))
+
 
 def generate_visualization(text, config, config_name):
-    directives = parse_config(config)
-    toks, elts = parse_text(text.content)
+    directives = get_parsed_config(config)
+    toks, elts = get_parsed_text(text.content, getattr(text, "content_hash", None))
 
     return render_html(toks, elts, directives, config_name)
 
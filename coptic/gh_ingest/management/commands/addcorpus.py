@@ -1,3 +1,5 @@
+import resource
+import sys
 from django.core.management.base import BaseCommand, CommandError
 from gh_ingest.corpus_scraper import CorpusScraper
 from gh_ingest.scraper_exceptions import ScraperException
@@ -20,6 +22,19 @@ class Command(BaseCommand):
             type=str,
             help="Specify the local repository path when using --source local."
         )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help="Number of worker processes used to parse corpora. Transactions are still "
+                 "committed one at a time by the main process."
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help="Skip corpora whose directory has the same git tree id as when it was last ingested. "
+                 "Changes to CORPUS_MAP or to the scraper itself still need a full ingest."
+        )
 
     def handle(self, *args, **options):
         self.stdout.write("Using Local repo as the source of the corpus data.")
@@ -30,12 +45,24 @@ class Command(BaseCommand):
         # Initialize CorpusScraper once
         scraper = CorpusScraper()
 
-        try:
-            transactions = scraper.parse_corpora(options['corpus_dirnames'])
-        except (ScraperException, HtmlGenerationException) as e:
-            raise CommandError(e) from e
+        corpus_dirnames = options['corpus_dirnames']
+        if options['incremental']:
+            corpus_dirnames = scraper.filter_changed_corpora(corpus_dirnames)
+            skipped = len(options['corpus_dirnames']) - len(corpus_dirnames)
+            self.stdout.write(f"Skipping {skipped} unchanged corpora, ingesting {len(corpus_dirnames)}.")
+
+        if options['jobs'] > 1:
+            transactions = scraper.parse_corpora_in_parallel(corpus_dirnames, options['jobs'])
+        else:
+            transactions = scraper.iter_corpora(corpus_dirnames)
 
-        for transaction in transactions:
+        while True:
+            try:
+                transaction = next(transactions, None)
+            except (ScraperException, HtmlGenerationException) as e:
+                raise CommandError(e) from e
+            if transaction is None:
+                break
             self.stdout.write(f"Prepared transaction for corpus {transaction.corpus_name}. Executing...")
             try:
                 counts = transaction.execute()
@@ -47,4 +74,17 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f"Successfully ingested corpus '{transaction.corpus_name}' with"
                                                  f" {counts['texts']} texts,"
                                                  f" {counts['vises']} visualizations,"
-                                                 f" and {counts['text_metas']} pieces of metadata"))
+                                                 f" {counts['term_frequencies']} term frequencies"
+                                                 f" and {counts['text_metas']} pieces of metadata"
+                                                 f" in {counts['seconds']:.2f}s"))
+            # Let go of this corpus before the next one is parsed.
+            del transaction
+
+        self.stdout.write(f"Peak memory: {_peak_rss_mb(resource.RUSAGE_SELF):.0f} MB"
+                          f" (worker processes: {_peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB)")
+
+
+def _peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
@@ -1,5 +1,7 @@
+from contextlib import contextmanager
 from io import BytesIO
 import logging
+import mmap
 import os
 import subprocess
 import zipfile
@@ -23,7 +25,7 @@ class SingletonMeta(type):
         return cls._instances[cls]
 
 class Repository(metaclass=SingletonMeta):
-    def __init__(self):
+    def __init__(self, update=True):
         """
         Initializes the Repository instance.
 
@@ -31,6 +33,10 @@ class Repository(metaclass=SingletonMeta):
         ensures the local repository is available, and initializes various attributes
         related to the corpus and visualization formats.
 
+        Args:
+            update (bool): clone or pull the repository first. Ingest worker processes
+                pass False, the parent process has already updated it.
+
         Attributes:
             corpus_repo_name (str): The name of the corpus repository.
             corpus_repo_owner (str): The owner of the corpus repository.
@@ -43,9 +49,11 @@ class Repository(metaclass=SingletonMeta):
         self.corpus_repo_name = None
         self.corpus_repo_owner = None
         self.repo_path = None
+        self._reset_archives()
 
         self._init_config()
-        self.ensure_repo()
+        if update:
+            self.ensure_repo()
         # get all the directories where we have our corpora, ignoring
         # hidden directories and special ones.
         self._corpora = [
@@ -107,14 +115,70 @@ class Repository(metaclass=SingletonMeta):
             logging.warning("LOCAL_REPO_PATH not found in settings. Using default value ../../corpora.")
             self.repo_path = "../../corpora"
     
+    def __getstate__(self):
+        # Open archives can't cross a process boundary.
+        state = self.__dict__.copy()
+        for name in ("_archive_depth", "_archives", "_archive_members"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_archives()
+
+    def _reset_archives(self):
+        self._archive_depth = 0
+        # path -> (file, mmap, ZipFile)
+        self._archives = {}
+        # (path, filename) -> decoded member contents
+        self._archive_members = {}
+
+    @contextmanager
+    def open_archives(self):
+        """Within this block each zip archive is opened (memory-mapped) only once and the
+        contents of its members are memoized, so reading the same config for every text of
+        a corpus is a dictionary lookup. Blocks can be nested; everything is closed and
+        dropped when the outermost one exits."""
+        self._archive_depth += 1
+        try:
+            yield self
+        finally:
+            self._archive_depth -= 1
+            if self._archive_depth == 0:
+                self.close_archives()
+
+    def close_archives(self):
+        for f, mapped, zip_file in self._archives.values():
+            zip_file.close()
+            mapped.close()
+            f.close()
+        self._archives = {}
+        self._archive_members = {}
+
     def _get_zip_for_file(self, path):
-        with open(path, "rb") as f:
-            zip_data = BytesIO(f.read())
-        return zipfile.ZipFile(zip_data)
+        if self._archive_depth == 0:
+            with open(path, "rb") as f:
+                zip_data = BytesIO(f.read())
+            return zipfile.ZipFile(zip_data)
+        if path not in self._archives:
+            f = open(path, "rb")
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except:
+                f.close()
+                raise
+            self._archives[path] = (f, mapped, zipfile.ZipFile(mapped))
+        return self._archives[path][2]
 
     def _get_zip_file_contents(self, path, filename):
-        zip_file = self._get_zip_for_file(path)
-        return zip_file.open(filename).read().decode("utf-8")
+        if self._archive_depth == 0:
+            zip_file = self._get_zip_for_file(path)
+            return zip_file.open(filename).read().decode("utf-8")
+        key = (path, filename)
+        if key not in self._archive_members:
+            zip_file = self._get_zip_for_file(path)
+            self._archive_members[key] = zip_file.open(filename).read().decode("utf-8")
+        return self._archive_members[key]
 
     def _get_all_files_in_zip(self, zip_path):
         files_and_contents = []
@@ -141,12 +205,16 @@ class Repository(metaclass=SingletonMeta):
         corpus_path = os.path.join(self.repo_path, corpus_dirname)
         return [name for name in os.listdir(corpus_path) if os.path.isdir(os.path.join(corpus_path, name)) or name.endswith(".zip")]
     
+    def _get_texts(self, corpus, corpus_dirname):
+        text_tree_id = self._get_tree_id(corpus_dirname)
+        return self._read_texts(corpus, corpus_dirname, text_tree_id), text_tree_id
+
     # This is an expensive operation we also call from get_text()
-    # so caching it.
+    # so caching it. The git tree id of the corpus directory is part
+    # of the key, so a corpus that changed in the repository is read again.
     @cache_memoize(settings.CACHE_TTL)
-    def _get_texts(self, corpus, corpus_dirname):
+    def _read_texts(self, corpus, corpus_dirname, text_tree_id):
         corpus_path = os.path.join(self.repo_path, corpus_dirname)
-        text_tree_id = self._get_tree_id(corpus_dirname)
         
         texts = []
 
@@ -170,4 +238,4 @@ class Repository(metaclass=SingletonMeta):
         if len(texts) == 0:
             raise NoTexts(corpus_dirname, self.repo_path, tt_dir)
 
-        return dict(texts), text_tree_id
\ No newline at end of file
+        return dict(texts)
\ No newline at end of file
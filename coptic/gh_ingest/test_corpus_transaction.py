@@ -0,0 +1,135 @@
+import pickle
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from gh_ingest.corpus_transaction import CorpusTransaction
+from texts import generation
+from texts.models import (
+    Corpus,
+    Text,
+    TextMeta,
+    HtmlVisualization,
+    RenderedVisualization,
+    TermFrequency,
+    VisualizationStyle,
+)
+
+
+class TestCorpusTransaction(TestCase):
+    def _build_transaction(self, corpus_name="test.corpus"):
+        corpus = Corpus(
+            title="Test Corpus",
+            slug="test-corpus",
+            urn_code="urn:test:corpus",
+            annis_corpus_name=corpus_name,
+        )
+        tx = CorpusTransaction(corpus_name, corpus)
+        tx.add_vis_formats([HtmlVisualization.get_format_by_attribute("slug", "norm")])
+        for i in range(3):
+            text = Text(title=f"Text {i}", slug=f"text-{i}", corpus=corpus, content=f"<norm norm=\"w{i}\">\nw{i}\n</norm>")
+            metas = [TextMeta(name="author", value=f"Author {i}"), TextMeta(name="title", value=f"Text {i}")]
+            tx.add_text((text, metas))
+            tx.add_vis((text, HtmlVisualization(visualization_format_slug="norm", config="tok\tspan", css="span {}")))
+        return tx
+
+    def test_execute_saves_everything(self):
+        counts = self._build_transaction().execute()
+        self.assertEqual((counts["texts"], counts["text_metas"], counts["vises"]), (3, 6, 3))
+        self.assertIn("seconds", counts)
+
+        corpus = Corpus.objects.get(slug="test-corpus")
+        self.assertEqual(corpus.visualization_formats, "norm")
+        texts = list(Text.objects.filter(corpus=corpus).order_by("id"))
+        self.assertEqual([t.title for t in texts], ["Text 0", "Text 1", "Text 2"])
+        for i, text in enumerate(texts):
+            self.assertTrue(text.content_hash)
+            self.assertIsNotNone(text.created)
+            self.assertEqual(text.text_meta.get(name="author").value, f"Author {i}")
+            vis = text.html_visualizations.get()
+            self.assertTrue(vis.config_hash)
+            self.assertIn(f"w{i}", vis.html_live)
+        self.assertEqual(VisualizationStyle.objects.count(), 1)
+        self.assertEqual(counts["term_frequencies"], 6)
+        self.assertEqual(list(TermFrequency.ranked(corpus, "norm").values_list("term", "count")), [("w0", 1), ("w1", 1), ("w2", 1)])
+        self.assertEqual(list(TermFrequency.ranked(corpus, "norm", texts[1]).values_list("term", flat=True)), ["w1"])
+
+    def test_execute_replaces_existing_upload(self):
+        self._build_transaction().execute()
+        existing = Corpus.objects.get(slug="test-corpus")
+        tx = self._build_transaction()
+        to_delete = list(TextMeta.objects.filter(text__corpus=existing)) + [existing]
+        tx.add_objs_to_be_deleted(to_delete)
+        tx.execute()
+        self.assertEqual(Corpus.objects.count(), 1)
+        self.assertEqual(Text.objects.count(), 3)
+        self.assertEqual(TextMeta.objects.count(), 6)
+        self.assertEqual(HtmlVisualization.objects.count(), 3)
+        self.assertEqual(VisualizationStyle.objects.count(), 1)
+        self.assertEqual(TermFrequency.objects.count(), 6)
+
+    def test_execute_copies_meta_to_columns_and_links_neighbours(self):
+        tx = self._build_transaction()
+        for i, (_, metas) in enumerate(tx._text_pairs):
+            metas.append(TextMeta(name="document_cts_urn", value=f"urn:cts:copticLit:test.corpus.text{i}"))
+            metas.append(TextMeta(name="author", value="Second Author"))
+            if i < 2:
+                metas.append(TextMeta(name="next", value=f"urn:cts:copticLit:test.corpus.text{i + 1} "))
+            if i > 0:
+                metas.append(TextMeta(name="previous", value=f"urn:cts:copticLit:test.corpus.text{i - 1}"))
+        tx.execute()
+        texts = list(Text.objects.order_by("id"))
+        self.assertEqual(texts[1].document_cts_urn, "urn:cts:copticLit:test.corpus.text1")
+        self.assertEqual(texts[1].author, "Author 1, Second Author")
+        self.assertEqual((texts[0].previous_text, texts[0].next_text), (None, texts[1]))
+        self.assertEqual((texts[2].previous_text, texts[2].next_text), (texts[1], None))
+
+        response = self.client.get("/texts/test-corpus/text-1/norm/")
+        self.assertContains(response, 'href="/texts/test-corpus/text-0/norm"')
+        self.assertContains(response, 'href="/texts/test-corpus/text-2/norm"')
+
+    def test_execute_bumps_corpora_linking_into_it(self):
+        besa = Corpus.objects.create(title="Besa", slug="besa-letters", annis_corpus_name="besa.letters")
+        letter = Text.objects.create(corpus=besa, slug="letter", title="Letter")
+        letter.text_meta.add(TextMeta.objects.create(name="next", value="urn:cts:copticLit:test.corpus.text0"))
+        tx = self._build_transaction()
+        tx._text_pairs[0][1].append(TextMeta(name="document_cts_urn", value="urn:cts:copticLit:test.corpus.text0"))
+        tx.execute()
+        letter.refresh_from_db()
+        self.assertEqual(letter.next_text.slug, "text-0")
+        self.assertEqual(generation.current("besa-letters"), generation.current())
+        # Ingesting it again without changes to the links leaves the other corpus alone
+        existing = Corpus.objects.get(slug="test-corpus")
+        tx = self._build_transaction()
+        tx._text_pairs[0][1].append(TextMeta(name="document_cts_urn", value="urn:cts:copticLit:test.corpus.text0"))
+        tx.add_objs_to_be_deleted(list(TextMeta.objects.filter(text__corpus=existing)) + [existing])
+        tx.execute()
+        self.assertLess(generation.current("besa-letters"), generation.current())
+
+    def test_transaction_survives_pickling(self):
+        # Parallel ingest sends transactions back from worker processes.
+        tx = pickle.loads(pickle.dumps(self._build_transaction()))
+        counts = tx.execute()
+        self.assertEqual(counts["texts"], 3)
+        self.assertEqual(Text.objects.filter(corpus__slug="test-corpus").count(), 3)
+
+    @override_settings(LAZY_HTML_GENERATION=False)
+    def test_execute_saves_visualizations_rendered_in_the_worker(self):
+        tx = self._build_transaction()
+        tx.render_visualizations()
+        tx = pickle.loads(pickle.dumps(tx))
+        with patch("texts.models.generate_visualization") as mock_generate:
+            tx.execute()
+        mock_generate.assert_not_called()
+        self.assertEqual(RenderedVisualization.objects.count(), 3)
+        text = Text.objects.get(slug="text-1")
+        self.assertIn("w1", RenderedVisualization.lookup(text, text.html_visualizations.get()))
+
+    def test_execute_saves_terms_counted_while_parsing(self):
+        tx = self._build_transaction()
+        tx.count_terms()
+        tx = pickle.loads(pickle.dumps(tx))
+        with patch("texts.models.count_terms") as mock_count_terms:
+            counts = tx.execute()
+        mock_count_terms.assert_not_called()
+        self.assertEqual(counts["term_frequencies"], 6)
+        text = Text.objects.get(slug="text-2")
+        self.assertEqual(list(TermFrequency.ranked(text.corpus, "norm", text).values_list("term", "count")), [("w2", 1)])
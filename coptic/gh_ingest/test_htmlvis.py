@@ -1,4 +1,6 @@
+import os
 import unittest
+from collections import defaultdict
 
 from gh_ingest.htmlvis import (
     generate_visualization,
@@ -9,8 +11,12 @@ from gh_ingest.htmlvis import (
     ValueDirective,
     AnnAndValueDirective,
     SgmlElement,
+    DirectiveTable,
     parse_config,
     parse_text,
+    get_parsed_config,
+    get_parsed_text,
+    LRUCache,
     render_html,
     TriggerTypes,
     ContentTypes,
@@ -34,6 +40,87 @@ class TestHtmlVis(unittest.TestCase):
         self.assertIsInstance(directives[0], TokDirective)
         self.assertIsInstance(directives[1], AnnDirective)
 
+    def test_parse_config_indexes_directives(self):
+        config_text = 'tok\tspan\nnorm\tb\nlemma\tNULL\t"x"\nnorm\ti'
+        directives = parse_config(config_text)
+        self.assertIsInstance(directives, DirectiveTable)
+        self.assertEqual(len(directives.tok_directives), 1)
+        self.assertEqual(sorted(directives.by_name), ["lemma", "norm"])
+        # ranks follow the reversed config order in which render_html applies directives
+        self.assertEqual([rank for rank, _ in directives.by_name["norm"]], [0, 2])
+        self.assertEqual(directives.matching(SgmlElement("pos", [("pos", "N")])), [])
+
+    def test_matching_leaves_shared_directives_alone(self):
+        directive = ValueDirective('="ϭⲟⲗ"', "b")
+        directive._trigger_val = "ϭⲟⲗ"
+        directives = DirectiveTable([directive])
+        state = dict(vars(directive))
+        self.assertEqual(directives.matching(SgmlElement("norm", [("norm", "ϭⲟⲗ")])), [(0, directive)])
+        self.assertEqual(vars(directive), state)
+
+    def test_render_html_with_dispatch_matches_full_scan(self):
+        base_path = os.path.join(os.path.dirname(__file__), "docs", "example")
+        with open(os.path.join(base_path, "pilate.1643.27-28.tt"), encoding="utf-8") as f:
+            text = f.read()
+        with open(os.path.join(base_path, "ExtData", "analytic.config"), encoding="utf-8") as f:
+            directives = parse_config(f.read())
+
+        toks, elts = parse_text(text)
+        expected = list(toks)
+        for directive in directives.tok_directives:
+            expected = [directive.apply_right(tok, directive.apply_left(tok, tok)) for tok in expected]
+        if not directives.tok_directives:
+            expected = [""] * len(toks)
+        elts_by_len = defaultdict(list)
+        for elt in elts:
+            elts_by_len[len(elt)].append(elt)
+        other_directives = list(reversed([d for d in directives if not isinstance(d, TokDirective)]))
+        for length in sorted(elts_by_len):
+            for directive in other_directives:
+                for elt in elts_by_len[length]:
+                    if directive.applies(elt):
+                        expected[elt.open_line] = directive.apply_left(elt, expected[elt.open_line])
+                        expected[elt.close_line] = directive.apply_right(elt, expected[elt.close_line])
+
+        output = render_html(toks, elts, directives, "analytic")
+        self.assertEqual(output, '<div class="htmlvis analytic">' + "".join(expected) + "</div>")
+
+    def test_value_triggers(self):
+        config_text = 'tok\tspan\n="ϭⲟⲗ"\tb:title; style="hit"\t"%%name%%=%%value%%"\nnorm="ⲉⲛⲧ"\ti\tvalue'
+        directives = get_parsed_config(config_text)
+        self.assertEqual(list(directives.by_value), ["ϭⲟⲗ"])
+        self.assertEqual(list(directives.by_name_and_value), [("norm", "ⲉⲛⲧ")])
+        value_directive = directives.by_value["ϭⲟⲗ"][0][1]
+        state = dict(vars(value_directive))
+        toks, elts = parse_text('<norm norm="ϭⲟⲗ">\nϭⲟⲗ\n</norm>\n<norm norm="ⲉⲛⲧ">\nⲉⲛⲧ\n</norm>')
+        self.assertTrue(value_directive.applies(elts[0]))
+        self.assertFalse(value_directive.applies(elts[1]))
+        self.assertEqual(
+            render_html(toks, elts, directives, "norm"),
+            '<div class="htmlvis verses"><b class="hit" title="norm=ϭⲟⲗ">ϭⲟⲗ</span></b><i>ⲉⲛⲧⲉⲛⲧ</span></i></div>',
+        )
+        # the directive is shared through the parsed config cache, so rendering must not touch it
+        self.assertEqual(vars(value_directive), state)
+
+    def test_parsed_config_and_text_are_shared(self):
+        config_text = 'tok\tspan\nlemma\tb\tvalue'
+        text = '<norm norm="ϭⲟⲗ">\nϭⲟⲗ\n</norm>'
+        self.assertIs(get_parsed_config(config_text), get_parsed_config(config_text))
+        toks, elts = get_parsed_text(text)
+        self.assertIs(get_parsed_text(text)[1], elts)
+        render_html(toks, elts, get_parsed_config(config_text), "norm")
+        # rendering must not leak into the cached tokens
+        self.assertEqual(get_parsed_text(text)[0], ["ϭⲟⲗ"])
+
+    def test_lru_cache_is_bounded(self):
+        cache = LRUCache(2)
+        for key in "abc":
+            cache.get_or_compute(key, lambda: key.upper())
+        cache.get_or_compute("b", lambda: "unused")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_compute("a", lambda: "recomputed"), "recomputed")
+        self.assertEqual(cache.get_or_compute("b", lambda: "unused"), "B")
+
     def test_parse_text(self):
         text = """<meta annotation="Author" language="Coptic">
 <pb_xml_id pb_xml_id="XL93">
@@ -1,12 +1,20 @@
+import os
+import pickle
+import tempfile
 import unittest
+import weakref
+import zipfile
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
 from django.conf import settings
 from django.test import override_settings, TestCase
 from gh_ingest.corpus_scraper import (
-    CorpusScraper
+    CorpusScraper,
+    _parse_corpus_in_worker,
 )
 from gh_ingest.repository import Repository
-from gh_ingest.scraper_exceptions import TTDirMissing, EmptyCorpus
+from gh_ingest.scraper_exceptions import ScraperException, TTDirMissing, EmptyCorpus
+from texts.models import Corpus, Text
 
 
 class TestCorpusScraper(unittest.TestCase):
@@ -37,6 +45,131 @@ class TestCorpusScraper(unittest.TestCase):
         # Check the results
         self.assertEqual(result, ('pseudo.timothy_TEI', 'pseudo.timothy_ANNIS', 'pseudo.timothy_PAULA'))
 
+    @patch.object(CorpusScraper, "parse_corpus")
+    def test_worker_errors_can_be_unpickled(self, mock_parse_corpus):
+        mock_parse_corpus.side_effect = TTDirMissing("besa-letters", "", "")
+        with self.assertRaises(ScraperException) as cm:
+            _parse_corpus_in_worker("besa-letters")
+        error = pickle.loads(pickle.dumps(cm.exception))
+        self.assertIn("besa-letters", str(error))
+
+    @patch.object(CorpusScraper, "parse_corpus")
+    def test_iter_corpora_parses_on_demand(self, mock_parse_corpus):
+        mock_parse_corpus.side_effect = lambda d: f"tx-{d}"
+        scraper = CorpusScraper()
+        transactions = scraper.iter_corpora(["besa-letters", "pseudo-timothy"])
+        self.assertEqual(next(transactions), "tx-besa-letters")
+        mock_parse_corpus.assert_called_once_with("besa-letters")
+        self.assertIsNone(scraper._current_transaction)
+        self.assertEqual(list(transactions), ["tx-pseudo-timothy"])
+
+    @patch.object(CorpusScraper, "parse_corpus")
+    def test_iter_corpora_holds_one_corpus_at_a_time(self, mock_parse_corpus):
+        class Transaction:
+            pass
+
+        previous = []
+
+        def parse_corpus(corpus_dirname):
+            # The transaction yielded before has been dropped by the caller by now
+            self.assertTrue(all(ref() is None for ref in previous))
+            transaction = Transaction()
+            previous.append(weakref.ref(transaction))
+            return transaction
+
+        mock_parse_corpus.side_effect = parse_corpus
+        for transaction in CorpusScraper().iter_corpora(["besa-letters", "pseudo-timothy", "shenoute-fox"]):
+            del transaction
+        self.assertEqual(mock_parse_corpus.call_count, 3)
+
+
+    @patch("gh_ingest.corpus_scraper._corpus_size", return_value=0)
+    @patch("gh_ingest.corpus_scraper.Repository")
+    def test_failed_parse_cancels_the_queued_corpora(self, mock_repository, mock_corpus_size):
+        shutdowns = []
+
+        class Executor:
+            def __init__(self, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                self.shutdown()
+
+            def submit(self, fn, corpus_dirname):
+                future = Future()
+                if corpus_dirname == "besa-letters":
+                    future.set_exception(ScraperException("besa-letters is broken"))
+                return future
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                shutdowns.append(cancel_futures)
+
+        with patch("gh_ingest.corpus_scraper.ProcessPoolExecutor", Executor):
+            transactions = CorpusScraper().parse_corpora_in_parallel(["besa-letters", "pseudo-timothy"], jobs=1)
+            with self.assertRaises(ScraperException):
+                next(transactions)
+        self.assertEqual(shutdowns, [True, False])
+
+
+class TestRepositoryArchives(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.zip_path = os.path.join(tmp.name, "besa.letters_ANNIS.zip")
+        with zipfile.ZipFile(self.zip_path, "w") as zf:
+            zf.writestr("ExtData/verses.config", "tok\tspan")
+        # Skip __init__, which needs a checked out corpora repository
+        self.repo = Repository.__new__(Repository)
+        self.repo._reset_archives()
+
+    def test_archive_is_opened_once_per_scope(self):
+        with self.repo.open_archives():
+            with patch("gh_ingest.repository.zipfile.ZipFile", wraps=zipfile.ZipFile) as mock_zipfile:
+                first = self.repo._get_zip_file_contents(self.zip_path, "ExtData/verses.config")
+                with self.repo.open_archives():
+                    second = self.repo._get_zip_file_contents(self.zip_path, "ExtData/verses.config")
+            self.assertEqual(first, "tok\tspan")
+            self.assertIs(first, second)
+            self.assertEqual(mock_zipfile.call_count, 1)
+            self.assertEqual(len(self.repo._archives), 1)
+        self.assertEqual(self.repo._archives, {})
+        self.assertEqual(self.repo._archive_members, {})
+
+    def test_repository_pickles_with_open_archives(self):
+        self.repo.repo_path = "/tmp"
+        with self.repo.open_archives():
+            self.repo._get_zip_file_contents(self.zip_path, "ExtData/verses.config")
+            copy = pickle.loads(pickle.dumps(self.repo))
+        self.assertEqual(copy.repo_path, "/tmp")
+        self.assertEqual(copy._archives, {})
+
+
+class TestIncrementalIngest(TestCase):
+    def setUp(self):
+        corpus = Corpus.objects.create(title="Besa", slug="besa", annis_corpus_name="besa.letters")
+        for i in range(2):
+            Text.objects.create(corpus=corpus, title=f"Text {i}", slug=f"text-{i}", tt_dir="besa-letters", tt_dir_tree_id="abc")
+
+    @patch("gh_ingest.corpus_scraper.Repository")
+    def test_unchanged_corpus_is_skipped(self, mock_repository):
+        mock_repository.return_value._get_tree_id.side_effect = lambda d: "abc" if d == "besa-letters" else "def"
+        scraper = CorpusScraper()
+        self.assertTrue(scraper.corpus_is_unchanged("besa-letters"))
+        self.assertEqual(scraper.filter_changed_corpora(["besa-letters", "pseudo-timothy"]), ["pseudo-timothy"])
+
+    @patch("gh_ingest.corpus_scraper.Repository")
+    def test_moved_tree_is_reingested(self, mock_repository):
+        mock_repository.return_value._get_tree_id.return_value = "new"
+        self.assertFalse(CorpusScraper().corpus_is_unchanged("besa-letters"))
+
+    @patch("gh_ingest.corpus_scraper.Repository")
+    def test_missing_tree_is_reingested(self, mock_repository):
+        mock_repository.return_value._get_tree_id.side_effect = TTDirMissing("besa-letters", "", "")
+        self.assertFalse(CorpusScraper().corpus_is_unchanged("besa-letters"))
+
 
 @override_settings(LOCAL_REPO_PATH="../../corpora")
 class TestCorpusScraperWithFiles(TestCase):
@@ -25,10 +25,14 @@ document.addEventListener("DOMContentLoaded", function() {
 
 document.onreadystatechange = function () {
     if (document.readyState == "interactive") {
-        // Get search term from URL hash if present
-        const text_hash = document.location.hash.split("#text=") || [];
-        if (text_hash.length > 1) {
-            const searchTerm = decodeURIComponent(text_hash[1]);
+        // Get search term, and the chapter of the matching passage, from the URL hash if present:
+        // #text=<term> or #chapter=<n>&text=<term>
+        const hash = new URLSearchParams(document.location.hash.substring(1));
+        const chapter = hash.get("chapter");
+        const chapterElement = chapter ? document.querySelector(`.chapter[chapter="${CSS.escape(chapter)}"]`) : null;
+        const highlights = [];
+        if (hash.get("text")) {
+            const searchTerm = hash.get("text");
             console.log("Searching for:", searchTerm);
 
             // Create a text node of the search term to escape special characters
@@ -71,14 +75,17 @@ document.onreadystatechange = function () {
                     parent.insertBefore(span, node);
                     parent.insertBefore(afterNode, node);
                     parent.removeChild(node);
-
-                    // Scroll the first match into view
-                    span.scrollIntoView({
-                        behavior: 'smooth',
-                        block: 'center'
-                    });
+                    highlights.push(span);
                 }
             });
         }
+        // Scroll the first match of the linked chapter into view, or the chapter itself
+        const target = highlights.find(span => !chapterElement || chapterElement.contains(span)) || chapterElement;
+        if (target) {
+            target.scrollIntoView({
+                behavior: 'smooth',
+                block: target === chapterElement ? 'start' : 'center'
+            });
+        }
     }
 };
\ No newline at end of file
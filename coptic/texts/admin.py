@@ -1,5 +1,5 @@
 from django.contrib import admin
-from texts.models import Corpus, Text, TextMeta, HtmlVisualization
+from texts.models import Corpus, Text, TextMeta, HtmlVisualization, TermFrequency, VisualizationStyle
 
 class TextInline(admin.TabularInline):
     model = Text
@@ -27,3 +27,13 @@ class TextMetaAdmin(admin.ModelAdmin):
 @admin.register(HtmlVisualization)
 class HtmlVisualizationAdmin(admin.ModelAdmin):
     list_display = [field.name for field in HtmlVisualization._meta.fields]
+
+@admin.register(VisualizationStyle)
+class VisualizationStyleAdmin(admin.ModelAdmin):
+    list_display = ["hash", "config_hash"]
+
+@admin.register(TermFrequency)
+class TermFrequencyAdmin(admin.ModelAdmin):
+    list_display = [field.name for field in TermFrequency._meta.fields]
+    list_filter = ('corpus', 'layer')
+    search_fields = ('term',)
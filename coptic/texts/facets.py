@@ -0,0 +1,103 @@
+"""The facet catalog: for every special meta (settings.METAS), its values with their display
+names and text counts, and the corpora with texts of each value.
+
+The navigation, the search form and the index pages all read it. It is built in two
+queries once per data generation (see texts.generation), stored in the cache under that
+generation for the other processes, and kept in the memory of each process.
+"""
+import hashlib
+import re
+from collections import OrderedDict, defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+from texts.generation import PerGeneration
+from texts.models import HTML_TAG_REGEX, Corpus, Text
+
+FacetValue = namedtuple("FacetValue", "value display_name count")
+
+CORPUS_FIELDS = ("id", "slug", "title", "author", "urn_code", "annis_corpus_name")
+
+
+class FacetCatalog:
+    def __init__(self, rows, corpora):
+        """rows are (meta name, value, corpus id, number of texts) of every special meta,
+        corpora are dicts of CORPUS_FIELDS."""
+        corpora = {corpus["id"]: corpus for corpus in corpora}
+        titles = {corpus["annis_corpus_name"]: corpus["title"] for corpus in corpora.values()}
+        counts = defaultdict(lambda: defaultdict(int))
+        corpus_ids = defaultdict(lambda: defaultdict(set))
+        for name, value, corpus_id, texts in rows:
+            counts[name][value] += texts
+            if corpus_id in corpora:
+                corpus_ids[name][value].add(corpus_id)
+        self._values = {}
+        self._corpora = {}
+        for name, value_counts in counts.items():
+            self._values[name] = [
+                FacetValue(value, self._display_name(name, value, titles), count)
+                for value, count in sorted(value_counts.items())
+            ]
+            self._corpora[name] = OrderedDict(
+                (value, sorted((corpora[i] for i in corpus_ids[name][value]), key=lambda corpus: corpus["title"]))
+                for value in sorted(corpus_ids[name])
+            )
+        # Changes only when a facet value or its display name does, unlike the generation
+        self.fingerprint = hashlib.sha1(
+            repr(sorted((name, [facet[:2] for facet in values]) for name, values in self._values.items())).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _display_name(name, value, corpus_titles):
+        if name == "corpus":
+            value = corpus_titles.get(value, value)
+        return re.sub(HTML_TAG_REGEX, "", value)
+
+    @classmethod
+    def from_database(cls):
+        names = [meta["name"].lower() for meta in settings.METAS.values()]
+        rows = (
+            Text.text_meta.through.objects.annotate(name=Lower("textmeta__name"))
+            .filter(name__in=names)
+            .values_list("name", "textmeta__value", "text__corpus_id")
+            .annotate(texts=Count("text_id", distinct=True))
+            .order_by()
+        )
+        return cls(list(rows), list(Corpus.objects.values(*CORPUS_FIELDS)))
+
+    def values(self, name):
+        """The FacetValues of a meta, by value."""
+        return self._values.get(name.lower(), [])
+
+    def choices(self, name):
+        """(value, display name) pairs of a meta for a form field."""
+        return [(facet.value, facet.display_name) for facet in self.values(name)]
+
+    def value_corpus_pairs(self, name):
+        """{value: [corpus dicts, by title]} of a meta, by value."""
+        return self._corpora.get(name.lower(), OrderedDict())
+
+
+def _build(generation):
+    key = f"facet-catalog-{generation}"
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = FacetCatalog.from_database()
+        cache.set(key, catalog, timeout=None)
+    return catalog
+
+
+_catalog = PerGeneration(_build)
+
+
+def get_catalog():
+    """The facet catalog of the current generation."""
+    return _catalog.get()
+
+
+def reset():
+    """Forgets the catalog of this process, e.g. after changing metadata in tests."""
+    _catalog.reset()
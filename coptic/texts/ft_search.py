@@ -1,8 +1,188 @@
+import hashlib
+import json
+import threading
+import time
+
 import meilisearch
 from bs4 import BeautifulSoup
 import re
 
 from django.conf import settings
+from django.core.cache import cache
+
+# The settings of the texts index. Run `manage.py sync_search_settings` after changing them.
+INDEX_SETTINGS = {
+    "rankingRules": [
+        "exactness",
+        "words",
+        "typo",
+        "proximity",
+        "attribute",
+        "sort",
+    ],
+    "distinctAttribute": "slug",
+    "filterableAttributes": [
+        "text_meta.corpus",
+        "text_meta.author",
+        "text_meta.people",
+        "text_meta.places",
+        "text_meta.msName",
+        "text_meta.annotation",
+        "text_meta.translation",
+        "text_meta.arabic_translation",
+        # Not facets: they let the passages of a text be deleted by filter
+        "corpus_slug",
+        "slug",
+    ],
+    "typoTolerance": {
+        "minWordSizeForTypos": {
+            "oneTypo": 8,
+            "twoTypos": 20,
+        },
+        "disableOnAttributes": [
+            #'text.lemmatized',
+            #'text.normalized',
+            #'text.normalized_group',
+        ],
+    },
+    "searchableAttributes": [
+        "title",
+        "corpus",
+        "author",
+        "text.lemmatized",
+        "text.normalized",
+        "text.normalized_group",
+        "text.english_translation",
+        "text.arabic_translation",
+        "text_meta.author",
+        "text_meta.annotation",
+        "text_meta.translation",
+        "text_meta.people",
+        "text_meta.places",
+        "text_meta.msName",
+        "text_meta.annotation",
+        "text_meta.translation",
+        "text_meta.collection",
+        "text_meta.country",
+        "text_meta.language",
+        "text_meta.note",
+        "text_meta.objectType",
+        "text_meta.origDate",
+        "text_meta.origDate_notAfter",
+        "text_meta.origPlace",
+        "text.meta.repository",
+        "text.meta.witness",
+    ],
+    "displayedAttributes": [
+        "title",
+        "corpus",
+        "author",
+        "slug",
+        "corpus_slug",
+        "chapter",
+        "text.chapter",
+        "text.lemmatized",
+        "text.normalized",
+        "text.normalized_group",
+        "text.english_translation",
+        "text.arabic_translation",
+        "text_meta.author",
+        "text_meta.document_cts_urn",
+        "text_meta.annotation",
+        "text_meta.translation",
+        "text_meta.people",
+        "text_meta.places",
+        "text_meta.msName",
+        "text_meta.annotation",
+        "text_meta.translation",
+        "text_meta.collection",
+        "text_meta.country",
+        "text_meta.language",
+        "text_meta.note",
+        "text_meta.objectType",
+        "text_meta.origDate",
+        "text_meta.origDate_notAfter",
+        "text_meta.origPlace",
+        "text_meta.repository",
+        "text_meta.witness",
+    ],
+    #'sortableAttributes': [
+    #    'title',
+    #    'release_date'
+    # ],
+    #'stopWords': [
+    #    'the',
+    #    'a',
+    #    'an'
+    # ],
+    #'synonyms': {
+    #    'wolverine': ['xmen', 'logan'],
+    #    'logan': ['wolverine']
+    # },
+    #'typoTolerance': {
+    #    'minWordSizeForTypos': {
+    #        'oneTypo': 8,
+    #        'twoTypos': 10
+    #    },
+    #    'disableOnAttributes': ['title']
+    # },
+    "pagination": {"maxTotalHits": 5000},
+    "faceting": {"maxValuesPerFacet": 400},
+    "searchCutoffMs": 400,
+}
+
+TEXT_LAYOUT = "text"
+PASSAGE_LAYOUT = "passage"
+# The primary key of the documents of each layout. Passages of a text share its slug,
+# which is also the distinctAttribute, so a search returns each text once.
+PRIMARY_KEYS = {TEXT_LAYOUT: "slug", PASSAGE_LAYOUT: "id"}
+
+
+MEILISEARCH_BACKEND = "meilisearch"
+# SQLite FTS5 tables next to the app, for deployments (and CI) without a Meilisearch server
+SQLITE_BACKEND = "sqlite"
+
+
+def document_layout():
+    return settings.SEARCH_CONFIG.get("DOCUMENT_LAYOUT", TEXT_LAYOUT)
+
+
+# Changes whenever INDEX_SETTINGS does. The version last pushed to an index is kept in
+# the cache, so syncing an index that is already up to date is free.
+SETTINGS_VERSION = hashlib.sha1(json.dumps(INDEX_SETTINGS, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Settings changes can make Meilisearch rebuild the whole index.
+SETTINGS_TASK_TIMEOUT_MS = 10 * 60 * 1000
+
+# How long we trust a health check before asking the server again.
+AVAILABILITY_CHECK_INTERVAL = 30
+
+_client = None
+_client_lock = threading.Lock()
+_availability = {"available": False, "checked_at": None}
+
+
+def get_client():
+    """The Meilisearch client of this process, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = meilisearch.Client(
+                settings.SEARCH_CONFIG["MEILI_HTTP_ADDR"],
+                settings.SEARCH_CONFIG["MEILI_MASTER_KEY"],
+            )
+        return _client
+
+
+def search_available():
+    checked_at = _availability["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at > AVAILABILITY_CHECK_INTERVAL:
+        try:
+            _availability["available"] = get_client().is_healthy()
+        except Exception:
+            _availability["available"] = False
+        _availability["checked_at"] = time.monotonic()
+    return _availability["available"]
 
 
 class Search:
@@ -11,10 +191,13 @@ class Search:
 
     search_available (bool): Indicates if the search functionality is available.
 
+    Search() returns a texts.fts_sqlite.SqliteSearch instead when SEARCH_CONFIG["BACKEND"] is "sqlite".
+
     Methods:
-    __init__():
-        Initializes the MeiliSearch client and creates an index named "texts" with a primary key of 'id'.
-        Sets up ranking rules if the index does not exist.
+    __init__(index=None):
+        Uses the MeiliSearch client shared by the process. Makes no requests.
+    sync_settings(force=False):
+        Creates the index if it doesn't exist and applies INDEX_SETTINGS, if they changed since the last sync.
     index_text(texts):
         Adds documents to the MeiliSearch index. Takes a list of text objects where each object contains at least an 'id' and 'text' field.
     search(keyword):
@@ -35,147 +218,102 @@ class Search:
 
     """
 
-    def __init__(self):
-        self.client = meilisearch.Client(
-            settings.SEARCH_CONFIG["MEILI_HTTP_ADDR"],
-            settings.SEARCH_CONFIG["MEILI_MASTER_KEY"],
-        )
-        self.index = settings.SEARCH_CONFIG["MEILI_COPTIC_INDEX"]
-        # Create the index if it doesn't exist
-        try:
-            existing_indexes = self.client.get_indexes()["results"]
-            index_exists = any(idx.uid == self.index for idx in existing_indexes)
-            if not index_exists:
-                self.client.create_index(self.index, {"primaryKey": "slug"})
-                # FIXME: Update ranking rules
-            self.client.index(self.index).update_settings(
-                {
-                    "rankingRules": [
-                        "exactness",
-                        "words",
-                        "typo",
-                        "proximity",
-                        "attribute",
-                        "sort",
-                    ],
-                    "distinctAttribute": "slug",
-                    "filterableAttributes": [
-                        "text_meta.corpus",
-                        "text_meta.author",
-                        "text_meta.people",
-                        "text_meta.places",
-                        "text_meta.msName",
-                        "text_meta.annotation",
-                        "text_meta.translation",
-                        "text_meta.arabic_translation",
-                    ],
-                    "typoTolerance": {
-                        "minWordSizeForTypos": {
-                            "oneTypo": 8,
-                            "twoTypos": 20,
-                        },
-                        "disableOnAttributes": [
-                            #'text.lemmatized',
-                            #'text.normalized',
-                            #'text.normalized_group',
-                        ],
-                    },
-                    "searchableAttributes": [
-                        "title",
-                        "corpus",
-                        "author",
-                        "text.lemmatized",
-                        "text.normalized",
-                        "text.normalized_group",
-                        "text.english_translation",
-                        "text.arabic_translation",
-                        "text_meta.author",
-                        "text_meta.annotation",
-                        "text_meta.translation",
-                        "text_meta.people",
-                        "text_meta.places",
-                        "text_meta.msName",
-                        "text_meta.annotation",
-                        "text_meta.translation",
-                        "text_meta.collection",
-                        "text_meta.country",
-                        "text_meta.language",
-                        "text_meta.note",
-                        "text_meta.objectType",
-                        "text_meta.origDate",
-                        "text_meta.origDate_notAfter",
-                        "text_meta.origPlace",
-                        "text.meta.repository",
-                        "text.meta.witness",
-                    ],
-                    "displayedAttributes": [
-                        "title",
-                        "corpus",
-                        "author",
-                        "slug",
-                        "corpus_slug",
-                        "text.lemmatized",
-                        "text.normalized",
-                        "text.normalized_group",
-                        "text.english_translation",
-                        "text.arabic_translation",
-                        "text_meta.author",
-                        "text_meta.document_cts_urn",
-                        "text_meta.annotation",
-                        "text_meta.translation",
-                        "text_meta.people",
-                        "text_meta.places",
-                        "text_meta.msName",
-                        "text_meta.annotation",
-                        "text_meta.translation",
-                        "text_meta.collection",
-                        "text_meta.country",
-                        "text_meta.language",
-                        "text_meta.note",
-                        "text_meta.objectType",
-                        "text_meta.origDate",
-                        "text_meta.origDate_notAfter",
-                        "text_meta.origPlace",
-                        "text_meta.repository",
-                        "text_meta.witness",
-                    ],
-                    #'sortableAttributes': [
-                    #    'title',
-                    #    'release_date'
-                    # ],
-                    #'stopWords': [
-                    #    'the',
-                    #    'a',
-                    #    'an'
-                    # ],
-                    #'synonyms': {
-                    #    'wolverine': ['xmen', 'logan'],
-                    #    'logan': ['wolverine']
-                    # },
-                    #'typoTolerance': {
-                    #    'minWordSizeForTypos': {
-                    #        'oneTypo': 8,
-                    #        'twoTypos': 10
-                    #    },
-                    #    'disableOnAttributes': ['title']
-                    # },
-                    "pagination": {"maxTotalHits": 5000},
-                    "faceting": {"maxValuesPerFacet": 400},
-                    "searchCutoffMs": 400,
-                }
-            )
-            self.search_available = True
-        except:
-            self.search_available = False
-            pass
+    def __new__(cls, index=None):
+        # Search() gives the implementation of the configured SEARCH_CONFIG["BACKEND"]
+        if cls is Search and settings.SEARCH_CONFIG.get("BACKEND", MEILISEARCH_BACKEND) == SQLITE_BACKEND:
+            from texts.fts_sqlite import SqliteSearch
+
+            cls = SqliteSearch
+        return super().__new__(cls)
+
+    def __init__(self, index=None):
+        self.client = get_client()
+        self.index = index or settings.SEARCH_CONFIG["MEILI_COPTIC_INDEX"]
+
+    @property
+    def search_available(self):
+        return search_available()
+
+    @property
+    def primary_key(self):
+        return PRIMARY_KEYS[document_layout()]
+
+    def _settings_version_key(self):
+        return f"search_settings_version:{self.index}"
+
+    def sync_settings(self, force=False):
+        """Creates the index if needed and pushes INDEX_SETTINGS to it, unless it already has
+        this SETTINGS_VERSION. Waits for Meilisearch to apply them. Returns the finished
+        settings task, or None if the index was up to date."""
+        if not force and cache.get(self._settings_version_key()) == SETTINGS_VERSION:
+            return None
+        existing_indexes = self.client.get_indexes()["results"]
+        if not any(idx.uid == self.index for idx in existing_indexes):
+            self.client.create_index(self.index, {"primaryKey": self.primary_key})
+        task_info = self.client.index(self.index).update_settings(INDEX_SETTINGS)
+        task = self.client.wait_for_task(task_info.task_uid, timeout_in_ms=SETTINGS_TASK_TIMEOUT_MS)
+        if task.status != "succeeded":
+            raise RuntimeError(f"Updating the settings of index '{self.index}' failed: {task.error}")
+        cache.set(self._settings_version_key(), SETTINGS_VERSION, None)
+        return task
 
     def index_text(self, texts):
-        return self.client.index(self.index).add_documents(texts)
+        return self.client.index(self.index).add_documents(texts, primary_key=self.primary_key)
+
+    def delete_text_documents(self, text_keys):
+        """Deletes every document of the texts given as (corpus slug, slug) pairs. Passages
+        are added by id, so a text re-indexed with fewer chapters would otherwise keep the
+        passages it no longer has."""
+        clauses = [
+            f"(corpus_slug = {json.dumps(corpus_slug)} AND slug = {json.dumps(slug)})"
+            if corpus_slug
+            else f"(corpus_slug IS NULL AND slug = {json.dumps(slug)})"
+            for corpus_slug, slug in text_keys
+        ]
+        return self.client.index(self.index).delete_documents(filter=" OR ".join(clauses))
+
+    def wait_for_task(self, task_uid, timeout_ms=5000):
+        return self.client.wait_for_task(task_uid, timeout_in_ms=timeout_ms)
+
+    def _wait_for_success(self, task_info, what):
+        task = self.wait_for_task(task_info.task_uid, timeout_ms=SETTINGS_TASK_TIMEOUT_MS)
+        if task.status != "succeeded":
+            raise RuntimeError(f"{what} failed: {task.error}")
+        return task
+
+    def shadow(self):
+        """An empty copy of this index, with the current settings, to rebuild into while
+        this one keeps serving searches. Replaces any leftover shadow from an earlier run."""
+        shadow = Search(index=f"{self.index}_shadow")
+        if any(idx.uid == shadow.index for idx in self.client.get_indexes()["results"]):
+            self._wait_for_success(shadow.delete_index(), f"Deleting index '{shadow.index}'")
+        shadow.sync_settings(force=True)
+        return shadow
+
+    def replace_with(self, shadow):
+        """Atomically swaps the contents of `shadow` into this index, then drops the old
+        contents (which are now in the shadow index)."""
+        # Both sides of a swap have to exist. Ask Meilisearch rather than trust the cached
+        # settings version, which outlives an index deleted behind our back.
+        if not any(idx.uid == self.index for idx in self.client.get_indexes()["results"]):
+            self._wait_for_success(
+                self.client.create_index(self.index, {"primaryKey": self.primary_key}),
+                f"Creating index '{self.index}'",
+            )
+        self._wait_for_success(
+            self.client.swap_indexes([{"indexes": [self.index, shadow.index]}]),
+            f"Swapping indexes '{self.index}' and '{shadow.index}'",
+        )
+        # The shadow was built with the current settings, and now lives under our name.
+        cache.set(self._settings_version_key(), SETTINGS_VERSION, None)
+        self._wait_for_success(shadow.delete_index(), f"Deleting index '{shadow.index}'")
 
     def delete_all_documents_index(self):
         return self.client.index(self.index).delete_all_documents()
 
     def delete_index(self):
+        # A recreated index starts out without our settings
+        cache.delete(self._settings_version_key())
         return self.client.index(self.index).delete()
 
     def search(self, keyword):
@@ -0,0 +1,375 @@
+"""Full text search on SQLite FTS5, for deployments without a Meilisearch server.
+
+SqliteSearch takes the same documents as the Meilisearch index (Text.to_json or
+Text.to_passage_json) and answers with the subset of Meilisearch's response format our
+views read: hits with _formatted and _matchesPosition, totalHits/totalPages and
+facetDistribution. Every index is its own database file, so swapping a rebuilt index in
+is a rename.
+
+Each chapter of a document is one row of the FTS table, ranked with bm25. Like the
+distinctAttribute of the Meilisearch index, results are grouped by slug. Facet values live
+in a plain table; their counts over the whole index, which is what the search page shows
+before anything has been searched for, are computed once after indexing: when a rebuilt
+index is swapped in, or at the first search that needs them."""
+import copy
+import json
+import os
+import re
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+
+from texts.ft_search import Search, INDEX_SETTINGS, SETTINGS_VERSION
+
+FACETS = [a for a in INDEX_SETTINGS["filterableAttributes"] if a.startswith("text_meta.")]
+CHAPTER_FIELDS = ["lemmatized", "normalized", "normalized_group", "english_translation"]
+# Searchable metadata, in the order it is written to the meta column, one value per line
+META_FIELDS = list(
+    dict.fromkeys(a.split(".", 1)[1] for a in INDEX_SETTINGS["searchableAttributes"] if a.startswith("text_meta."))
+)
+# bm25 weights of: document, position, title, corpus, <CHAPTER_FIELDS>, meta
+BM25_WEIGHTS = "0, 0, 4.0, 2.0, 1.0, 1.0, 1.0, 1.0, 0.5"
+TITLE_COLUMN = 2
+FIRST_CHAPTER_COLUMN = 4
+META_COLUMN = FIRST_CHAPTER_COLUMN + len(CHAPTER_FIELDS)
+HIGHLIGHT_PRE_TAG = '<span class="highlight">'
+HIGHLIGHT_POST_TAG = "</span>"
+# Roughly the cropLength of the Meilisearch queries, in tokens
+SNIPPET_TOKENS = 32
+ELLIPSIS = "…"
+# What our views send as filters: equalities joined with AND
+FILTER_CLAUSE_REGEX = re.compile(r'\s*([\w.]+)\s*=\s*"((?:[^"\\]|\\.)*)"\s*')
+
+# Stored in PRAGMA user_version once SCHEMA has been created
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    slug TEXT NOT NULL,
+    json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_slug ON documents (slug);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    document UNINDEXED, position UNINDEXED, title, corpus,
+    lemmatized, normalized, normalized_group, english_translation, meta
+);
+CREATE TABLE IF NOT EXISTS facets (document INTEGER NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS facets_name_value ON facets (name, value, document);
+CREATE INDEX IF NOT EXISTS facets_document ON facets (document);
+CREATE TABLE IF NOT EXISTS facet_counts (
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (name, value)
+);
+"""
+
+
+def parse_filter(filters):
+    """[(attribute, value)] from a filter like 'text_meta.author = "Shenoute" AND ...'."""
+    if not filters:
+        return []
+    clauses = []
+    for clause in re.split(r"\s+AND\s+", filters.strip()):
+        match = FILTER_CLAUSE_REGEX.fullmatch(clause)
+        if not match:
+            raise ValueError(f"Unsupported search filter: {clause!r}")
+        clauses.append((match.group(1), re.sub(r"\\(.)", r"\1", match.group(2))))
+    return clauses
+
+
+def match_query(keyword):
+    """An FTS5 query requiring every word of the keyword, the last one as a prefix, as
+    Meilisearch does while typing. None for an empty keyword."""
+    words = (keyword or "").split()
+    if not words:
+        return None
+    quoted = ['"' + word.replace('"', '""') + '"' for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _flatten(value):
+    if isinstance(value, list):
+        for item in value:
+            yield from _flatten(item)
+    elif value is not None:
+        yield str(value)
+
+
+def _meta_lines(text_meta):
+    """(name, value) of the searchable metadata of a document, one per line of the meta column."""
+    return [
+        (name, " ".join(_flatten(text_meta[name])).replace("\n", " "))
+        for name in META_FIELDS
+        if name in text_meta
+    ]
+
+
+def _task(uid, status="succeeded", error=None, started=None):
+    duration = f"PT{time.perf_counter() - started:.3f}S" if started else None
+    return SimpleNamespace(uid=uid, task_uid=uid, status=status, error=error, duration=duration)
+
+
+class SqliteSearch(Search):
+    def __init__(self, index=None):
+        self.client = None
+        self.index = index or settings.SEARCH_CONFIG["MEILI_COPTIC_INDEX"]
+        self.path = os.path.join(settings.SEARCH_CONFIG.get("SQLITE_DIR", "search"), f"{self.index}.sqlite3")
+        self._tasks = {}
+
+    @property
+    def search_available(self):
+        return True
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path)
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            db.executescript(SCHEMA + f"PRAGMA user_version = {SCHEMA_VERSION};")
+        return db
+
+    def _record(self, task):
+        self._tasks[task.uid] = task
+        return task
+
+    def wait_for_task(self, task_uid, timeout_ms=5000):
+        # Everything runs synchronously, so tasks are done when they are handed out.
+        return self._tasks[task_uid]
+
+    def sync_settings(self, force=False):
+        started = time.perf_counter()
+        db = self._connect()
+        try:
+            with db:
+                row = db.execute("SELECT value FROM settings WHERE name = 'version'").fetchone()
+                if not force and row and row[0] == SETTINGS_VERSION:
+                    return None
+                db.execute("INSERT OR REPLACE INTO settings VALUES ('version', ?)", (SETTINGS_VERSION,))
+        finally:
+            db.close()
+        return self._record(_task(len(self._tasks) + 1, started=started))
+
+    def index_text(self, texts):
+        started = time.perf_counter()
+        uid = len(self._tasks) + 1
+        db = self._connect()
+        try:
+            with db:
+                for document in texts:
+                    self._add_document(db, document)
+                # Counting is over the whole index, so leave it until every batch is in.
+                db.execute("INSERT OR REPLACE INTO settings VALUES ('facet_counts', 'stale')")
+        except sqlite3.Error as e:
+            return self._record(_task(uid, status="failed", error={"message": str(e)}, started=started))
+        finally:
+            db.close()
+        return self._record(_task(uid, started=started))
+
+    def delete_text_documents(self, text_keys):
+        started = time.perf_counter()
+        uid = len(self._tasks) + 1
+        db = self._connect()
+        try:
+            with db:
+                for corpus_slug, slug in text_keys:
+                    rows = db.execute(
+                        "SELECT rowid FROM documents WHERE slug = ? AND json_extract(json, '$.corpus_slug') IS ?",
+                        (slug, corpus_slug),
+                    ).fetchall()
+                    for row in rows:
+                        self._delete_document(db, row)
+                db.execute("INSERT OR REPLACE INTO settings VALUES ('facet_counts', 'stale')")
+        except sqlite3.Error as e:
+            return self._record(_task(uid, status="failed", error={"message": str(e)}, started=started))
+        finally:
+            db.close()
+        return self._record(_task(uid, started=started))
+
+    def _delete_document(self, db, row):
+        db.execute("DELETE FROM passages WHERE document = ?", row)
+        db.execute("DELETE FROM facets WHERE document = ?", row)
+        db.execute("DELETE FROM documents WHERE rowid = ?", row)
+
+    def _add_document(self, db, document):
+        document_id = str(document[self.primary_key])
+        existing = db.execute("SELECT rowid FROM documents WHERE id = ?", (document_id,)).fetchone()
+        if existing:
+            self._delete_document(db, existing)
+        rowid = db.execute(
+            "INSERT INTO documents (id, slug, json) VALUES (?, ?, ?)",
+            (document_id, document["slug"], json.dumps(document, ensure_ascii=False)),
+        ).lastrowid
+        text_meta = document.get("text_meta") or {}
+        meta = "\n".join(value for _, value in _meta_lines(text_meta))
+        db.executemany(
+            "INSERT INTO passages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (rowid, position, document.get("title") or "", document.get("corpus") or "")
+                + tuple(chapter.get(field, "") for field in CHAPTER_FIELDS)
+                + (meta,)
+                for position, chapter in enumerate(document.get("text") or [{}])
+            ],
+        )
+        db.executemany(
+            "INSERT INTO facets VALUES (?, ?, ?)",
+            [
+                (rowid, facet, value)
+                for facet in FACETS
+                for value in set(_flatten(text_meta.get(facet.split(".", 1)[1])))
+            ],
+        )
+
+    def _count_facets(self, db):
+        """Recounts the facet values over the whole index if documents were indexed since
+        the last count."""
+        with db:
+            if not db.execute("SELECT 1 FROM settings WHERE name = 'facet_counts' AND value = 'stale'").fetchone():
+                return
+            db.execute("DELETE FROM facet_counts")
+            db.execute(
+                "INSERT INTO facet_counts "
+                "SELECT f.name, f.value, COUNT(DISTINCT d.slug) FROM facets f "
+                "JOIN documents d ON d.rowid = f.document GROUP BY f.name, f.value"
+            )
+            db.execute("DELETE FROM settings WHERE name = 'facet_counts'")
+
+    def delete_all_documents_index(self):
+        db = self._connect()
+        try:
+            with db:
+                for table in ("passages", "facets", "facet_counts", "documents"):
+                    db.execute(f"DELETE FROM {table}")
+        finally:
+            db.close()
+        return self._record(_task(len(self._tasks) + 1))
+
+    def delete_index(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return self._record(_task(len(self._tasks) + 1))
+
+    def shadow(self):
+        shadow = SqliteSearch(index=f"{self.index}_shadow")
+        shadow.delete_index()
+        shadow.sync_settings(force=True)
+        return shadow
+
+    def replace_with(self, shadow):
+        # Count before the swap so that no search has to
+        db = shadow._connect()
+        try:
+            shadow._count_facets(db)
+        finally:
+            db.close()
+        os.replace(shadow.path, self.path)
+
+    def search(self, keyword):
+        results = self.faceted_search(keyword, hits_per_page=20)
+        results["estimatedTotalHits"] = results["totalHits"]
+        return results
+
+    def faceted_search(self, keyword, filters=None, page=1, hits_per_page=4):
+        started = time.perf_counter()
+        query = match_query(keyword)
+        clauses = parse_filter(filters)
+        db = self._connect()
+        try:
+            ranked = self._rank(db, query, clauses)
+            page_rows = ranked[(page - 1) * hits_per_page : page * hits_per_page]
+            hits = [self._hit(db, query, row) for row in page_rows]
+            if query is None and not clauses:
+                self._count_facets(db)
+                facet_rows = db.execute("SELECT name, value, count FROM facet_counts").fetchall()
+            else:
+                facet_rows = db.execute(
+                    "SELECT f.name, f.value, COUNT(DISTINCT d.slug) FROM facets f "
+                    "JOIN documents d ON d.rowid = f.document "
+                    "WHERE d.slug IN (SELECT value FROM json_each(?)) GROUP BY f.name, f.value",
+                    (json.dumps([row[0] for row in ranked]),),
+                ).fetchall()
+        finally:
+            db.close()
+
+        facet_distribution = {facet: {} for facet in FACETS}
+        for name, value, count in facet_rows:
+            if name in facet_distribution:
+                facet_distribution[name][value] = count
+        total = len(ranked)
+        return {
+            "hits": hits,
+            "query": keyword,
+            "page": page,
+            "hitsPerPage": hits_per_page,
+            "totalHits": total,
+            "totalPages": (total + hits_per_page - 1) // hits_per_page,
+            "facetDistribution": facet_distribution,
+            "processingTimeMs": int((time.perf_counter() - started) * 1000),
+        }
+
+    def _rank(self, db, query, clauses):
+        """(slug, document, passage, score) of the best passage of every matching text, best first."""
+        conditions = []
+        params = []
+        for name, value in clauses:
+            conditions.append("d.rowid IN (SELECT document FROM facets WHERE name = ? AND value = ?)")
+            params += [name, value]
+        if query is None:
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # Everything, in indexing order
+            return db.execute(
+                f"SELECT d.slug, MIN(d.rowid) AS document, NULL, NULL FROM documents d {where} GROUP BY d.slug ORDER BY document",
+                params,
+            ).fetchall()
+        where = " AND ".join(["passages MATCH ?"] + conditions)
+        # Materialized, so bm25() runs in the FTS query rather than in the aggregate. SQLite
+        # takes the bare columns of each group from its row with the MIN(): the best passage.
+        return db.execute(
+            "WITH scored AS MATERIALIZED ("
+            "  SELECT d.slug AS slug, d.rowid AS document, passages.rowid AS passage,"
+            f"        bm25(passages, {BM25_WEIGHTS}) AS score"
+            f"  FROM passages JOIN documents d ON d.rowid = passages.document WHERE {where}"
+            ") SELECT slug, document, passage, MIN(score) AS best FROM scored"
+            " GROUP BY slug ORDER BY best, document",
+            [query] + params,
+        ).fetchall()
+
+    def _hit(self, db, query, row):
+        """The stored document, with every matching chapter and metadata value highlighted,
+        in the shape of a Meilisearch hit."""
+        document = json.loads(db.execute("SELECT json FROM documents WHERE rowid = ?", (row[1],)).fetchone()[0])
+        hit = dict(document)
+        formatted = copy.deepcopy(document)
+        matches = {}
+        if query is not None:
+            columns = [
+                f"snippet(passages, {FIRST_CHAPTER_COLUMN + i}, ?, ?, ?, {SNIPPET_TOKENS})"
+                for i in range(len(CHAPTER_FIELDS))
+            ]
+            highlighted = db.execute(
+                f"SELECT position, highlight(passages, {TITLE_COLUMN}, ?, ?), "
+                f"highlight(passages, {META_COLUMN}, ?, ?), {', '.join(columns)} "
+                "FROM passages WHERE passages MATCH ? AND document = ? ORDER BY position",
+                [HIGHLIGHT_PRE_TAG, HIGHLIGHT_POST_TAG] * 2
+                + [HIGHLIGHT_PRE_TAG, HIGHLIGHT_POST_TAG, ELLIPSIS] * len(CHAPTER_FIELDS)
+                + [query, row[1]],
+            ).fetchall()
+            for position, title, meta, *snippets in highlighted:
+                if HIGHLIGHT_PRE_TAG in title:
+                    formatted["title"] = title
+                    matches["title"] = [{"start": 0, "length": 0}]
+                for field, snippet in zip(CHAPTER_FIELDS, snippets):
+                    if HIGHLIGHT_PRE_TAG in snippet:
+                        formatted["text"][position][field] = snippet
+                        matches.setdefault(f"text.{field}", []).append({"start": 0, "length": 0, "indices": [position]})
+                for (name, _), line in zip(_meta_lines(document.get("text_meta") or {}), meta.split("\n")):
+                    if HIGHLIGHT_PRE_TAG in line:
+                        formatted["text_meta"][name] = line
+                        matches[f"text_meta.{name}"] = [{"start": 0, "length": 0}]
+        hit["_formatted"] = formatted
+        hit["_matchesPosition"] = matches
+        return hit
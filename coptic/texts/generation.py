@@ -0,0 +1,117 @@
+"""Generation counters of the ingested data.
+
+Every corpus ingest bumps the global generation and the corpus's own one (see
+CorpusTransaction.execute). Anything a process derives from the database and keeps in
+memory is built through a PerGeneration, which rebuilds it when the global generation
+has moved, looking at the counter at most every CHECK_INTERVAL seconds. Cached pages
+embed the generation of what they show in their keys (see cache_page_per_generation),
+so an ingest only invalidates the pages of the corpora it changed.
+
+Pages of older generations are not deleted on bump(): their keys are hashes, so they can't
+be found by generation. Nothing reads them any more, and the cache drops them once they
+are older than their timeout, or earlier when it culls entries to stay under MAX_ENTRIES.
+"""
+import threading
+import time
+from functools import lru_cache, wraps
+
+from django.db import transaction
+from django.views.decorators.cache import cache_page
+
+from texts.models import DataGeneration
+
+GLOBAL = ""
+CHECK_INTERVAL = 5
+# How many cache_page views, one per key prefix, each decorated view keeps around
+CACHED_KEY_PREFIXES = 1024
+
+
+def bump(*corpus_slugs):
+    """Moves the global generation and those of the given corpora on; returns the new global one.
+    Generations are at least the current time in nanoseconds, so that they never repeat one
+    that a shared cache may still hold entries for, even after the database is recreated."""
+    now = time.time_ns()
+    with transaction.atomic():
+        for name in (GLOBAL, *corpus_slugs):
+            row, _ = DataGeneration.objects.select_for_update().get_or_create(name=name)
+            row.value = max(row.value + 1, now)
+            row.save(update_fields=["value"])
+    # This process sees its own ingest at once, the others within CHECK_INTERVAL.
+    reset()
+    return current()
+
+
+def reset():
+    """Forgets everything this process built per generation."""
+    for per_generation in PerGeneration.instances:
+        per_generation.reset()
+
+
+def current(name=GLOBAL):
+    """The generation of the whole dataset, or of one corpus by slug; 0 before the first ingest."""
+    return DataGeneration.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+
+class PerGeneration:
+    """A value built by `build(generation)` from the database, rebuilt by the first call of
+    get() that notices a new generation."""
+    instances = []
+
+    def __init__(self, build):
+        self._build = build
+        self._lock = threading.Lock()
+        self.reset()
+        PerGeneration.instances.append(self)
+
+    def get(self):
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at > CHECK_INTERVAL:
+                generation = current()
+                if generation != self._generation:
+                    self._value = self._build(generation)
+                    self._generation = generation
+                self._checked_at = time.monotonic()
+            return self._value
+
+    def reset(self):
+        """Forgets the value, e.g. after changing the data in tests."""
+        with self._lock:
+            self._value = None
+            self._generation = None
+            self._checked_at = None
+
+
+_generations = PerGeneration(lambda generation: dict(DataGeneration.objects.values_list("name", "value")))
+
+
+def generations():
+    """{name: generation} of the whole dataset (GLOBAL) and of every ingested corpus."""
+    return _generations.get()
+
+
+def cache_page_per_generation(timeout, corpus_kwarg=None, key_parts=None):
+    """Like cache_page, with the generation of the corpus whose slug is in the view's
+    `corpus_kwarg` keyword argument in the cache key, or the global one for views of no
+    single corpus. A page then stays cached until the data it shows is ingested again.
+    Pages of a corpus that also show data shared by all corpora put a `key_parts()`
+    string in the key that changes with that data."""
+
+    def decorator(view):
+        @lru_cache(maxsize=CACHED_KEY_PREFIXES)
+        def cached_view(key_prefix):
+            return cache_page(timeout, key_prefix=key_prefix)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            corpus = kwargs.get(corpus_kwarg) if corpus_kwarg else None
+            if corpus:
+                key_prefix = f"corpus-{corpus}-{generations().get(corpus, 0)}"
+                if key_parts:
+                    key_prefix += f"-{key_parts()}"
+            else:
+                key_prefix = f"all-{generations().get(GLOBAL, 0)}"
+            return cached_view(key_prefix)(request, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
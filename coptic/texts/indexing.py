@@ -0,0 +1,121 @@
+import json
+import logging
+import time
+from collections import deque
+
+from texts.ft_search import Search, document_layout, PASSAGE_LAYOUT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+# Meilisearch refuses payloads over 100MB by default; stay well below.
+DEFAULT_BATCH_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_IN_FLIGHT = 2
+# How long to wait for a single batch to be indexed.
+TASK_TIMEOUT_MS = 10 * 60 * 1000
+
+
+def search_documents(text):
+    """The search documents of a text under the configured DOCUMENT_LAYOUT."""
+    if document_layout() == PASSAGE_LAYOUT:
+        return text.to_passage_json()
+    return [text.to_json()]
+
+
+def iter_documents(texts):
+    """Yields the search documents of every text in the queryset, loading its corpus and
+    metadata in bulk rather than once per text."""
+    for text in texts.select_related("corpus").prefetch_related("text_meta").iterator(chunk_size=200):
+        yield from search_documents(text)
+
+
+def text_keys(documents):
+    """The distinct (corpus slug, slug) of the texts of search documents, in order."""
+    return list(dict.fromkeys((document.get("corpus_slug"), document["slug"]) for document in documents))
+
+
+def iter_batches(documents, batch_size=DEFAULT_BATCH_SIZE, batch_bytes=DEFAULT_BATCH_BYTES):
+    """Groups documents into lists of at most `batch_size` documents and (roughly) at most
+    `batch_bytes` of JSON. A single document larger than `batch_bytes` gets a batch to itself."""
+    batch = []
+    size = 0
+    for document in documents:
+        document_size = len(json.dumps(document, ensure_ascii=False).encode("utf-8"))
+        if batch and (len(batch) >= batch_size or size + document_size > batch_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(document)
+        size += document_size
+    if batch:
+        yield batch
+
+
+class Indexer:
+    """Sends documents to the full text index in batches, with at most `max_in_flight`
+    indexing tasks enqueued at any time, and waits for every task to finish.
+
+    `report` is called with a dict describing each batch once its task has finished."""
+
+    def __init__(
+        self,
+        search=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        batch_bytes=DEFAULT_BATCH_BYTES,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+        report=None,
+    ):
+        self.search = search or Search()
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.max_in_flight = max(1, max_in_flight)
+        self.report = report or (lambda batch: None)
+
+    def index(self, texts):
+        """Indexes a queryset of texts. Returns totals over all batches."""
+        return self.index_documents(iter_documents(texts))
+
+    def index_documents(self, documents):
+        started = time.perf_counter()
+        totals = {"batches": 0, "documents": 0, "failed": 0}
+        in_flight = deque()
+        replaced = set()
+        for number, batch in enumerate(iter_batches(documents, self.batch_size, self.batch_bytes), 1):
+            if len(in_flight) >= self.max_in_flight:
+                self._finish(in_flight.popleft(), totals)
+            if document_layout() == PASSAGE_LAYOUT:
+                # Passages are added by id, so first drop those the texts had before. The
+                # passages of a text can span batches: only delete before the first one.
+                new_keys = [key for key in text_keys(batch) if key not in replaced]
+                if new_keys:
+                    replaced.update(new_keys)
+                    self.search.delete_text_documents(new_keys)
+            task_info = self.search.index_text(batch)
+            in_flight.append((number, task_info.task_uid, len(batch), time.perf_counter()))
+        while in_flight:
+            self._finish(in_flight.popleft(), totals)
+        totals["seconds"] = time.perf_counter() - started
+        totals["documents_per_second"] = totals["documents"] / totals["seconds"] if totals["seconds"] else 0.0
+        return totals
+
+    def _finish(self, submitted, totals):
+        number, task_uid, n_documents, submitted_at = submitted
+        task = self.search.wait_for_task(task_uid, timeout_ms=TASK_TIMEOUT_MS)
+        seconds = time.perf_counter() - submitted_at
+        failed = task.status != "succeeded"
+        if failed:
+            logger.error(f"Indexing batch {number} (task {task_uid}) failed: {task.error}")
+        totals["batches"] += 1
+        totals["documents"] += n_documents
+        totals["failed"] += n_documents if failed else 0
+        self.report(
+            {
+                "batch": number,
+                "task_uid": task_uid,
+                "documents": n_documents,
+                "failed": n_documents if failed else 0,
+                "error": task.error if failed else None,
+                "seconds": seconds,
+                "documents_per_second": n_documents / seconds if seconds else 0.0,
+            }
+        )
@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from texts.models import (
+    Text
+)
+from texts import token_index
+
+
+class Command(BaseCommand):
+    help = 'Build the lemma/norm token index of all texts and make it the current one'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        directory = token_index.build(Text.objects.order_by("corpus_id", "id"))
+        index = token_index.TokenIndex(directory)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {index.words} words of {len(index.texts)} texts in {time.perf_counter() - started:.1f}s"
+            f" into {directory}\n"
+        ))
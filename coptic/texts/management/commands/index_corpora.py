@@ -1,15 +1,83 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from texts.models import (
-    Corpus
+    Text
 )
+from texts.ft_search import Search
+from texts.indexing import (
+    Indexer,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BATCH_BYTES,
+    DEFAULT_MAX_IN_FLIGHT,
+)
+
+
+def add_indexer_arguments(parser):
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Maximum number of documents sent to the index in one request."
+    )
+    parser.add_argument(
+        '--batch-bytes',
+        type=int,
+        default=DEFAULT_BATCH_BYTES,
+        help="Maximum size in bytes of the JSON sent to the index in one request."
+    )
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="Number of indexing tasks allowed to be enqueued at once."
+    )
+
+
+def indexer_for(command, search, options):
+    def report(batch):
+        line = (f"Batch {batch['batch']}: {batch['documents']} documents in {batch['seconds']:.1f}s"
+                f" ({batch['documents_per_second']:.0f} docs/s), {batch['failed']} failed\n")
+        command.stdout.write(command.style.ERROR(line) if batch['failed'] else line)
+
+    return Indexer(
+        search,
+        batch_size=options['batch_size'],
+        batch_bytes=options['batch_bytes'],
+        max_in_flight=options['max_in_flight'],
+        report=report,
+    )
+
 
 class Command(BaseCommand):
     help = 'Full Text Index all corpora'
 
-    def handle(self, *args, **kwargs):
-        #FIXME: it's actually probably better to first
-        # create a text_pairs list and then index all of them
-        # at once.
-        for corpus in Corpus.objects.all():
-            corpus.index()
-            self.stdout.write(f'Corpus {corpus.slug} indexed\n')
\ No newline at end of file
+    def add_arguments(self, parser):
+        add_indexer_arguments(parser)
+        parser.add_argument(
+            '--swap',
+            action='store_true',
+            help="Build a fresh shadow index and swap it with the live one when it is complete, "
+                 "so searches keep working during the rebuild."
+        )
+
+    def handle(self, *args, **options):
+        search = Search()
+        if not search.search_available:
+            self.stdout.write(self.style.ERROR('Search is not available. Skipping indexing.\n'))
+            return
+        if options['swap']:
+            target = search.shadow()
+            self.stdout.write(f'Building shadow index {target.index}\n')
+        else:
+            search.sync_settings()
+            target = search
+        # Every text goes through one stream of batches, regardless of corpus.
+        totals = indexer_for(self, target, options).index(Text.objects.order_by("corpus_id", "id"))
+        self.stdout.write(f"Indexed {totals['documents']} texts in {totals['batches']} batches"
+                          f" in {totals['seconds']:.1f}s ({totals['documents_per_second']:.0f} docs/s),"
+                          f" {totals['failed']} failed\n")
+        if options['swap']:
+            if totals['failed']:
+                raise CommandError(f"{totals['failed']} texts failed to index. Leaving {search.index} as it was; "
+                                   f"the partial build is in {target.index}.")
+            search.replace_with(target)
+            self.stdout.write(self.style.SUCCESS(f'Swapped {target.index} into {search.index}\n'))
@@ -2,6 +2,8 @@ from django.core.management.base import BaseCommand
 from texts.models import (
     Corpus
 )
+from texts.ft_search import Search
+from texts.management.commands.index_corpora import add_indexer_arguments, indexer_for
 
 class Command(BaseCommand):
     help = 'Full Text Index a corpus'
@@ -12,18 +14,25 @@ class Command(BaseCommand):
             type=str,
             help="The names of a top-level directory inside of the corpus GitHub repository to index"
         )
+        add_indexer_arguments(parser)
 
     def handle(self, *args, **options):
+        search = Search()
+        if not search.search_available:
+            self.stdout.write(self.style.ERROR('Search is not available. Skipping indexing.\n'))
+            return
+        search.sync_settings()
+        indexer = indexer_for(self, search, options)
         for corpus_dirname in options["corpus_dirnames"]:
             self.stdout.write(f'index {corpus_dirname} \n')
             corpus = Corpus.objects.filter(annis_corpus_name__iexact=corpus_dirname).first()
             if corpus:
                 try:
-                    result = corpus.index()
-                    self.stdout.write(f'Corpus {corpus.slug}\n')
+                    totals = indexer.index(corpus.text_set.order_by("id"))
+                    self.stdout.write(f"Corpus {corpus.slug}: {totals['documents']} texts, {totals['failed']} failed\n")
                 except Exception as e:
                     self.stdout.write(f'Error indexing corpus {corpus.slug}\n')
                     self.stdout.write(f'{e}\n')
             else:
                 self.stdout.write('No matching corpus found.\n')
-        
\ No newline at end of file
+        
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from texts.ft_search import Search, SETTINGS_VERSION
+
+class Command(BaseCommand):
+    help = 'Apply the full text index settings if they changed since the last sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Push the settings even if the index already has this settings version."
+        )
+
+    def handle(self, *args, **options):
+        search = Search()
+        if not search.search_available:
+            raise CommandError("Search is not available.")
+        task = search.sync_settings(force=options['force'])
+        if task is None:
+            self.stdout.write(f'Index {search.index} already has settings version {SETTINGS_VERSION[:12]}\n')
+        else:
+            self.stdout.write(f'Index {search.index} updated to settings version {SETTINGS_VERSION[:12]} in {task.duration}\n')
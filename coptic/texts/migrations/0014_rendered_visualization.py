@@ -0,0 +1,53 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:13
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def backfill_hashes(apps, schema_editor):
+    Text = apps.get_model("texts", "Text")
+    HtmlVisualization = apps.get_model("texts", "HtmlVisualization")
+    for text in Text.objects.only("id", "content").iterator():
+        Text.objects.filter(id=text.id).update(content_hash=_sha1(text.content))
+    for vis in HtmlVisualization.objects.only("id", "config").iterator():
+        HtmlVisualization.objects.filter(id=vis.id).update(config_hash=_sha1(vis.config))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('texts', '0013_text_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='htmlvisualization',
+            name='config_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='text',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+        migrations.CreateModel(
+            name='RenderedVisualization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=40)),
+                ('config_hash', models.CharField(max_length=40)),
+                ('visualization_format_slug', models.CharField(max_length=200)),
+                ('html', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Rendered Visualization',
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'config_hash', 'visualization_format_slug'), name='unique_rendered_visualization')],
+            },
+        ),
+        migrations.RunPython(backfill_hashes, migrations.RunPython.noop),
+    ]
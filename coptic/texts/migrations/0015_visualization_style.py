@@ -0,0 +1,65 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:19
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def move_config_and_css_to_styles(apps, schema_editor):
+    HtmlVisualization = apps.get_model("texts", "HtmlVisualization")
+    VisualizationStyle = apps.get_model("texts", "VisualizationStyle")
+    style_ids = {}
+    for vis in HtmlVisualization.objects.only("id", "config", "css").iterator():
+        config_hash = _sha1(vis.config)
+        style_hash = _sha1(config_hash + _sha1(vis.css))
+        if style_hash not in style_ids:
+            style_ids[style_hash] = VisualizationStyle.objects.create(
+                hash=style_hash, config=vis.config, config_hash=config_hash, css=vis.css
+            ).id
+        HtmlVisualization.objects.filter(id=vis.id).update(style_id=style_ids[style_hash])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('texts', '0014_rendered_visualization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisualizationStyle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=40, unique=True)),
+                ('config', models.TextField(blank=True)),
+                ('config_hash', models.CharField(max_length=40)),
+                ('css', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Visualization Style',
+            },
+        ),
+        migrations.AddField(
+            model_name='htmlvisualization',
+            name='style',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='texts.visualizationstyle'),
+        ),
+        migrations.RunPython(move_config_and_css_to_styles, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='htmlvisualization',
+            name='config',
+        ),
+        migrations.RemoveField(
+            model_name='htmlvisualization',
+            name='config_hash',
+        ),
+        migrations.RemoveField(
+            model_name='htmlvisualization',
+            name='css',
+        ),
+    ]
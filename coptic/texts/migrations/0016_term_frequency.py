@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('texts', '0015_visualization_style'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermFrequency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer', models.CharField(max_length=20)),
+                ('term', models.CharField(max_length=200)),
+                ('count', models.PositiveIntegerField()),
+                ('corpus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='texts.corpus')),
+                ('text', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='texts.text')),
+            ],
+            options={
+                'verbose_name': 'Term Frequency',
+                'indexes': [models.Index(fields=['corpus', 'text', 'layer', '-count'], name='term_frequency_list')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-18 18:38
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_meta_to_columns(apps, schema_editor):
+    Text = apps.get_model("texts", "Text")
+    values = defaultdict(lambda: defaultdict(list))
+    links = Text.text_meta.through.objects.filter(
+        textmeta__name__in=("document_cts_urn", "author", "endnote", "next", "previous")
+    )
+    for text_id, name, value in links.values_list("text_id", "textmeta__name", "textmeta__value").iterator():
+        values[text_id][name].append(value.strip())
+    texts = list(Text.objects.only("id", "document_cts_urn"))
+    for text in texts:
+        metas = values[text.id]
+        if metas["document_cts_urn"]:
+            text.document_cts_urn = metas["document_cts_urn"][0]
+        text.author = ", ".join(metas["author"])
+        text.endnote = metas["endnote"][0] if metas["endnote"] else ""
+    urn_ids = {text.document_cts_urn: text.id for text in texts if text.document_cts_urn}
+    for text in texts:
+        metas = values[text.id]
+        text.next_text_id = urn_ids.get(metas["next"][0]) if metas["next"] else None
+        text.previous_text_id = urn_ids.get(metas["previous"][0]) if metas["previous"] else None
+    Text.objects.bulk_update(
+        texts, ["document_cts_urn", "author", "endnote", "next_text", "previous_text"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('texts', '0016_term_frequency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='text',
+            name='author',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='text',
+            name='endnote',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='text',
+            name='next_text',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='texts.text'),
+        ),
+        migrations.AddField(
+            model_name='text',
+            name='previous_text',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='texts.text'),
+        ),
+        migrations.AlterField(
+            model_name='text',
+            name='document_cts_urn',
+            field=models.CharField(db_index=True, max_length=80),
+        ),
+        migrations.RunPython(copy_meta_to_columns, migrations.RunPython.noop),
+    ]
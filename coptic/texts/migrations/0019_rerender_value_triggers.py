@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:05
+
+import time
+
+from django.db import migrations
+
+
+def _has_value_trigger(config):
+    return any("=" in line.split("\t")[0].split(" ")[0] for line in config.splitlines() if not line.startswith("#"))
+
+
+def rerender_value_triggers(apps, schema_editor):
+    # Triggers like '="God"' and 'norm="God"' never fired before, so renders of configs that
+    # use them are stale. They are rendered again on the next request or ingest.
+    VisualizationStyle = apps.get_model("texts", "VisualizationStyle")
+    RenderedVisualization = apps.get_model("texts", "RenderedVisualization")
+    Text = apps.get_model("texts", "Text")
+    DataGeneration = apps.get_model("texts", "DataGeneration")
+    styles = [style for style in VisualizationStyle.objects.only("config", "config_hash") if _has_value_trigger(style.config)]
+    if not styles:
+        return
+    RenderedVisualization.objects.filter(config_hash__in={style.config_hash for style in styles}).delete()
+    # Cached pages carry the generation of their corpus in their key (texts.generation), so
+    # move the generations of the corpora that show these visualizations on, as an ingest would.
+    corpus_slugs = set(
+        Text.objects.filter(html_visualizations__style__in=styles, corpus__isnull=False).values_list("corpus__slug", flat=True)
+    )
+    now = time.time_ns()
+    for name in ("", *sorted(corpus_slugs)):
+        row, _ = DataGeneration.objects.get_or_create(name=name)
+        row.value = max(row.value + 1, now)
+        row.save(update_fields=["value"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('texts', '0018_data_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(rerender_value_triggers, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,16 @@
 import datetime
 import re
 import logging
-from collections import OrderedDict
+from collections import Counter, OrderedDict, defaultdict
 from base64 import b64encode
 from django.db import models
 from django.conf import settings
-from cache_memoize import cache_memoize
 
-from texts.ft_search import Search
-from gh_ingest.htmlvis import generate_visualization
+from texts.ft_search import Search, document_layout, PASSAGE_LAYOUT
+from texts.indexing import Indexer, search_documents, text_keys
+from texts import sgml
+from texts.token_index import count_terms
+from gh_ingest.htmlvis import generate_visualization, content_hash
 from gh_ingest.scraper_exceptions import NoTexts
 from gh_ingest.repository import Repository
 
@@ -51,16 +53,13 @@ class Corpus(models.Model):
         """Set visualization formats from a list of HtmlVisualizationFormat objects."""
         self.visualization_formats = ",".join(f["slug"] for f in formats)
         
-    def index(self):
+    def index(self, **indexer_options):
         # Index texts in Meilisearch
         search = Search()
-        json_array=[]
         if search.search_available:
-            texts = self.text_set.all()
-            for text in texts:
-                json_array.append(text.to_json())
-            result = search.index_text(json_array)
-            logging.info(f"Indexed {self.slug}: {len(texts)} texts.")
+            totals = Indexer(search, **indexer_options).index(self.text_set.all())
+            logging.info(f"Indexed {self.slug}: {totals['documents']} texts, {totals['failed']} failed.")
+            return totals
         else:
             logging.error("Search is not available. Skipping indexing.")
 
@@ -95,18 +94,88 @@ class Corpus(models.Model):
             + self._annis_corpus_name_b64encoded()
         )
 
+class VisualizationStyle(models.Model):
+    """An htmlvis config and its stylesheet, stored once and shared by every
+    visualization that uses them. Rows are addressed by a hash of both."""
+    hash = models.CharField(max_length=40, unique=True)
+    config = models.TextField(blank=True)
+    config_hash = models.CharField(max_length=40)
+    css = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Visualization Style"
+
+    @staticmethod
+    def style_hash(config, css):
+        return content_hash(content_hash(config) + content_hash(css))
+
+    @classmethod
+    def build(cls, config, css):
+        """An unsaved style for this config and css."""
+        return cls(hash=cls.style_hash(config, css), config=config, config_hash=content_hash(config), css=css)
+
+    @classmethod
+    def save_all(cls, styles):
+        """Store styles we don't have yet and give every style in `styles` its primary key."""
+        by_hash = {style.hash: style for style in styles}
+        cls.objects.bulk_create(list(by_hash.values()), ignore_conflicts=True)
+        ids = dict(cls.objects.filter(hash__in=by_hash.keys()).values_list("hash", "id"))
+        for style in styles:
+            style.id = ids[style.hash]
+            style._state.adding = False
+
+    @classmethod
+    def prune(cls):
+        """Drop styles that no visualization uses anymore."""
+        return cls.objects.filter(htmlvisualization=None).delete()
+
+    def __str__(self):
+        return self.hash
+
+
 class HtmlVisualization(models.Model):
     #FIXME this model is probably not needed at all ..
     # get_html_visualization should be a method on Text
     # At any rate we want to actually store the CSS and configuration used in the database
     # So at runtime we can still generate the visualizations dynamically.
     visualization_format_slug = models.CharField(max_length=200)
-    config = models.TextField(blank=True)
-    css = models.TextField(blank=True)
+    style = models.ForeignKey(VisualizationStyle, null=True, blank=True, on_delete=models.PROTECT)
 
     class Meta:
         verbose_name = "HTML Visualization"
 
+    def save(self, *args, **kwargs):
+        if self.style is not None and self.style.pk is None:
+            VisualizationStyle.save_all([self.style])
+        return super().save(*args, **kwargs)
+
+    # config and css live on the shared style. Assigning either one points the
+    # visualization at the (unsaved) style for the new pair.
+    @property
+    def config(self):
+        return self.style.config if self.style else ""
+
+    @config.setter
+    def config(self, value):
+        self.style = VisualizationStyle.build(value, self.css)
+
+    @property
+    def css(self):
+        return self.style.css if self.style else ""
+
+    @css.setter
+    def css(self, value):
+        self.style = VisualizationStyle.build(self.config, value)
+
+    @property
+    def config_hash(self):
+        return self.style.config_hash if self.style else content_hash("")
+
+    @classmethod
+    def prune(cls):
+        """Drop visualizations whose texts have been deleted."""
+        return cls.objects.filter(text=None).delete()
+
     @classmethod
     def get_format_by_attribute(cls, attribute, value):
         # now lets get the one with the slug passed in the parameter
@@ -117,9 +186,14 @@ class HtmlVisualization(models.Model):
 
     @property
     def html_live(self):
-        texts = self.text_set.all()
-        return generate_visualization(texts.get(), self.config, self.visualization_format_slug)
-    
+        # Served from the render store, which is normally filled at ingest time.
+        # On a miss we render once and store the result for the next request.
+        text = self.text_set.get()
+        html = RenderedVisualization.lookup(text, self)
+        if html is None:
+            html = RenderedVisualization.render(text, self)
+        return html
+
     
     @property
     def visualization_format(self):
@@ -137,6 +211,90 @@ class HtmlVisualization(models.Model):
         return self.visualization_format["title"]
 
 
+class RenderedVisualization(models.Model):
+    """The output of `generate_visualization`, addressed by what it was rendered from:
+    the text content, the htmlvis config and the visualization format. Since the key
+    is content based, an unchanged text keeps its render across re-ingests."""
+    content_hash = models.CharField(max_length=40)
+    config_hash = models.CharField(max_length=40)
+    visualization_format_slug = models.CharField(max_length=200)
+    html = models.TextField()
+
+    class Meta:
+        verbose_name = "Rendered Visualization"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "config_hash", "visualization_format_slug"],
+                name="unique_rendered_visualization",
+            )
+        ]
+
+    @staticmethod
+    def _key(text, visualization):
+        return (
+            text.content_hash or content_hash(text.content),
+            visualization.config_hash or content_hash(visualization.config),
+            visualization.visualization_format_slug,
+        )
+
+    @classmethod
+    def lookup(cls, text, visualization):
+        text_hash, config_hash, slug = cls._key(text, visualization)
+        return (
+            cls.objects.filter(content_hash=text_hash, config_hash=config_hash, visualization_format_slug=slug)
+            .values_list("html", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def render(cls, text, visualization):
+        """Render a visualization and store it. Returns the html."""
+        text_hash, config_hash, slug = cls._key(text, visualization)
+        html = generate_visualization(text, visualization.config, slug)
+        # Another worker may have rendered the same text concurrently.
+        cls.objects.bulk_create(
+            [cls(content_hash=text_hash, config_hash=config_hash, visualization_format_slug=slug, html=html)],
+            ignore_conflicts=True,
+        )
+        return html
+
+    @classmethod
+    def render_missing(cls, text_vis_pairs):
+        """Render the (text, visualization) pairs we don't have in the store yet. Returns the
+        unsaved renders, e.g. for an ingest worker to send back to the process that saves them."""
+        keys = {cls._key(text, vis): (text, vis) for text, vis in text_vis_pairs}
+        existing = set(
+            cls.objects.filter(content_hash__in={k[0] for k in keys}).values_list(
+                "content_hash", "config_hash", "visualization_format_slug"
+            )
+        )
+        missing = [key for key in keys if key not in existing]
+        rendered = []
+        for key in missing:
+            text, vis = keys[key]
+            html = generate_visualization(text, vis.config, vis.visualization_format_slug)
+            rendered.append(cls(content_hash=key[0], config_hash=key[1], visualization_format_slug=key[2], html=html))
+        return rendered
+
+    @classmethod
+    def prerender(cls, text_vis_pairs):
+        """Fill the store for (text, visualization) pairs, skipping renders we already have."""
+        rendered = cls.render_missing(text_vis_pairs)
+        cls.objects.bulk_create(rendered, ignore_conflicts=True)
+        return len(rendered)
+
+    @classmethod
+    def prune(cls):
+        """Drop renders of text contents, or of configs, that are no longer in the database."""
+        return cls.objects.filter(
+            ~models.Q(content_hash__in=Text.objects.values("content_hash"))
+            | ~models.Q(config_hash__in=VisualizationStyle.objects.values("config_hash"))
+        ).delete()
+
+    def __str__(self):
+        return f"{self.visualization_format_slug} {self.content_hash}"
+
+
 class TextMeta(models.Model):
     name = models.CharField(max_length=200, db_index=True)
     value = models.CharField(max_length=10000, db_index=True)
@@ -170,12 +328,19 @@ class Text(models.Model):
     tt_dir = models.CharField(max_length=40)
     tt_filename = models.CharField(max_length=40)
     tt_dir_tree_id = models.CharField(max_length=40)
-    document_cts_urn = models.CharField(max_length=80)
+    document_cts_urn = models.CharField(max_length=80, db_index=True)
     content=models.TextField(default="")
+    content_hash = models.CharField(max_length=40, db_index=True, blank=True)
     order = models.IntegerField(default=999999)
-
+    # Copies of the text_meta the text page and search results need, filled in at ingest
+    # (see copy_meta_columns and link_neighbours).
+    author = models.CharField(max_length=200, blank=True, default="")
+    endnote = models.TextField(blank=True, default="")
+    next_text = models.ForeignKey("self", blank=True, null=True, on_delete=models.SET_NULL, related_name="+")
+    previous_text = models.ForeignKey("self", blank=True, null=True, on_delete=models.SET_NULL, related_name="+")
+
+    # Pages read meta values from the facet catalog (texts.facets), which is cached per generation.
     @classmethod
-    @cache_memoize(settings.CACHE_TTL)
     def get_meta_values(cls, meta):
         return  TextMeta.objects.filter(name__iexact=meta["name"]).values("value").distinct().values_list("value", flat=True)
 
@@ -202,7 +367,6 @@ class Text(models.Model):
         return meta_values
 
     @classmethod
-    @cache_memoize(settings.CACHE_TTL)
     def get_value_corpus_pairs(cls, meta):
         value_corpus_pairs = OrderedDict()
 
@@ -227,11 +391,7 @@ class Text(models.Model):
         # We will have better search results if we return the text as a list of chapters
         # Chapters in the SGML are marked by <chapter_n chapter_n="0">
         # </chapter_n> >
-        chapter_pattern = re.compile(r'<chapter_n chapter_n="\d+">(.*?)<\/chapter_n>', re.DOTALL)
-        chapters = {match.group(1) for match in chapter_pattern.finditer(self.content)}
-        if not chapters:
-            return [self.content]
-        return chapters
+        return sgml.chapter_contents(self.content)
 
     def get_text_lemmatized(self, text):
         # Text is an SGML document that has been tokenized and lemmatized
@@ -256,13 +416,58 @@ class Text(models.Model):
     def __str__(self):
         return self.title
 
+    def copy_meta_columns(self, metas):
+        """Fills document_cts_urn, author and endnote in from the (possibly unsaved) TextMeta of the text."""
+        values = defaultdict(list)
+        for meta in metas:
+            values[meta.name].append(meta.value.strip())
+        self.document_cts_urn = values["document_cts_urn"][0] if values["document_cts_urn"] else self.document_cts_urn
+        self.author = ", ".join(values["author"])
+        self.endnote = values["endnote"][0] if values["endnote"] else ""
+
+    @classmethod
+    def link_neighbours(cls):
+        """Points next_text and previous_text of every text at the texts whose URNs its next and
+        previous metadata name, and saves the ones that changed. Links can cross corpora, so
+        this runs over all texts, in three queries plus the updates."""
+        urn_ids = dict(cls.objects.exclude(document_cts_urn="").values_list("document_cts_urn", "id"))
+        targets = defaultdict(dict)
+        links = cls.text_meta.through.objects.filter(textmeta__name__in=("next", "previous"))
+        for text_id, name, value in links.values_list("text_id", "textmeta__name", "textmeta__value"):
+            targets[text_id][name] = urn_ids.get(value.strip())
+        changed = []
+        for text in cls.objects.only("id", "next_text_id", "previous_text_id"):
+            next_id, previous_id = targets[text.id].get("next"), targets[text.id].get("previous")
+            if (text.next_text_id, text.previous_text_id) != (next_id, previous_id):
+                text.next_text_id, text.previous_text_id = next_id, previous_id
+                changed.append(text)
+        cls.objects.bulk_update(changed, ["next_text", "previous_text"], batch_size=500)
+        return len(changed)
+
     def save(self, *args, **kwargs):
         """On save, update timestamps"""
         if not self.id:
             self.created = datetime.datetime.today()
         self.modified = datetime.datetime.today()
+        self.content_hash = content_hash(self.content)
         return super().save(*args, **kwargs)
 
+    def to_passage_json(self):
+        """One search document per chapter, each carrying the metadata of the whole text.
+        `text` holds just that chapter, so the document has the same shape as to_json's."""
+        text_json = self.to_json()
+        # Text slugs are only unique within a corpus; a text without one has its own id.
+        text_key = f"{self.corpus.slug}-{self.slug}" if self.corpus else f"text-{self.id}"
+        passages = []
+        for position, chapter in enumerate(text_json["text"]):
+            passage = dict(text_json)
+            passage["id"] = f"{text_key}-{position}"
+            passage["chapter"] = chapter["chapter"]
+            passage["position"] = position
+            passage["text"] = [chapter]
+            passages.append(passage)
+        return passages
+
     def to_json(self):
         json = {
             "title": self.title,
@@ -272,15 +477,7 @@ class Text(models.Model):
             "corpus": self.corpus.title if self.corpus else None,
             "corpus_slug": self.corpus.slug if self.corpus else None,
             "text_meta": {},
-            "text": [
-            {
-                "lemmatized": self.get_text_lemmatized(text),
-                "normalized": self.get_text_normalized(text),
-                "normalized_group": self.get_text_normalized_group(text),
-                "english_translation": self.get_text_translation(text),
-            }
-            for text in self.get_text_chapters()
-            ],
+            "text": sgml.extract_chapters(self.content),
             "tt_dir_tree_id": self.tt_dir_tree_id,
             "document_cts_urn": self.document_cts_urn,
         }
@@ -289,7 +486,8 @@ class Text(models.Model):
         # FIXME Actually it could be simpler to just use a flat dictionary
         # here and instead of putting values under text_meta have text.author
         # etc directly. There are possibly some collisions with the corpus?
-        text_meta = self.text_meta.values_list("name", "value")
+        # Iterating .all() rather than values_list() lets a prefetch_related("text_meta") apply.
+        text_meta = [(meta.name, meta.value) for meta in self.text_meta.all()]
         meta_dict = {}
         #FIXME : it seems the structure can still be
         # [['Amir Zeldes', 'Caroline T. Schroeder'], 'Lance Martin']
@@ -319,7 +517,10 @@ class Text(models.Model):
         # once we have the text in the database, we can index them.
         search = Search()
         if search.search_available:
-            result = search.index_text([self.to_json()])
+            documents = search_documents(self)
+            if document_layout() == PASSAGE_LAYOUT:
+                search.delete_text_documents(text_keys(documents))
+            result = search.index_text(documents)
             logging.info(f"Indexed {self.slug} {result} in full text search.")
         else:
             logging.error("Search is not available.")
@@ -344,3 +545,66 @@ class Text(models.Model):
         else:
             logger.error("MeiliSearch is not available")
             return {"hits": []}
+
+
+class TermFrequency(models.Model):
+    """How often a value of a token layer occurs in a text, or in its whole corpus for the
+    rows without a text. Computed when a corpus is ingested and replaced with it."""
+    LAYERS = ("lemma", "norm")
+
+    corpus = models.ForeignKey(Corpus, on_delete=models.CASCADE)
+    text = models.ForeignKey(Text, blank=True, null=True, on_delete=models.CASCADE)
+    layer = models.CharField(max_length=20)
+    term = models.CharField(max_length=200)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Term Frequency"
+        indexes = [
+            models.Index(fields=["corpus", "text", "layer", "-count"], name="term_frequency_list"),
+        ]
+
+    @classmethod
+    def count_text(cls, content):
+        """{layer: Counter of its terms} of the LAYERS of a TT document."""
+        return count_terms(content, cls.LAYERS)
+
+    @classmethod
+    def for_corpus(cls, corpus, texts, text_counts=None):
+        """Unsaved rows counting the LAYERS of every (saved) text of a corpus, and of the corpus.
+        `text_counts` are the count_text() of the contents of the texts, in the same order, if they
+        were already taken, e.g. by an ingest worker."""
+        if text_counts is None:
+            text_counts = [cls.count_text(text.content) for text in texts]
+        rows = []
+        totals = {layer: Counter() for layer in cls.LAYERS}
+        for text, counts_by_layer in zip(texts, text_counts):
+            for layer, counts in counts_by_layer.items():
+                totals[layer].update(counts)
+                rows.extend(
+                    cls(corpus=corpus, text=text, layer=layer, term=term, count=count) for term, count in counts.items()
+                )
+        for layer, counts in totals.items():
+            rows.extend(cls(corpus=corpus, layer=layer, term=term, count=count) for term, count in counts.items())
+        return rows
+
+    @classmethod
+    def ranked(cls, corpus, layer, text=None):
+        """The frequency list of a corpus, or of one of its texts, most frequent first."""
+        return cls.objects.filter(corpus=corpus, text=text, layer=layer).order_by("-count", "term")
+
+    def __str__(self):
+        return f"{self.layer} {self.term}: {self.count}"
+
+
+class DataGeneration(models.Model):
+    """A counter that ingest bumps whenever the texts change, so that data built from them
+    and kept in memory knows when it is stale. One row is global, the others are per corpus."""
+    name = models.CharField(max_length=40, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Data Generation"
+
+    def __str__(self):
+        return f"{self.name or 'all'}: {self.value}"
@@ -1,11 +1,6 @@
-from texts.models import TextMeta
+from texts.facets import get_catalog
 
 class SearchField:
-    def __init__(self, title):
+    def __init__(self, title, catalog=None):
         self.title = title
-        self.values = (
-            TextMeta.objects.filter(name=title)
-            .values_list("value", flat=True)
-            .distinct()
-            .order_by("value")
-        )
+        self.values = [facet.value for facet in (catalog or get_catalog()).values(title)]
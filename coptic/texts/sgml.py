@@ -0,0 +1,65 @@
+"""Extracts the full text search fields from TT SGML.
+
+Chapters are marked with <chapter_n chapter_n="1"> ... </chapter_n>. We walk the
+chapter boundaries once, front to back, with str.find. Each field is then collected with
+a precompiled findall over just that chapter's span of the content. Delimiting chapters
+with a lazy DOTALL regex was what made this slow, not the field regexes."""
+import re
+
+CHAPTER_OPEN = "<chapter_n "
+CHAPTER_CLOSE = "</chapter_n>"
+CHAPTER_LABEL_REGEX = re.compile(r'chapter_n="([^"]*)"')
+
+# search field -> regex collecting its values
+FIELD_REGEXES = {
+    "lemmatized": re.compile(r'lemma="([^"]*)"'),
+    "normalized": re.compile(r'norm="([^"]*)"'),
+    "normalized_group": re.compile(r'norm_group="([^"]*)"'),
+}
+TRANSLATION_REGEX = re.compile(r'<translation translation="([^"]*)">')
+# Placeholder used for spans that have no translation
+EMPTY_TRANSLATION = "..."
+
+
+def chapter_spans(content):
+    """(chapter number, start, end) of the inside of every chapter, in document order."""
+    spans = []
+    position = 0
+    while True:
+        start = content.find(CHAPTER_OPEN, position)
+        if start == -1:
+            break
+        tag_end = content.find(">", start)
+        end = content.find(CHAPTER_CLOSE, tag_end)
+        if tag_end == -1 or end == -1:
+            # An unterminated chapter, like the regex we replaced, doesn't count
+            break
+        label = CHAPTER_LABEL_REGEX.search(content, start, tag_end)
+        spans.append((label.group(1) if label else None, tag_end + 1, end))
+        position = end + len(CHAPTER_CLOSE)
+    return spans
+
+
+def extract_chapters(content):
+    """Returns one dict of search fields per chapter, in document order. Each has the
+    chapter number as a string under "chapter". A text without chapters is returned as a
+    single chapter numbered None; otherwise anything outside a chapter is dropped."""
+    spans = chapter_spans(content) or [(None, 0, len(content))]
+    chapters = []
+    for label, start, end in spans:
+        chapter = {"chapter": label}
+        for field, regex in FIELD_REGEXES.items():
+            chapter[field] = " ".join(regex.findall(content, start, end))
+        chapter["english_translation"] = " ".join(
+            t for t in TRANSLATION_REGEX.findall(content, start, end) if t != EMPTY_TRANSLATION
+        )
+        chapters.append(chapter)
+    return chapters
+
+
+def chapter_contents(content):
+    """The raw SGML of every chapter in document order, or the whole content if it has none."""
+    spans = chapter_spans(content)
+    if not spans:
+        return [content]
+    return [content[start:end] for _, start, end in spans]
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.test import TestCase
+import coptic.views as views
+from texts import facets
+from texts.models import Corpus, Text, TextMeta
+
+
+class TestFacetCatalog(TestCase):
+    def setUp(self):
+        cache.clear()
+        facets.reset()
+        self.addCleanup(cache.clear)
+        self.addCleanup(facets.reset)
+        besa = Corpus.objects.create(title="Letters of Besa", slug="besa-letters", annis_corpus_name="besa.letters")
+        a22 = Corpus.objects.create(title="Acephalous 22", slug="shenoute-a22", annis_corpus_name="shenoute.a22")
+        for i, (corpus, author) in enumerate([(besa, "Besa"), (a22, "Shenoute"), (a22, "<i>Shenoute</i>")]):
+            text = Text.objects.create(corpus=corpus, slug=f"text-{i}", title=f"Text {i}")
+            text.text_meta.add(
+                TextMeta.objects.create(name="author", value=author),
+                TextMeta.objects.create(name="corpus", value=corpus.annis_corpus_name),
+                TextMeta.objects.create(name="people", value="Paul"),
+                TextMeta.objects.create(name="title", value=f"Text {i}"),
+            )
+
+    def test_values_display_names_and_counts(self):
+        with self.assertNumQueries(3):  # the generation, the metadata and the corpora
+            catalog = facets.get_catalog()
+        self.assertEqual(
+            catalog.values("corpus"),
+            [("besa.letters", "Letters of Besa", 1), ("shenoute.a22", "Acephalous 22", 2)],
+        )
+        self.assertEqual(catalog.choices("author"), [("<i>Shenoute</i>", "Shenoute"), ("Besa", "Besa"), ("Shenoute", "Shenoute")])
+        self.assertEqual(catalog.values("people"), [("Paul", "Paul", 3)])
+        self.assertEqual(catalog.values("title"), [])
+        pairs = catalog.value_corpus_pairs("people")
+        self.assertEqual([corpus["slug"] for corpus in pairs["Paul"]], ["shenoute-a22", "besa-letters"])
+
+    def test_pages_do_no_facet_queries(self):
+        facets.get_catalog()
+        with self.assertNumQueries(0):
+            context = views._base_context()
+            form = views.SearchForm()
+        self.assertEqual(context["search_fields"][1].values, ["<i>Shenoute</i>", "Besa", "Shenoute"])
+        self.assertEqual(form.fields["corpus"].choices, [("besa.letters", "Letters of Besa"), ("shenoute.a22", "Acephalous 22")])
+
+    def test_other_processes_read_the_cached_catalog(self):
+        catalog = facets.get_catalog()
+        facets.reset()
+        with self.assertNumQueries(1):
+            self.assertEqual(facets.get_catalog().values("people"), catalog.values("people"))
+
+    def test_index_view(self):
+        response = self.client.get("/index/people/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Letters of Besa")
+        self.assertEqual(self.client.get("/index/title/").status_code, 404)
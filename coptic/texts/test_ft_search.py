@@ -1,11 +1,90 @@
 import unittest
+from unittest.mock import patch, MagicMock
 from bs4 import BeautifulSoup
-from texts.ft_search import Search
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings, SimpleTestCase
+import texts.ft_search as ft_search
+from texts.ft_search import Search, SETTINGS_VERSION
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 class TestSearch(unittest.TestCase):
     def setUp(self):
         self.search = Search()
 
+    def test_client_is_shared(self):
+        self.assertIs(Search().client, self.search.client)
+
+    def test_primary_key_follows_document_layout(self):
+        self.assertEqual(self.search.primary_key, "slug")
+        with override_settings(SEARCH_CONFIG={**settings.SEARCH_CONFIG, "DOCUMENT_LAYOUT": "passage"}):
+            self.assertEqual(self.search.primary_key, "id")
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TestSyncSettings(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = MagicMock()
+        self.client.get_indexes.return_value = {"results": []}
+        self.client.wait_for_task.return_value = MagicMock(status="succeeded")
+        patcher = patch.object(ft_search, "get_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_settings_are_pushed_once_per_version(self):
+        search = Search()
+        self.assertIsNotNone(search.sync_settings())
+        self.client.create_index.assert_called_once()
+        self.assertIsNone(search.sync_settings())
+        self.assertEqual(self.client.index.return_value.update_settings.call_count, 1)
+        self.assertEqual(cache.get(search._settings_version_key()), SETTINGS_VERSION)
+
+    def test_force_and_delete_index_resync(self):
+        search = Search()
+        search.sync_settings()
+        search.sync_settings(force=True)
+        search.delete_index()
+        search.sync_settings()
+        self.assertEqual(self.client.index.return_value.update_settings.call_count, 3)
+
+    def test_failed_settings_task_is_not_recorded(self):
+        self.client.wait_for_task.return_value = MagicMock(status="failed")
+        search = Search()
+        with self.assertRaises(RuntimeError):
+            search.sync_settings()
+        self.assertIsNone(cache.get(search._settings_version_key()))
+
+    def test_rebuild_into_shadow_and_swap(self):
+        self.client.get_indexes.return_value = {"results": [MagicMock(uid="texts"), MagicMock(uid="texts_shadow")]}
+        live = Search(index="texts")
+        shadow = live.shadow()
+        self.assertEqual(shadow.index, "texts_shadow")
+        self.client.index.assert_any_call("texts_shadow")
+        live.replace_with(shadow)
+        self.client.swap_indexes.assert_called_once_with([{"indexes": ["texts", "texts_shadow"]}])
+        self.assertEqual(self.client.index.return_value.delete.call_count, 2)
+        self.assertEqual(cache.get(live._settings_version_key()), SETTINGS_VERSION)
+        self.assertIsNone(cache.get(shadow._settings_version_key()))
+
+
+    def test_swap_creates_a_live_index_missing_despite_the_cached_version(self):
+        live = Search(index="texts")
+        cache.set(live._settings_version_key(), SETTINGS_VERSION, None)
+        self.client.get_indexes.return_value = {"results": [MagicMock(uid="texts_shadow")]}
+        live.replace_with(Search(index="texts_shadow"))
+        self.client.create_index.assert_called_once_with("texts", {"primaryKey": "slug"})
+        self.client.swap_indexes.assert_called_once_with([{"indexes": ["texts", "texts_shadow"]}])
+
+
+    def test_delete_text_documents_by_filter(self):
+        Search(index="texts").delete_text_documents([("besa", 'say "hi"'), (None, "orphan")])
+        self.client.index.return_value.delete_documents.assert_called_once_with(
+            filter='(corpus_slug = "besa" AND slug = "say \\"hi\\"") OR (corpus_slug IS NULL AND slug = "orphan")'
+        )
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+import coptic.views as views
+from texts.ft_search import Search
+from texts.indexing import Indexer
+from texts.fts_sqlite import SCHEMA_VERSION, SqliteSearch, match_query, parse_filter
+
+
+def document(slug, title, normalized, author, people=(), english=""):
+    return {
+        "slug": slug,
+        "corpus_slug": "shenoute",
+        "title": title,
+        "corpus": "Shenoute",
+        "text": [
+            {"chapter": "1", "lemmatized": "", "normalized": "", "normalized_group": "", "english_translation": ""},
+            {
+                "chapter": "2",
+                "lemmatized": "",
+                "normalized": normalized,
+                "normalized_group": "",
+                "english_translation": english,
+            },
+        ],
+        "text_meta": {"author": author, "people": list(people), "corpus": "shenoute.a22"},
+    }
+
+
+DOCUMENTS = [
+    document("a22-yz", "Acephalous 22: YZ", "ⲁⲩⲱ ⲁⲛⲟⲕ ⲡⲉ ⲡⲛⲟⲩⲧⲉ", "Shenoute", people=["Jesus", "Paul"]),
+    document("a22-ya", "Acephalous 22: YA", "ⲁⲩⲱ ⲡⲣⲱⲙⲉ", "Shenoute", english="the man"),
+    document("besa-1", "Letter 1", "ⲡⲛⲟⲩⲧⲉ ⲡⲛⲟⲩⲧⲉ ⲡⲛⲟⲩⲧⲉ", "Besa"),
+]
+
+
+class TestQueries(SimpleTestCase):
+    def test_parse_filter(self):
+        self.assertEqual(
+            parse_filter('text_meta.author = "Shenoute" AND text_meta.people = "say \\"hi\\""'),
+            [("text_meta.author", "Shenoute"), ("text_meta.people", 'say "hi"')],
+        )
+        self.assertEqual(parse_filter(None), [])
+        with self.assertRaises(ValueError):
+            parse_filter("text_meta.author != Besa")
+
+    def test_match_query_prefix_matches_the_last_word(self):
+        self.assertEqual(match_query('ⲁⲩⲱ ⲡⲛⲟⲩ"'), '"ⲁⲩⲱ" "ⲡⲛⲟⲩ"""*')
+        self.assertIsNone(match_query("  "))
+
+
+class TestSqliteSearch(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        config = {**settings.SEARCH_CONFIG, "BACKEND": "sqlite", "SQLITE_DIR": self.directory, "DOCUMENT_LAYOUT": "text"}
+        overrides = override_settings(SEARCH_CONFIG=config)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.search = Search()
+        self.search.sync_settings()
+        task = self.search.wait_for_task(self.search.index_text(DOCUMENTS).task_uid)
+        self.assertEqual(task.status, "succeeded")
+
+    def test_search_dispatches_on_the_backend(self):
+        self.assertIsInstance(self.search, SqliteSearch)
+        self.assertTrue(self.search.search_available)
+        self.assertIsNone(self.search.sync_settings())
+
+    def test_ranked_full_text_search(self):
+        results = self.search.faceted_search("ⲡⲛⲟⲩⲧⲉ")
+        self.assertEqual([hit["slug"] for hit in results["hits"]], ["besa-1", "a22-yz"])
+        self.assertEqual(results["totalHits"], 2)
+        hit = results["hits"][1]
+        self.assertEqual(hit["_matchesPosition"], {"text.normalized": [{"start": 0, "length": 0, "indices": [1]}]})
+        self.assertIn('<span class="highlight">ⲡⲛⲟⲩⲧⲉ</span>', hit["_formatted"]["text"][1]["normalized"])
+
+    def test_prefix_search_and_metadata_matches(self):
+        self.assertEqual([hit["slug"] for hit in self.search.faceted_search("ⲡⲣⲱ")["hits"]], ["a22-ya"])
+        hit = self.search.search("paul")["hits"][0]
+        self.assertEqual(hit["slug"], "a22-yz")
+        self.assertIn("text_meta.people", hit["_matchesPosition"])
+        self.assertEqual(hit["_formatted"]["text_meta"]["people"], 'Jesus <span class="highlight">Paul</span>')
+
+    def test_facets_and_filters(self):
+        everything = self.search.faceted_search("", hits_per_page=2)
+        self.assertEqual(everything["totalHits"], 3)
+        self.assertEqual(everything["totalPages"], 2)
+        self.assertEqual(everything["facetDistribution"]["text_meta.author"], {"Shenoute": 2, "Besa": 1})
+        filtered = self.search.faceted_search("ⲁⲩⲱ", filters='text_meta.people = "Paul"')
+        self.assertEqual([hit["slug"] for hit in filtered["hits"]], ["a22-yz"])
+        self.assertEqual(filtered["facetDistribution"]["text_meta.people"], {"Jesus": 1, "Paul": 1})
+
+    def test_facets_are_counted_once_after_indexing(self):
+        self.search.index_text([document("besa-2", "Letter 2", "ⲁⲩⲱ", "Besa")])
+        self.search.index_text([document("besa-3", "Letter 3", "ⲁⲩⲱ", "Besa")])
+        db = sqlite3.connect(self.search.path)
+        self.addCleanup(db.close)
+        self.assertEqual(db.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        # Batches only mark the counts stale; the first search that shows them recounts
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM facet_counts").fetchone()[0], 0)
+        self.assertEqual(self.search.faceted_search("")["facetDistribution"]["text_meta.author"], {"Shenoute": 2, "Besa": 3})
+        self.assertEqual(db.execute("SELECT count FROM facet_counts WHERE value = 'Besa'").fetchone()[0], 3)
+        self.assertIsNone(db.execute("SELECT value FROM settings WHERE name = 'facet_counts'").fetchone())
+
+    def test_reindexing_replaces_documents(self):
+        self.search.index_text([document("besa-1", "Letter 1", "ⲁⲩⲱ", "Besa")])
+        self.assertEqual([hit["slug"] for hit in self.search.faceted_search("ⲡⲛⲟⲩⲧⲉ")["hits"]], ["a22-yz"])
+        self.assertEqual(self.search.faceted_search("")["totalHits"], 3)
+
+    def test_reindexed_passages_replace_all_the_old_ones(self):
+        config = {**settings.SEARCH_CONFIG, "DOCUMENT_LAYOUT": "passage"}
+        with override_settings(SEARCH_CONFIG=config):
+            search = Search(index="passages")
+            old = [{**document("besa-1", "Letter 1", "ⲡⲛⲟⲩⲧⲉ", "Besa"), "id": f"besa-besa-1-{i}"} for i in range(3)]
+            Indexer(search).index_documents(old)
+            Indexer(search).index_documents([{**document("besa-1", "Letter 1", "ⲁⲩⲱ", "Besa"), "id": "besa-besa-1-0"}])
+            self.assertEqual(search.faceted_search("ⲡⲛⲟⲩⲧⲉ")["hits"], [])
+            self.assertEqual(search.faceted_search("")["facetDistribution"]["text_meta.author"], {"Besa": 1})
+
+    def test_rebuild_into_shadow_and_swap(self):
+        shadow = self.search.shadow()
+        shadow.index_text(DOCUMENTS[:1])
+        self.search.replace_with(shadow)
+        self.assertFalse(os.path.exists(shadow.path))
+        self.assertEqual(self.search.faceted_search("")["totalHits"], 1)
+
+
+class TestFacetedSearchView(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config = {**settings.SEARCH_CONFIG, "BACKEND": "sqlite", "SQLITE_DIR": directory, "DOCUMENT_LAYOUT": "passage"}
+        overrides = override_settings(SEARCH_CONFIG=config)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_results_link_to_the_chapter_of_the_passage(self):
+        text = {**DOCUMENTS[1], "text_meta": {**DOCUMENTS[1]["text_meta"], "document_cts_urn": ""}}
+        passages = [
+            {**text, "id": f"shenoute-a22-ya-{position}", "chapter": chapter["chapter"], "position": position, "text": [chapter]}
+            for position, chapter in enumerate(text["text"])
+        ]
+        Indexer(Search()).index_documents(passages)
+        response = views.faceted_search(RequestFactory().get("/search/", {"text": "ⲡⲣⲱⲙⲉ"}))
+        self.assertContains(response, 'href="/texts/shenoute/a22-ya/analytic#chapter=2&text=%E2%B2%A1%E2%B2%A3%E2%B2%B1%E2%B2%99%E2%B2%89"')
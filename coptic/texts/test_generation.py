@@ -0,0 +1,56 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.views.decorators.cache import cache_page
+from texts import generation
+from texts.models import Corpus, Text, TextMeta
+
+
+class TestCachePagePerGeneration(TestCase):
+    def setUp(self):
+        cache.clear()
+        generation.reset()
+        self.addCleanup(cache.clear)
+        for slug in ("besa-letters", "shenoute-a22"):
+            corpus = Corpus.objects.create(title=slug, slug=slug, annis_corpus_name=slug)
+            Text.objects.create(corpus=corpus, slug=f"{slug}-1", title=f"Old title of {slug}")
+
+    def rename_texts(self):
+        for text in Text.objects.all():
+            text.title = text.title.replace("Old", "New")
+            text.save()
+
+    def test_ingest_invalidates_the_pages_of_its_corpus_only(self):
+        self.assertContains(self.client.get("/texts/besa-letters/"), "Old title of besa-letters")
+        self.assertContains(self.client.get("/texts/shenoute-a22/"), "Old title of shenoute-a22")
+        self.rename_texts()
+        self.assertContains(self.client.get("/texts/besa-letters/"), "Old title of besa-letters")
+        generation.bump("besa-letters")
+        self.assertContains(self.client.get("/texts/besa-letters/"), "New title of besa-letters")
+        self.assertContains(self.client.get("/texts/shenoute-a22/"), "Old title of shenoute-a22")
+
+    def test_facet_changes_invalidate_the_navigation_of_every_corpus(self):
+        self.assertContains(self.client.get("/texts/besa-letters/"), "Old title of besa-letters")
+        self.rename_texts()
+        generation.bump("shenoute-a22")
+        self.assertContains(self.client.get("/texts/besa-letters/"), "Old title of besa-letters")
+        Text.objects.get(slug="shenoute-a22-1").text_meta.add(TextMeta.objects.create(name="people", value="Paul"))
+        generation.bump("shenoute-a22")
+        self.assertContains(self.client.get("/texts/besa-letters/"), "New title of besa-letters")
+
+    def test_cached_view_is_built_once_per_generation(self):
+        generation.bump("besa-letters")
+        with mock.patch.object(generation, "cache_page", wraps=cache_page) as mock_cache_page:
+            for _ in range(3):
+                self.assertContains(self.client.get("/texts/besa-letters/"), "Old title of besa-letters")
+            self.assertEqual(mock_cache_page.call_count, 1)
+            generation.bump("besa-letters")
+            self.client.get("/texts/besa-letters/")
+            self.assertEqual(mock_cache_page.call_count, 2)
+
+    def test_generations(self):
+        self.assertEqual(generation.generations(), {})
+        value = generation.bump("besa-letters")
+        self.assertEqual(generation.generations(), {"": value, "besa-letters": value})
+        self.assertGreater(generation.bump(), value)
+        self.assertEqual(generation.generations()["besa-letters"], value)
@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import MagicMock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from texts.indexing import Indexer, iter_batches, iter_documents
+from texts.models import Corpus, Text, TextMeta
+
+
+class FakeSearch:
+    """Records how many indexing tasks are waiting at once."""
+
+    def __init__(self, failing_batches=()):
+        self.pending = set()
+        self.max_pending = 0
+        self.batches = []
+        self.deleted = []
+        self.failing_batches = failing_batches
+
+    def delete_text_documents(self, text_keys):
+        self.deleted.append(text_keys)
+
+    def index_text(self, documents):
+        self.batches.append(documents)
+        uid = len(self.batches)
+        self.pending.add(uid)
+        self.max_pending = max(self.max_pending, len(self.pending))
+        return MagicMock(task_uid=uid)
+
+    def wait_for_task(self, task_uid, timeout_ms=5000):
+        self.pending.remove(task_uid)
+        if task_uid in self.failing_batches:
+            return MagicMock(status="failed", error={"message": "boom"})
+        return MagicMock(status="succeeded", error=None)
+
+
+class TestBatches(unittest.TestCase):
+    def test_batches_by_count(self):
+        batches = list(iter_batches(({"slug": str(i)} for i in range(5)), batch_size=2))
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+
+    def test_batches_by_bytes(self):
+        documents = [{"slug": str(i), "text": "x" * 100} for i in range(4)]
+        batches = list(iter_batches(documents, batch_size=100, batch_bytes=250))
+        self.assertEqual([len(b) for b in batches], [2, 2])
+
+    def test_oversized_document_gets_its_own_batch(self):
+        documents = [{"text": "x" * 1000}, {"text": "y"}]
+        self.assertEqual([len(b) for b in iter_batches(documents, batch_bytes=100)], [1, 1])
+
+
+class TestIndexer(unittest.TestCase):
+    def test_in_flight_tasks_are_bounded(self):
+        search = FakeSearch()
+        reports = []
+        totals = Indexer(search, batch_size=1, max_in_flight=2, report=reports.append).index_documents(
+            {"slug": str(i)} for i in range(5)
+        )
+        self.assertEqual(search.max_pending, 2)
+        self.assertEqual(search.pending, set())
+        self.assertEqual((totals["batches"], totals["documents"], totals["failed"]), (5, 5, 0))
+        self.assertEqual([r["batch"] for r in reports], [1, 2, 3, 4, 5])
+
+    def test_failed_batches_are_reported(self):
+        reports = []
+        totals = Indexer(FakeSearch(failing_batches={2}), batch_size=2, report=reports.append).index_documents(
+            {"slug": str(i)} for i in range(4)
+        )
+        self.assertEqual(totals["failed"], 2)
+        self.assertEqual([r["failed"] for r in reports], [0, 2])
+        self.assertEqual(reports[1]["error"], {"message": "boom"})
+
+
+    def test_passages_of_a_text_are_replaced_before_its_first_batch(self):
+        search = FakeSearch()
+        documents = [{"corpus_slug": "besa", "slug": slug, "id": f"besa-{slug}-{i}"} for slug, i in [("a", 0), ("a", 1), ("b", 0)]]
+        with override_settings(SEARCH_CONFIG={**settings.SEARCH_CONFIG, "DOCUMENT_LAYOUT": "passage"}):
+            Indexer(search, batch_size=2).index_documents(documents)
+        self.assertEqual(search.deleted, [[("besa", "a")], [("besa", "b")]])
+        Indexer(search, batch_size=2).index_documents(documents)
+        self.assertEqual(len(search.deleted), 2)
+
+
+class TestIterDocuments(TestCase):
+    def test_documents_are_built_without_a_query_per_text(self):
+        corpus = Corpus.objects.create(title="Besa", slug="besa", annis_corpus_name="besa.letters")
+        for i in range(3):
+            text = Text.objects.create(corpus=corpus, title=f"Text {i}", slug=f"text-{i}")
+            text.text_meta.add(TextMeta.objects.create(name="author", value="Besa"))
+        with self.assertNumQueries(2):
+            documents = list(iter_documents(Text.objects.order_by("id")))
+        self.assertEqual([d["slug"] for d in documents], ["text-0", "text-1", "text-2"])
+        self.assertEqual(documents[0]["text_meta"], {"author": "Besa"})
+        self.assertEqual(documents[0]["corpus_slug"], "besa")
+
+    def test_passage_layout_has_a_document_per_chapter(self):
+        corpus = Corpus.objects.create(title="Besa", slug="besa", annis_corpus_name="besa.letters")
+        Text.objects.create(
+            corpus=corpus, title="Text", slug="text",
+            content='<chapter_n chapter_n="1">\n<norm norm="a">\n</chapter_n>\n<chapter_n chapter_n="2">\n<norm norm="b">\n</chapter_n>',
+        )
+        with override_settings(SEARCH_CONFIG={**settings.SEARCH_CONFIG, "DOCUMENT_LAYOUT": "passage"}):
+            documents = list(iter_documents(Text.objects.all()))
+        self.assertEqual([d["id"] for d in documents], ["besa-text-0", "besa-text-1"])
+        self.assertEqual([d["slug"] for d in documents], ["text", "text"])
+        self.assertEqual([d["chapter"] for d in documents], ["1", "2"])
+        self.assertEqual([d["text"][0]["normalized"] for d in documents], ["a", "b"])
+
+    def test_passages_of_a_text_without_corpus_are_keyed_by_its_id(self):
+        text = Text.objects.create(title="Text", slug="text", content='<norm norm="a">\n</norm>')
+        with override_settings(SEARCH_CONFIG={**settings.SEARCH_CONFIG, "DOCUMENT_LAYOUT": "passage"}):
+            documents = list(iter_documents(Text.objects.all()))
+        self.assertEqual([d["id"] for d in documents], [f"text-{text.id}-0"])
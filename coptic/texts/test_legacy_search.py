@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+import coptic.views as views
+from texts import facets
+from texts.models import Corpus, Text, TextMeta
+
+# Queries of a metadata search, whatever the number of results: the facet catalog
+# (until it is built), and the results.
+QUERY_BUDGET = 15
+
+
+class TestLegacySearch(TestCase):
+    def setUp(self):
+        cache.clear()
+        facets.reset()
+        self.addCleanup(cache.clear)
+        self.addCleanup(facets.reset)
+        corpora = [
+            Corpus.objects.create(title=f"Corpus {c}", slug=f"corpus-{c}", urn_code=f"urn:cts:copticLit:c{c}", annis_corpus_name=f"c{c}")
+            for c in range(3)
+        ]
+        for i in range(30):
+            text = Text.objects.create(
+                corpus=corpora[i % 3],
+                slug=f"text-{i}",
+                title=f"Text {i:02}",
+                document_cts_urn=f"urn:cts:copticLit:c{i % 3}.text{i}",
+                author="Shenoute",
+            )
+            text.text_meta.add(
+                TextMeta.objects.create(name="author", value="Shenoute"),
+                TextMeta.objects.create(name="people", value="Paul"),
+                TextMeta.objects.create(name="people", value="Peter"),
+                TextMeta.objects.create(name="corpus", value=f"c{i % 3}"),
+            )
+
+    def search(self, query):
+        return views.search(RequestFactory().get("/search/", query))
+
+    def test_metadata_search_stays_within_a_query_budget(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search({"author": ["Shenoute"], "people": ["Paul", "Peter"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), QUERY_BUDGET)
+        content = response.content.decode()
+        # Texts matching several values are listed once
+        self.assertIn("30 results for", content)
+        self.assertEqual(content.count('class="search-results-row"'), 30)
+        self.assertIn('<span class="text-urn">urn:cts:copticLit:c1.text1</span>', content)
+        self.assertIn('by <span class="text-author">Shenoute</span>', content)
+
+    def test_corpus_titles_in_the_explanation(self):
+        content = self.search({"corpus": ["c2"]}).content.decode()
+        self.assertIn("10 results for", content)
+        self.assertIn('<span class="meta_pair">Corpus 2</span>', content)
@@ -0,0 +1,92 @@
+import os
+import re
+import unittest
+from texts.sgml import extract_chapters
+
+EXAMPLE_TT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "gh_ingest", "docs", "example", "pilate.1643.27-28.tt",
+)
+
+CHAPTERS = """<meta title="Test" translation="none">
+<chapter_n chapter_n="2">
+<translation translation="The second">
+<norm_group norm_group="group2">
+<norm lemma="lemma2" norm="norm2">
+text2
+</norm>
+</norm_group>
+</translation>
+</chapter_n>
+<chapter_n chapter_n="1">
+<translation translation="...">
+<norm_group norm_group="group1">
+<norm lemma="lemma1" norm="norm1">
+text1
+</norm>
+</norm_group>
+</translation>
+</chapter_n>
+"""
+
+
+# How Text.get_text_chapters split the content before texts.sgml: numbered chapters only,
+# collected into a set.
+BASELINE_CHAPTER_REGEX = re.compile(r'<chapter_n chapter_n="\d+">(.*?)<\/chapter_n>', re.DOTALL)
+
+
+def baseline_fields(chapter):
+    """What to_json used to compute for a chapter, with one findall per field."""
+    return {
+        "lemmatized": " ".join(re.findall(r'lemma="([^"]*)"', chapter)),
+        "normalized": " ".join(re.findall(r'norm="([^"]*)"', chapter)),
+        "normalized_group": " ".join(re.findall(r'norm_group="([^"]*)"', chapter)),
+        "english_translation": " ".join(
+            t for t in re.findall(r'<translation translation="([^"]*)">', chapter) if t != "..."
+        ),
+    }
+
+
+class TestExtractChapters(unittest.TestCase):
+    def test_chapters_keep_document_order(self):
+        chapters = extract_chapters(CHAPTERS)
+        self.assertEqual([c["chapter"] for c in chapters], ["2", "1"])
+        self.assertEqual(chapters[0]["lemmatized"], "lemma2")
+        self.assertEqual(chapters[0]["english_translation"], "The second")
+        self.assertEqual(chapters[1]["normalized_group"], "group1")
+        self.assertEqual(chapters[1]["english_translation"], "")
+
+    def test_matches_the_previous_extraction(self):
+        expected = [
+            {"chapter": "2", "lemmatized": "lemma2", "normalized": "norm2", "normalized_group": "group2", "english_translation": "The second"},
+            {"chapter": "1", "lemmatized": "lemma1", "normalized": "norm1", "normalized_group": "group1", "english_translation": ""},
+        ]
+        self.assertEqual(extract_chapters(CHAPTERS), expected)
+        # The same chapters as before, now in document order rather than in set order
+        for chapter in expected:
+            del chapter["chapter"]
+        baseline = [baseline_fields(chapter) for chapter in set(BASELINE_CHAPTER_REGEX.findall(CHAPTERS))]
+        self.assertCountEqual(baseline, expected)
+
+    def test_matches_the_previous_extraction_of_the_example_text(self):
+        with open(EXAMPLE_TT, encoding="utf-8") as f:
+            content = f.read()
+        chapters = extract_chapters(content)
+        self.assertEqual([chapter.pop("chapter") for chapter in chapters], ["9"])
+        self.assertEqual(chapters, [baseline_fields(chapter) for chapter in BASELINE_CHAPTER_REGEX.findall(content)])
+        chapter = chapters[0]
+        self.assertEqual([len(chapter[field].split()) for field in ("lemmatized", "normalized", "normalized_group")], [461, 461, 231])
+        self.assertTrue(chapter["lemmatized"].startswith("ϫⲉ ⲁ ⲟⲩ ⲥⲧⲁⲥⲓⲥ ϣⲱⲡⲉ . ⲡⲉϫⲉ ⲛⲧⲟⲟⲩ"))
+        self.assertTrue(chapter["normalized"].startswith("ϫⲉ ⲁ ⲟⲩ ⲥⲧⲁⲥⲓⲥ ϣⲱⲡⲉ . ⲡⲉϫⲁ ⲩ ⲛⲁ ϥ"))
+        self.assertTrue(chapter["normalized_group"].startswith("ϫⲉⲁⲟⲩⲥⲧⲁⲥⲓⲥ ϣⲱⲡⲉ . ⲡⲉϫⲁⲩ ⲛⲁϥ"))
+        self.assertEqual(chapter["english_translation"], "")
+
+    def test_text_without_chapters_is_one_chapter(self):
+        chapters = extract_chapters('<norm lemma="a" norm="b">\nb\n</norm>')
+        self.assertEqual(len(chapters), 1)
+        self.assertIsNone(chapters[0]["chapter"])
+        self.assertEqual(chapters[0]["normalized"], "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
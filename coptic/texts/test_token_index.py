@@ -0,0 +1,256 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from texts import token_index
+from texts.models import Corpus, Text, TextMeta
+from texts.token_index import TokenIndex, build, word_spans, encode_deltas, decode_deltas
+
+EXAMPLE_TT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "gh_ingest", "docs", "example", "pilate.1643.27-28.tt",
+)
+
+
+def tt(*chapters):
+    """A TT document of chapters, each a list of norm groups, each a list of (lemma, norm)."""
+    lines = []
+    for number, groups in enumerate(chapters, 1):
+        lines.append(f'<chapter_n chapter_n="{number}">')
+        for group in groups:
+            lines.append(f'<norm_group norm_group="{"".join(norm for _, norm in group)}">')
+            for lemma, norm in group:
+                lines += [f'<norm pos="N" lemma="{lemma}" norm="{norm}">', norm, "</norm>"]
+            lines.append("</norm_group>")
+        lines.append("</chapter_n>")
+    return "\n".join(lines)
+
+
+class TestWordSpans(TestCase):
+    def test_spans_are_counted_in_words(self):
+        words, spans = word_spans(tt([[("ⲡ", "ⲡ"), ("ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ")]], [[("ϫⲉ", "ϫⲉ")]]), ("lemma", "norm_group", "chapter_n"))
+        self.assertEqual(words, 3)
+        self.assertEqual(spans["lemma"], [("ⲡ", 0, 1), ("ⲣⲱⲙⲉ", 1, 2), ("ϫⲉ", 2, 3)])
+        self.assertEqual(spans["norm_group"], [("ⲡⲣⲱⲙⲉ", 0, 2), ("ϫⲉ", 2, 3)])
+        self.assertEqual(spans["chapter_n"], [("1", 0, 2), ("2", 2, 3)])
+
+    def test_words_of_the_example_document(self):
+        content = open(EXAMPLE_TT, encoding="utf-8").read()
+        words, spans = word_spans(content, ("norm",))
+        self.assertEqual(words, content.count("<norm "))
+        self.assertEqual(spans["norm"][:2], [("ϫⲉ", 0, 1), ("ⲁ", 1, 2)])
+
+    def test_elements_inside_a_word_label_it(self):
+        words, spans = word_spans(open(EXAMPLE_TT, encoding="utf-8").read(), ("lang", "orig"))
+        # <lang lang="Greek"> is inside the fourth <norm>, ⲥⲧⲁⲥⲓⲥ
+        self.assertEqual(spans["lang"][0], ("Greek", 3, 4))
+        self.assertEqual(spans["orig"][:2], [("ϫⲉ", 0, 1), ("ⲁ̇", 1, 2)])
+
+
+ANNOTATED = """<chapter_n chapter_n="3">
+<verse_n verse_n="7">
+<translation translation="The man believed in the soul">
+<orig orig="ⲁⲡⲣⲱⲙⲉ">
+<norm pos="APST" lemma="ⲁ" norm="ⲁ">
+ⲁ
+</norm>
+<norm pos="ART" lemma="ⲡ" norm="ⲡ">
+ⲡ
+</norm>
+<norm pos="N" lemma="ⲣⲱⲙⲉ" norm="ⲣⲱⲙⲉ">
+ⲣⲱⲙⲉ
+</norm>
+</orig>
+<orig orig="ⲡⲓⲥⲧⲉⲩⲉ">
+<norm pos="V" lemma="ⲡⲓⲥⲧⲉⲩⲉ" norm="ⲡⲓⲥⲧⲉⲩⲉ">
+<lang lang="Greek">
+ⲡⲓⲥⲧⲉⲩⲉ
+</lang>
+</norm>
+</orig>
+<orig orig="ⲉⲯⲩⲭⲏ">
+<norm pos="PREP" lemma="ⲉ" norm="ⲉ">
+ⲉ
+</norm>
+<norm pos="N" lemma="ⲯⲩⲭⲏ" norm="ⲯⲩⲭⲏ">
+<lang lang="Greek">
+ⲯⲩⲭⲏ
+</lang>
+</norm>
+</orig>
+</translation>
+</verse_n>
+</chapter_n>"""
+
+
+class TestDeltas(TestCase):
+    def test_round_trip(self):
+        values = [0, 1, 127, 128, 300, 70000, 2**32 - 1]
+        self.assertEqual(decode_deltas(encode_deltas(values)), values)
+        self.assertEqual(len(encode_deltas([5, 6, 7])), 3)
+
+
+class TestTokenIndex(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(TOKEN_INDEX_DIR=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        token_index.reset()
+        self.addCleanup(token_index.reset)
+        corpus = Corpus.objects.create(title="Besa", slug="besa", annis_corpus_name="besa.letters")
+        Text.objects.create(
+            corpus=corpus, title="One", slug="one",
+            content=tt([[("ⲡ", "ⲡ"), ("ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ")]], [[("ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ")]]),
+        )
+        Text.objects.create(corpus=corpus, title="Empty", slug="empty", content="")
+        Text.objects.create(corpus=corpus, title="Two", slug="two", content=tt([[("ϫⲉ", "ϫⲉ"), ("ⲣⲱⲙⲉ", "ⲛⲣⲱⲙⲉ")]]))
+
+    def build(self):
+        return TokenIndex(build(Text.objects.order_by("id")))
+
+    def test_lookup_returns_texts_chapters_and_offsets(self):
+        index = self.build()
+        self.assertEqual(index.words, 5)
+        self.assertEqual(index.frequency("lemma", "ⲣⲱⲙⲉ"), 3)
+        self.assertEqual(
+            [(hit["slug"], hit["chapter"], hit["offset"]) for hit in index.lookup("lemma", "ⲣⲱⲙⲉ")],
+            [("one", "1", 1), ("one", "2", 2), ("two", "1", 1)],
+        )
+        self.assertEqual([hit["slug"] for hit in index.lookup("norm", "ⲣⲱⲙⲉ")], ["one", "one"])
+        self.assertEqual([hit["offset"] for hit in index.lookup("norm_group", "ϫⲉⲛⲣⲱⲙⲉ")], [0])
+        self.assertEqual(index.lookup("lemma", "ⲛⲟⲩⲧⲉ"), [])
+        self.assertEqual(index.lookup("lemma", ""), [])
+        with self.assertRaises(ValueError):
+            index.lookup("gloss", "man")
+
+    def test_concordance_slices_context_within_the_text(self):
+        index = self.build()
+        hits = index.concordance("lemma", "ⲣⲱⲙⲉ", context=1)
+        self.assertEqual(
+            [(hit["slug"], hit["left"], hit["match"], hit["right"]) for hit in hits],
+            [("one", ["ⲡ"], ["ⲣⲱⲙⲉ"], ["ⲣⲱⲙⲉ"]), ("one", ["ⲣⲱⲙⲉ"], ["ⲣⲱⲙⲉ"], []), ("two", ["ϫⲉ"], ["ⲛⲣⲱⲙⲉ"], [])],
+        )
+        self.assertEqual(index.concordance("norm_group", "ⲡⲣⲱⲙⲉ")[0]["match"], ["ⲡ", "ⲣⲱⲙⲉ"])
+        self.assertEqual([hit["offset"] for hit in index.concordance("lemma", "ⲣⲱⲙⲉ", start=1, stop=2)], [2])
+
+    def test_adjacent_spans_of_the_same_value_are_separate_hits(self):
+        Text.objects.create(content=tt([[("ⲁⲩⲱ", "ⲁⲩⲱ")], [("ⲁⲩⲱ", "ⲁⲩⲱ")]]), slug="twice", title="Twice")
+        hits = self.build().concordance("norm_group", "ⲁⲩⲱ", context=1)
+        self.assertEqual([(hit["left"], hit["match"], hit["right"]) for hit in hits], [([], ["ⲁⲩⲱ"], ["ⲁⲩⲱ"]), (["ⲁⲩⲱ"], ["ⲁⲩⲱ"], [])])
+
+    def test_ngrams(self):
+        Corpus.objects.create(title="Shenoute", slug="shenoute", annis_corpus_name="shenoute.a22")
+        Text.objects.create(
+            corpus=Corpus.objects.get(slug="shenoute"), title="Three", slug="three",
+            content=tt([[("ⲡ", "ⲡ"), ("ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ")], [("ⲡ", "ⲡ"), ("ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ")]]),
+        )
+        index = self.build()
+        self.assertEqual(index.ngram_frequency("norm", ["ⲡ", "ⲣⲱⲙⲉ"]), 3)
+        self.assertEqual(
+            [(hit["slug"], hit["offset"]) for hit in index.ngram_lookup("norm", ["ⲡ", "ⲣⲱⲙⲉ"])],
+            [("one", 0), ("three", 0), ("three", 2)],
+        )
+        self.assertEqual(index.corpus_distribution(index.ngram_occurrences("norm", ["ⲡ", "ⲣⲱⲙⲉ"])), {"besa": 1, "shenoute": 2})
+        # N-grams of norm groups count groups, not words
+        self.assertEqual(index.ngram_frequency("norm_group", ["ⲡⲣⲱⲙⲉ", "ⲡⲣⲱⲙⲉ"]), 1)
+        self.assertEqual(index.ngram_frequency("pos", ["N"] * 4), 1)
+        self.assertEqual(index.ngram_frequency("pos", ["N"] * 5), 0)
+        # N-grams don't run from one text into the next
+        self.assertEqual(index.ngram_frequency("norm", ["ⲣⲱⲙⲉ", "ϫⲉ"]), 0)
+        self.assertEqual(index.ngram_frequency("norm", ["ⲣⲱⲙⲉ", "ⲛⲟⲩⲧⲉ"]), 0)
+        with self.assertRaises(ValueError):
+            index.ngram_frequency("norm", ["ⲡ"] * 6)
+        with self.assertRaises(ValueError):
+            index.ngram_frequency("lemma", ["ⲡ"])
+
+    def test_colliding_ngram_keys_are_told_apart(self):
+        # Every n-gram hashes to 0
+        with patch("texts.token_index.FNV_PRIME", 0):
+            index = self.build()
+            self.assertEqual(set(index.ngrams["norm", 2]["keys"]), {0})
+            self.assertEqual(index.ngram_frequency("norm", ["ⲡ", "ⲣⲱⲙⲉ"]), 1)
+            self.assertEqual(index.ngram_frequency("norm", ["ϫⲉ", "ⲛⲣⲱⲙⲉ"]), 1)
+            self.assertEqual(index.ngram_frequency("norm", ["ⲣⲱⲙⲉ", "ⲣⲱⲙⲉ"]), 1)
+
+    def test_annotation_queries(self):
+        shenoute = Corpus.objects.create(title="Shenoute", slug="shenoute", annis_corpus_name="shenoute.a22")
+        text = Text.objects.create(corpus=shenoute, title="Annotated", slug="annotated", content=ANNOTATED)
+        index = self.build()
+        greek_nouns = index.query({"pos": "N", "lang": "Greek"})
+        self.assertEqual([index.values(p, p + 1)[0] for p in greek_nouns], ["ⲯⲩⲭⲏ"])
+        self.assertEqual(len(index.query({"pos": "N"})), 7)
+        self.assertEqual(len(index.query({"pos": ["N", "V"], "lang": "Greek"})), 2)
+        self.assertEqual(len(index.query({"pos": "N"}, corpora=["shenoute"])), 2)
+        self.assertEqual(len(index.query({"pos": "N"}, text_ids=[text.id])), 2)
+        self.assertEqual(index.query({"pos": "N", "lang": "Coptic"}), [])
+        # Every word under a multi-word span matches it
+        self.assertEqual(len(index.query({"orig": "ⲁⲡⲣⲱⲙⲉ"})), 3)
+        citation = index.cite(greek_nouns[0])
+        self.assertEqual(
+            (citation["slug"], citation["chapter"], citation["verse"], citation["translation"], citation["offset"]),
+            ("annotated", "3", "7", "The man believed in the soul", 5),
+        )
+        self.assertEqual(citation["word"]["orig"], "ⲉⲯⲩⲭⲏ")
+        self.assertEqual(citation["word"]["norm_group"], "")
+        with self.assertRaises(ValueError):
+            index.query({})
+
+    def test_new_builds_replace_the_current_one(self):
+        first = build(Text.objects.order_by("id"))
+        self.assertEqual(token_index.get_token_index().directory, first)
+        Text.objects.filter(slug="two").delete()
+        second = build(Text.objects.order_by("id"))
+        third = build(Text.objects.order_by("id"))
+        self.assertEqual(token_index.current_build(), os.path.basename(third))
+        # The previous build is kept for processes that haven't switched yet
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        token_index.reset()
+        self.assertEqual(token_index.get_token_index().frequency("lemma", "ϫⲉ"), 0)
+
+    def test_occurrences_endpoint(self):
+        response = self.client.get(reverse("occurrences", args=["lemma"]), {"q": "ⲣⲱⲙⲉ"})
+        self.assertEqual(response.status_code, 503)
+        self.build()
+        token_index.reset()
+        response = self.client.get(reverse("occurrences", args=["lemma"]), {"q": "ⲣⲱⲙⲉ"})
+        self.assertEqual(response.json()["total"], 3)
+        self.assertEqual(response.json()["occurrences"][2]["corpus_slug"], "besa")
+        self.assertEqual(self.client.get(reverse("occurrences", args=["gloss"]), {"q": "man"}).status_code, 404)
+        response = self.client.get(reverse("ngrams", args=["norm"]), {"q": "ϫⲉ ⲛⲣⲱⲙⲉ"}).json()
+        self.assertEqual((response["total"], response["corpora"]), (1, {"besa": 1}))
+        self.assertEqual(response["occurrences"][0]["slug"], "two")
+        self.assertEqual(self.client.get(reverse("ngrams", args=["norm"]), {"q": ""}).status_code, 400)
+
+    def test_tokens_endpoint(self):
+        shenoute = Corpus.objects.create(title="Shenoute", slug="shenoute", annis_corpus_name="shenoute.a22")
+        text = Text.objects.create(corpus=shenoute, title="Annotated", slug="annotated", content=ANNOTATED)
+        text.text_meta.add(TextMeta.objects.create(name="author", value="Shenoute"))
+        self.build()
+        token_index.reset()
+        response = self.client.get(reverse("tokens"), {"pos": "N", "author": "Shenoute"}).json()
+        self.assertEqual((response["total"], response["corpora"]), (2, {"shenoute": 2}))
+        self.assertEqual([t["word"]["norm"] for t in response["tokens"]], ["ⲣⲱⲙⲉ", "ⲯⲩⲭⲏ"])
+        response = self.client.get(reverse("tokens"), {"pos": "N", "corpus": "besa"}).json()
+        self.assertEqual(response["total"], 5)
+        response = self.client.get(reverse("tokens"), {"pos": "N", "author": "Shenoute", "corpus": "besa"}).json()
+        self.assertEqual(response["total"], 0)
+        self.assertEqual(self.client.get(reverse("tokens"), {"author": "Shenoute"}).status_code, 400)
+
+    def test_concordance_endpoints(self):
+        self.build()
+        token_index.reset()
+        url = reverse("concordance_api", args=["lemma"])
+        page = self.client.get(url, {"q": "ⲣⲱⲙⲉ", "context": "2"}).json()
+        self.assertEqual((page["total"], page["total_pages"], page["context"]), (3, 1, 2))
+        self.assertEqual(page["hits"][0]["left"], ["ⲡ"])
+        response = self.client.get(url, {"q": "ⲣⲱⲙⲉ", "format": "csv", "context": "1"})
+        rows = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(rows[0], "corpus_slug,slug,title,chapter,offset,left,match,right")
+        self.assertEqual(rows[1:], ["besa,one,One,1,1,ⲡ,ⲣⲱⲙⲉ,ⲣⲱⲙⲉ", "besa,one,One,2,2,ⲣⲱⲙⲉ,ⲣⲱⲙⲉ,", "besa,two,Two,1,1,ϫⲉ,ⲛⲣⲱⲙⲉ,"])
+        html = self.client.get(reverse("concordance"), {"layer": "norm", "q": "ⲣⲱⲙⲉ"})
+        self.assertContains(html, '<td class="concordance-match"><span class="highlight">ⲣⲱⲙⲉ</span></td>', count=2)
@@ -0,0 +1,71 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from texts import generation, urn_resolver
+from texts.models import Corpus, DataGeneration, Text
+from texts.urn_resolver import urn_path
+
+DEPRECATED = {"urn:cts:copticLit:shenoute.a22.monbyb_307_320": "urn:cts:copticLit:shenoute.a22.monbyb:801-825"}
+
+
+@override_settings(DEPRECATED_URNS=DEPRECATED)
+class TestUrnResolver(TestCase):
+    def setUp(self):
+        self.corpus = Corpus.objects.create(
+            title="Acephalous 22",
+            slug="shenoute-a22",
+            urn_code="urn:cts:copticLit:shenoute.a22",
+            annis_corpus_name="shenoute.a22",
+            github="https://github.com/CopticScriptorium/corpora/tree/master/shenoute-a22",
+        )
+        for slug, urn in [
+            ("yb-801", "urn:cts:copticLit:shenoute.a22.monbyb:801-825"),
+            ("ya-1", "urn:cts:copticLit:shenoute.a22.monbya:1-4"),
+            ("a2", "urn:cts:copticLit:shenoute.a2.monbya:1"),
+        ]:
+            Text.objects.create(corpus=self.corpus, slug=slug, title=slug, document_cts_urn=urn)
+        urn_resolver.reset()
+        self.addCleanup(urn_resolver.reset)
+
+    def test_urn_path(self):
+        self.assertEqual(urn_path("urn:cts:X.y:1"), ["urn", ":", "cts", ":", "x", ".", "y", ":", "1"])
+
+    def test_resolve_texts_corpora_and_deprecated_urns(self):
+        resolver = urn_resolver.get_resolver()
+        self.assertEqual(resolver.resolve("urn:cts:copticLit:shenoute.a22.monbya:1-4").slug, "ya-1")
+        self.assertEqual(resolver.resolve("URN:CTS:copticlit:shenoute.a22.monbya:1-4").slug, "ya-1")
+        self.assertEqual(resolver.resolve("urn:cts:copticLit:shenoute.a22"), self.corpus)
+        self.assertEqual(resolver.resolve("urn:cts:copticLit:shenoute.a22.monbyb_307_320").slug, "yb-801")
+        self.assertIsNone(resolver.resolve("urn:cts:copticLit:shenoute.a22.monbya"))
+        self.assertIsNone(resolver.resolve("urn:cts:copticLit:besa"))
+
+    def test_texts_under_stop_at_part_boundaries(self):
+        resolver = urn_resolver.get_resolver()
+        self.assertEqual(
+            [text.slug for text in resolver.texts_under("urn:cts:copticLit:shenoute.a22")], ["ya-1", "yb-801"]
+        )
+        self.assertEqual([text.slug for text in resolver.texts_under("urn:cts:copticLit:shenoute")], ["a2", "ya-1", "yb-801"])
+        self.assertEqual(resolver.texts_under("urn:cts:copticLit:shenoute.a22.monby"), [])
+
+    def test_rebuilds_after_ingest_bumps_the_generation(self):
+        resolver = urn_resolver.get_resolver()
+        Text.objects.create(corpus=self.corpus, slug="yc", title="yc", document_cts_urn="urn:cts:copticLit:shenoute.a22.monbyc:1")
+        with mock.patch.object(generation, "CHECK_INTERVAL", -1):
+            self.assertIs(urn_resolver.get_resolver(), resolver)
+            self.assertGreater(generation.bump("shenoute-a22"), 0)
+            self.assertEqual(urn_resolver.get_resolver().resolve("urn:cts:copticLit:shenoute.a22.monbyc:1").slug, "yc")
+        self.assertEqual(DataGeneration.objects.get(name="shenoute-a22").value, generation.current())
+        self.assertEqual(generation.current("besa-letters"), 0)
+
+    def test_urn_and_citation_redirects(self):
+        response = self.client.get("/urn:cts:copticLit:shenoute.a22.monbyb_307_320/")
+        self.assertRedirects(response, "/texts/shenoute-a22/yb-801/", fetch_redirect_response=False)
+        response = self.client.get("/urn:cts:copticLit:shenoute.a22/")
+        self.assertRedirects(response, "/texts/shenoute-a22/", fetch_redirect_response=False)
+        response = self.client.get("/urn:cts:copticLit:shenoute.a22.monbya:1-4/norm/html")
+        self.assertRedirects(response, "/texts/shenoute-a22/ya-1/norm", fetch_redirect_response=False)
+        response = self.client.get("/urn:cts:copticLit:shenoute.a22/tei/xml")
+        self.assertRedirects(
+            response,
+            "https://github.com/CopticScriptorium/corpora/tree/master/shenoute-a22/shenoute.a22_TEI",
+            fetch_redirect_response=False,
+        )
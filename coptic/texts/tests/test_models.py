@@ -1,6 +1,6 @@
 from django.test import TestCase
 from django.conf import settings
-from texts.models import HtmlVisualization, Corpus, Text, TextMeta
+from texts.models import HtmlVisualization, Corpus, Text, TextMeta, RenderedVisualization, TermFrequency, VisualizationStyle
 import json
 
 
@@ -79,6 +79,129 @@ class TestHtmlVisualization(TestCase):
 
 
 
+class TestRenderedVisualization(TestCase):
+    def setUp(self):
+        self.corpus = Corpus.objects.create(
+            title="Test Corpus",
+            slug="test-corpus",
+            urn_code="urn:test:corpus",
+            annis_corpus_name="test.corpus",
+        )
+        self.text = Text.objects.create(
+            corpus=self.corpus,
+            slug="text1",
+            title="Text 1",
+            content='<norm_group norm_group="ϭⲟⲗ">\n<norm norm="ϭⲟⲗ">\nϭⲟⲗ\n</norm>\n</norm_group>',
+        )
+        self.visualization = HtmlVisualization.objects.create(
+            visualization_format_slug="norm",
+            config='norm_group\ti; style="copt_word"\ntok\tspan',
+        )
+        self.text.html_visualizations.add(self.visualization)
+
+    def test_html_live_renders_once(self):
+        self.assertEqual(RenderedVisualization.objects.count(), 0)
+        html = self.visualization.html_live
+        self.assertEqual(RenderedVisualization.objects.count(), 1)
+        self.assertEqual(self.visualization.html_live, html)
+        self.assertEqual(RenderedVisualization.objects.count(), 1)
+
+    def test_prerender_skips_existing(self):
+        pairs = [(self.text, self.visualization)]
+        self.assertEqual(RenderedVisualization.prerender(pairs), 1)
+        self.assertEqual(RenderedVisualization.prerender(pairs), 0)
+        self.assertEqual(RenderedVisualization.lookup(self.text, self.visualization), self.visualization.html_live)
+
+    def test_prune_drops_renders_of_deleted_texts(self):
+        RenderedVisualization.prerender([(self.text, self.visualization)])
+        self.text.delete()
+        RenderedVisualization.prune()
+        self.assertEqual(RenderedVisualization.objects.count(), 0)
+
+    def test_prune_drops_renders_of_unused_configs(self):
+        RenderedVisualization.prerender([(self.text, self.visualization)])
+        self.text.html_visualizations.clear()
+        self.visualization.delete()
+        VisualizationStyle.prune()
+        RenderedVisualization.prune()
+        self.assertEqual(RenderedVisualization.objects.count(), 0)
+
+    def test_prune_keeps_live_renders(self):
+        RenderedVisualization.prerender([(self.text, self.visualization)])
+        RenderedVisualization.prune()
+        self.assertEqual(RenderedVisualization.objects.count(), 1)
+
+
+class TestVisualizationStyle(TestCase):
+    def test_visualizations_share_a_style(self):
+        first = HtmlVisualization.objects.create(visualization_format_slug="norm", config="tok\tspan", css="span {}")
+        second = HtmlVisualization.objects.create(visualization_format_slug="norm", config="tok\tspan", css="span {}")
+        self.assertEqual(VisualizationStyle.objects.count(), 1)
+        self.assertEqual(first.style_id, second.style_id)
+        second = HtmlVisualization.objects.get(id=second.id)
+        self.assertEqual((second.config, second.css), ("tok\tspan", "span {}"))
+
+    def test_prune_drops_unused_styles(self):
+        vis = HtmlVisualization.objects.create(visualization_format_slug="norm", config="tok\tspan", css="span {}")
+        vis.delete()
+        VisualizationStyle.prune()
+        self.assertEqual(VisualizationStyle.objects.count(), 0)
+
+    def test_css_is_served_with_long_cache_headers(self):
+        vis = HtmlVisualization.objects.create(visualization_format_slug="norm", config="tok\tspan", css="span {}")
+        response = self.client.get(f"/css/{vis.style.hash}.css")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"span {}")
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+def lemma(lemma, norm):
+    return f'<norm norm="{norm}">\n<lemma lemma="{lemma}">\n{norm}\n</lemma>\n</norm>'
+
+
+class TestTermFrequency(TestCase):
+    def setUp(self):
+        self.corpus = Corpus.objects.create(
+            title="Test Corpus",
+            slug="test-corpus",
+            urn_code="urn:test:corpus",
+            annis_corpus_name="test.corpus",
+        )
+        self.texts = [
+            Text.objects.create(
+                corpus=self.corpus, slug="text1", title="Text 1",
+                content="\n".join([lemma("ⲛⲟⲩⲧⲉ", "ⲡⲛⲟⲩⲧⲉ"), lemma("ⲛⲟⲩⲧⲉ", "ⲛⲟⲩⲧⲉ"), lemma("ⲣⲱⲙⲉ", "ⲡⲣⲱⲙⲉ")]),
+            ),
+            Text.objects.create(corpus=self.corpus, slug="text2", title="Text 2", content=lemma("ⲛⲟⲩⲧⲉ", "ⲡⲛⲟⲩⲧⲉ")),
+        ]
+        TermFrequency.objects.bulk_create(TermFrequency.for_corpus(self.corpus, self.texts))
+
+    def test_ranked_lists_of_the_corpus_and_its_texts(self):
+        self.assertEqual(
+            list(TermFrequency.ranked(self.corpus, "lemma").values_list("term", "count")), [("ⲛⲟⲩⲧⲉ", 3), ("ⲣⲱⲙⲉ", 1)]
+        )
+        self.assertEqual(
+            list(TermFrequency.ranked(self.corpus, "norm", self.texts[0]).values_list("term", "count")),
+            [("ⲛⲟⲩⲧⲉ", 1), ("ⲡⲛⲟⲩⲧⲉ", 1), ("ⲡⲣⲱⲙⲉ", 1)],
+        )
+
+    def test_frequencies_endpoint(self):
+        response = self.client.get("/api/frequencies/test-corpus/norm/")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["types"], data["tokens"], data["total_pages"]), (3, 4, 1))
+        self.assertEqual(data["frequencies"][0], {"term": "ⲡⲛⲟⲩⲧⲉ", "count": 2})
+        data = self.client.get("/api/frequencies/test-corpus/text2/lemma/").json()
+        self.assertEqual(data["frequencies"], [{"term": "ⲛⲟⲩⲧⲉ", "count": 1}])
+        response = self.client.get("/api/frequencies/test-corpus/lemma/?format=csv")
+        self.assertEqual(b"".join(response.streaming_content).decode("utf-8"), "term,count\r\nⲛⲟⲩⲧⲉ,3\r\nⲣⲱⲙⲉ,1\r\n")
+
+    def test_frequencies_endpoint_not_found(self):
+        self.assertEqual(self.client.get("/api/frequencies/test-corpus/pos/").status_code, 404)
+        self.assertEqual(self.client.get("/api/frequencies/other/norm/").status_code, 404)
+        self.assertEqual(self.client.get("/api/frequencies/test-corpus/text3/norm/").status_code, 404)
+
+
 class TestTextModel(TestCase):
     def setUp(self):
         self.corpus = Corpus.objects.create(
@@ -0,0 +1,591 @@
+"""A positional index of the words of every text, for exact lemma and norm lookups.
+
+A word is a <norm> element of the TT SGML, as parsed by htmlvis.parse_text. Words are
+numbered across the whole collection, text after text, so an occurrence is a single
+uint32: its global position. For every layer (an SGML element whose attribute of the same
+name labels the words it spans: lemma, norm, pos, lang...) a build writes
+
+    <layer>.terms.json      the distinct values; a value's term id is its index
+    <layer>.column.u32      the term id of every word
+    <layer>.postings.u32    the position of the first word of every span, grouped by term
+    <layer>.offsets.u32     where each term's postings start; term t is [offsets[t], offsets[t + 1])
+
+For the n-gram layers, a run of n consecutive spans (n = 1..MAX_NGRAM, never across
+texts) is keyed by a 64 bit FNV-1a hash of its term ids, and every n writes
+
+    <layer>.<n>gram.keys.u64        the hashes, sorted
+    <layer>.<n>gram.grams.u32       the n term ids of each key, to tell apart colliding n-grams
+    <layer>.<n>gram.counts.u32      the number of occurrences of each key
+    <layer>.<n>gram.offsets.u64     where each key's postings start in the .varint file
+    <layer>.<n>gram.postings.varint the positions of its occurrences, delta and varint encoded
+
+Elements used to cite a word (chapters, verses, translations) get span tables instead:
+
+    <element>.terms.json    the distinct values
+    <element>.starts.u32, <element>.ends.u32, <element>.values.u32
+                            the first position, end position and term id of every span
+
+index.json lists the texts (their first position and length) and the layers.
+The arrays are memory-mapped by every process reading the index, so lookups are slices,
+and so is the context of a concordance hit: the norm column around its position.
+
+Builds go to a fresh directory under TOKEN_INDEX_DIR. The CURRENT file names the build
+readers should use; it is replaced once the build is complete."""
+import bisect
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from gh_ingest.htmlvis import parse_text
+
+WORD_ELEMENT = "norm"
+CHAPTER_ELEMENT = "chapter_n"
+VERSE_ELEMENT = "verse_n"
+TRANSLATION_ELEMENT = "translation"
+LAYERS = ("lemma", "norm", "norm_group", "pos", "lang", "orig")
+SPAN_ELEMENTS = (CHAPTER_ELEMENT, VERSE_ELEMENT, TRANSLATION_ELEMENT)
+NGRAM_LAYERS = ("norm", "norm_group", "pos")
+MAX_NGRAM = 5
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+HASH_MASK = (1 << 64) - 1
+# The layer shown as the context of concordance hits, and how many words of it by default
+CONTEXT_LAYER = "norm"
+DEFAULT_CONTEXT = 5
+# Term id of the words a layer has no span over
+NO_TERM = 0
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.json"
+# Builds kept besides the current one, for processes that haven't switched yet
+KEEP_PREVIOUS_BUILDS = 1
+# How long a process trusts its index before looking for a newer build
+RELOAD_CHECK_INTERVAL = 30
+
+assert array("I").itemsize == 4 and array("Q").itemsize == 8
+
+
+def word_spans(content, names):
+    """The number of words of a TT document, and for every element name in `names` its
+    (value, first word, end word) spans in document order. An element spans the words it
+    overlaps, so a <lang> inside a <norm> labels that word. Elements spanning no word are
+    dropped."""
+    _, elts = parse_text(content)
+    words = sorted((e.open_line, e.close_line) for e in elts if e.name == WORD_ELEMENT and e.close_line >= e.open_line)
+    word_opens = [open_line for open_line, _ in words]
+    spans = {name: [] for name in names}
+    for elt in elts:
+        if elt.name in spans and elt.close_line >= elt.open_line:
+            start = bisect.bisect_right(word_opens, elt.open_line) - 1
+            if start < 0 or words[start][1] < elt.open_line:
+                start += 1
+            end = bisect.bisect_right(word_opens, elt.close_line)
+            if start < end:
+                spans[elt.name].append((elt.attrs.get(elt.name, ""), start, end))
+    for name_spans in spans.values():
+        name_spans.sort(key=lambda span: span[1])
+    return len(words), spans
+
+
+def count_terms(content, layers):
+    """{layer: Counter of the values of its spans} for a TT document. Words without a
+    value in a layer aren't counted."""
+    _, spans = word_spans(content, layers)
+    return {layer: Counter(value for value, _, _ in spans[layer] if value) for layer in layers}
+
+
+def ngram_key(term_ids):
+    """The FNV-1a hash of a sequence of term ids."""
+    key = FNV_OFFSET
+    for term in term_ids:
+        key = ((key ^ term) * FNV_PRIME) & HASH_MASK
+    return key
+
+
+def encode_deltas(values):
+    """Varint encoding of the differences between consecutive values of an ascending sequence."""
+    encoded = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            encoded.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return encoded
+
+
+def decode_deltas(encoded):
+    values = []
+    value = delta = shift = 0
+    for byte in encoded:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            value += delta
+            values.append(value)
+            delta = shift = 0
+    return values
+
+
+def _write_ngrams(directory, layer, terms, positions, text_ends, max_n):
+    """Writes the n-gram tables of a layer, given the term id and position of each of its
+    spans and the index of the first span after the span's text."""
+    hashes = [FNV_OFFSET] * len(terms)
+    for n in range(1, max_n + 1):
+        starts = [i for i in range(len(terms) - n + 1) if i + n <= text_ends[i]]
+        for i in starts:
+            # The hash of the n-gram at i extends that of the (n - 1)-gram at i
+            hashes[i] = ((hashes[i] ^ terms[i + n - 1]) * FNV_PRIME) & HASH_MASK
+        # Stable, so the occurrences of a key stay in position order
+        starts.sort(key=hashes.__getitem__)
+        keys = array("Q")
+        grams = array("I")
+        counts = array("I")
+        offsets = array("Q", [0])
+        postings = bytearray()
+        run_start = 0
+        while run_start < len(starts):
+            key = hashes[starts[run_start]]
+            run_end = run_start + 1
+            while run_end < len(starts) and hashes[starts[run_end]] == key:
+                run_end += 1
+            # Almost always a single n-gram, unless hashes collide
+            run_grams = defaultdict(list)
+            for i in starts[run_start:run_end]:
+                run_grams[tuple(terms[i : i + n])].append(i)
+            for gram, occurrences in sorted(run_grams.items()):
+                keys.append(key)
+                grams.extend(gram)
+                counts.append(len(occurrences))
+                postings += encode_deltas(positions[i] for i in occurrences)
+                offsets.append(len(postings))
+            run_start = run_end
+        prefix = os.path.join(directory, f"{layer}.{n}gram")
+        _write_array(f"{prefix}.keys.u64", keys)
+        _write_array(f"{prefix}.grams.u32", grams)
+        _write_array(f"{prefix}.counts.u32", counts)
+        _write_array(f"{prefix}.offsets.u64", offsets)
+        with open(f"{prefix}.postings.varint", "wb") as f:
+            f.write(postings)
+
+
+def _write_array(path, values):
+    with open(path, "wb") as f:
+        values.tofile(f)
+
+
+def build(texts, root=None, layers=LAYERS, ngram_layers=NGRAM_LAYERS, max_n=MAX_NGRAM):
+    """Indexes a queryset of texts into a new build under `root` (TOKEN_INDEX_DIR by
+    default) and makes it the current one. Returns the build's directory."""
+    root = root or settings.TOKEN_INDEX_DIR
+    directory = os.path.join(root, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(directory)
+
+    term_ids = {layer: {"": NO_TERM} for layer in layers}
+    columns = {layer: array("I") for layer in layers}
+    postings = {layer: defaultdict(lambda: array("I")) for layer in layers}
+    # term ids, positions and text ends of the spans of the n-gram layers
+    units = {layer: (array("I"), array("I"), array("I")) for layer in ngram_layers}
+    span_term_ids = {element: {"": NO_TERM} for element in SPAN_ELEMENTS}
+    span_tables = {element: (array("I"), array("I"), array("I")) for element in SPAN_ELEMENTS}
+    text_entries = []
+    position = 0
+    texts = texts.select_related("corpus").only("id", "slug", "title", "document_cts_urn", "content", "corpus__slug")
+    for text in texts.iterator(chunk_size=100):
+        n_words, spans = word_spans(text.content, layers + SPAN_ELEMENTS)
+        for layer in layers:
+            ids = term_ids[layer]
+            column = array("I", bytes(4 * n_words))
+            for value, start, end in spans[layer]:
+                term = ids.setdefault(value, len(ids))
+                column[start:end] = array("I", [term]) * (end - start)
+                postings[layer][term].append(position + start)
+            columns[layer].extend(column)
+            if layer in units:
+                unit_terms, unit_positions, text_ends = units[layer]
+                first_unit = len(unit_terms)
+                for value, start, _ in spans[layer]:
+                    unit_terms.append(ids[value])
+                    unit_positions.append(position + start)
+                text_ends.extend(array("I", [len(unit_terms)]) * (len(unit_terms) - first_unit))
+        for element, (starts, ends, values) in span_tables.items():
+            ids = span_term_ids[element]
+            for value, start, end in spans[element]:
+                starts.append(position + start)
+                ends.append(position + end)
+                values.append(ids.setdefault(value, len(ids)))
+        text_entries.append(
+            {
+                "id": text.id,
+                "slug": text.slug,
+                "title": text.title,
+                "corpus_slug": text.corpus.slug if text.corpus else None,
+                "urn": text.document_cts_urn,
+                "start": position,
+                "words": n_words,
+            }
+        )
+        position += n_words
+
+    for layer in layers:
+        terms = list(term_ids[layer])
+        offsets = array("I", [0])
+        layer_postings = array("I")
+        for term in range(len(terms)):
+            layer_postings.extend(postings[layer].get(term, ()))
+            offsets.append(len(layer_postings))
+        with open(os.path.join(directory, f"{layer}.terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        _write_array(os.path.join(directory, f"{layer}.column.u32"), columns[layer])
+        _write_array(os.path.join(directory, f"{layer}.postings.u32"), layer_postings)
+        _write_array(os.path.join(directory, f"{layer}.offsets.u32"), offsets)
+    for layer, (unit_terms, unit_positions, text_ends) in units.items():
+        _write_ngrams(directory, layer, unit_terms, unit_positions, text_ends, max_n)
+    for element, (starts, ends, values) in span_tables.items():
+        with open(os.path.join(directory, f"{element}.terms.json"), "w", encoding="utf-8") as f:
+            json.dump(list(span_term_ids[element]), f, ensure_ascii=False)
+        _write_array(os.path.join(directory, f"{element}.starts.u32"), starts)
+        _write_array(os.path.join(directory, f"{element}.ends.u32"), ends)
+        _write_array(os.path.join(directory, f"{element}.values.u32"), values)
+    with open(os.path.join(directory, INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "layers": list(layers),
+                "ngram_layers": list(ngram_layers),
+                "span_elements": list(SPAN_ELEMENTS),
+                "max_n": max_n,
+                "words": position,
+                "texts": text_entries,
+            },
+            f,
+            ensure_ascii=False,
+        )
+
+    _publish(root, directory)
+    return directory
+
+
+def _publish(root, directory):
+    current = os.path.join(root, CURRENT_FILE)
+    with open(current + ".tmp", "w") as f:
+        f.write(os.path.basename(directory))
+    os.replace(current + ".tmp", current)
+    # Build names sort in the order they were started
+    builds = sorted(
+        (entry for entry in os.scandir(root) if entry.is_dir() and entry.path != directory),
+        key=lambda entry: entry.name,
+        reverse=True,
+    )
+    for entry in builds[KEEP_PREVIOUS_BUILDS:]:
+        # Processes still reading an old build keep their mappings after it is deleted
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _map_array(path, typecode="I"):
+    """A file as a read-only memoryview of `typecode` items, or of bytes for typecode None."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(array(typecode or "B"))
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return view.cast(typecode) if typecode else view
+
+
+class TokenIndex:
+    """A read-only view of one build."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as f:
+            index = json.load(f)
+        self.layers = index["layers"]
+        self.words = index["words"]
+        self.texts = index["texts"]
+        self._text_starts = [text["start"] for text in self.texts]
+        # Texts are built in corpus order, so every corpus is one range of positions
+        self._corpus_starts = []
+        self._corpus_slugs = []
+        for text in self.texts:
+            if not self._corpus_slugs or self._corpus_slugs[-1] != text["corpus_slug"]:
+                self._corpus_starts.append(text["start"])
+                self._corpus_slugs.append(text["corpus_slug"])
+        self.terms = {}
+        self.term_ids = {}
+        self.columns = {}
+        self.postings = {}
+        self.offsets = {}
+        for layer in self.layers:
+            with open(os.path.join(directory, f"{layer}.terms.json"), encoding="utf-8") as f:
+                self.terms[layer] = json.load(f)
+            self.term_ids[layer] = {term: i for i, term in enumerate(self.terms[layer])}
+            self.columns[layer] = _map_array(os.path.join(directory, f"{layer}.column.u32"))
+            self.postings[layer] = _map_array(os.path.join(directory, f"{layer}.postings.u32"))
+            self.offsets[layer] = _map_array(os.path.join(directory, f"{layer}.offsets.u32"))
+        self.ngram_layers = index.get("ngram_layers", [])
+        self.max_n = index.get("max_n", 0)
+        self.ngrams = {}
+        for layer in self.ngram_layers:
+            for n in range(1, self.max_n + 1):
+                prefix = os.path.join(directory, f"{layer}.{n}gram")
+                self.ngrams[layer, n] = {
+                    "keys": _map_array(f"{prefix}.keys.u64", "Q"),
+                    "grams": _map_array(f"{prefix}.grams.u32"),
+                    "counts": _map_array(f"{prefix}.counts.u32"),
+                    "offsets": _map_array(f"{prefix}.offsets.u64", "Q"),
+                    "postings": _map_array(f"{prefix}.postings.varint", None),
+                }
+        self.span_elements = index.get("span_elements", [])
+        self.spans = {}
+        for element in self.span_elements:
+            with open(os.path.join(directory, f"{element}.terms.json"), encoding="utf-8") as f:
+                terms = json.load(f)
+            self.spans[element] = (
+                terms,
+                _map_array(os.path.join(directory, f"{element}.starts.u32")),
+                _map_array(os.path.join(directory, f"{element}.ends.u32")),
+                _map_array(os.path.join(directory, f"{element}.values.u32")),
+            )
+
+    def _layer(self, layer):
+        if layer not in self.term_ids:
+            raise ValueError(f"Unknown token index layer: {layer}")
+        return self.term_ids[layer]
+
+    def occurrences(self, layer, term):
+        """The positions of the occurrences of `term` in `layer`, in collection order."""
+        term_id = self._layer(layer).get(term)
+        if not term_id:
+            return memoryview(array("I"))
+        offsets = self.offsets[layer]
+        return self.postings[layer][offsets[term_id] : offsets[term_id + 1]]
+
+    def frequency(self, layer, term):
+        return len(self.occurrences(layer, term))
+
+    def locate(self, position):
+        """The text containing a position, and the position's offset in it."""
+        text = self.texts[bisect.bisect_right(self._text_starts, position) - 1]
+        return text, position - text["start"]
+
+    def span(self, element, position):
+        """The value of the `element` span containing a position, or None."""
+        if element not in self.spans:
+            return None
+        terms, starts, ends, values = self.spans[element]
+        i = bisect.bisect_right(starts, position) - 1
+        if i < 0 or ends[i] <= position:
+            return None
+        return terms[values[i]]
+
+    def locate_occurrence(self, position):
+        """A dict describing the occurrence at a position: its text, chapter and offset."""
+        return self._occurrence(position)[1]
+
+    def _occurrence(self, position):
+        text, offset = self.locate(position)
+        return text, {
+            "text_id": text["id"],
+            "slug": text["slug"],
+            "corpus_slug": text["corpus_slug"],
+            "title": text["title"],
+            "chapter": self.span(CHAPTER_ELEMENT, position),
+            "offset": offset,
+        }
+
+    def lookup(self, layer, term, start=0, stop=None):
+        """Dicts describing the occurrences [start:stop] of `term` in `layer`."""
+        return [self.locate_occurrence(position) for position in self.occurrences(layer, term)[start:stop]]
+
+    def _ngram(self, layer, words):
+        """The n-gram table and entry of a sequence of values of `layer`, or (table, None)."""
+        n = len(words)
+        if layer not in self.ngram_layers:
+            raise ValueError(f"No n-gram index for layer: {layer}")
+        if not 1 <= n <= self.max_n:
+            raise ValueError(f"N-grams have 1 to {self.max_n} words, not {n}")
+        table = self.ngrams[layer, n]
+        term_ids = self.term_ids[layer]
+        gram = tuple(term_ids.get(word, NO_TERM) for word in words)
+        if NO_TERM in gram:
+            return table, None
+        key = ngram_key(gram)
+        keys = table["keys"]
+        entry = bisect.bisect_left(keys, key)
+        while entry < len(keys) and keys[entry] == key:
+            if tuple(table["grams"][entry * n : (entry + 1) * n]) == gram:
+                return table, entry
+            entry += 1
+        return table, None
+
+    def ngram_frequency(self, layer, words):
+        table, entry = self._ngram(layer, words)
+        return 0 if entry is None else table["counts"][entry]
+
+    def ngram_occurrences(self, layer, words):
+        """The positions of the first words of the occurrences of an n-gram of `layer`."""
+        table, entry = self._ngram(layer, words)
+        if entry is None:
+            return []
+        offsets = table["offsets"]
+        return decode_deltas(table["postings"][offsets[entry] : offsets[entry + 1]])
+
+    def ngram_lookup(self, layer, words, start=0, stop=None):
+        return [self.locate_occurrence(position) for position in self.ngram_occurrences(layer, words)[start:stop]]
+
+    def corpus_distribution(self, positions):
+        """{corpus slug: number of positions in it}, for ascending positions."""
+        distribution = {}
+        for position in positions:
+            slug = self._corpus_slugs[bisect.bisect_right(self._corpus_starts, position) - 1]
+            distribution[slug] = distribution.get(slug, 0) + 1
+        return distribution
+
+    def values(self, start, end, layer=CONTEXT_LAYER):
+        """The values of `layer` for the words at positions [start, end)."""
+        terms = self.terms[layer]
+        return [terms[term] for term in self.columns[layer][start:end]]
+
+    def span_end(self, layer, position):
+        """The end of the span of `layer` starting at `position`: the first later word with
+        another value, or starting another span of the same value."""
+        column = self.columns[layer]
+        term = column[position]
+        text, _ = self.locate(position)
+        text_end = text["start"] + text["words"]
+        postings = self.occurrences(layer, self.terms[layer][term])
+        end = position + 1
+        while end < text_end and column[end] == term:
+            i = bisect.bisect_left(postings, end)
+            if i < len(postings) and postings[i] == end:
+                break
+            end += 1
+        return end
+
+    def concordance(self, layer, term, context=DEFAULT_CONTEXT, start=0, stop=None, context_layer=CONTEXT_LAYER):
+        """Keyword in context: the occurrences [start:stop] of `term` in `layer`, each with
+        the `context` words of `context_layer` on either side of it within its text."""
+        hits = []
+        for position in self.occurrences(layer, term)[start:stop]:
+            text, hit = self._occurrence(position)
+            end = self.span_end(layer, position)
+            text_start = text["start"]
+            text_end = text_start + text["words"]
+            hit["left"] = self.values(max(text_start, position - context), position, context_layer)
+            hit["match"] = self.values(position, end, context_layer)
+            hit["right"] = self.values(end, min(text_end, end + context), context_layer)
+            hits.append(hit)
+        return hits
+
+
+    def _ranges(self, text_ids=None, corpora=None):
+        """The sorted [start, end) position ranges of the given texts and corpora, or None
+        for the whole collection."""
+        if text_ids is None and corpora is None:
+            return None
+        text_ids = set(text_ids or ())
+        corpora = set(corpora or ())
+        return [
+            (text["start"], text["start"] + text["words"])
+            for text in self.texts
+            if text["id"] in text_ids or text["corpus_slug"] in corpora
+        ]
+
+    def _clause_positions(self, layer, term_ids):
+        """The positions of every word with one of the term ids in `layer`, ascending."""
+        column = self.columns[layer]
+        positions = []
+        for term in term_ids:
+            postings = self.occurrences(layer, self.terms[layer][term])
+            positions.extend(postings)
+            for position in postings:
+                # Spans of more than one word, rare outside norm_group and orig
+                if position + 1 < self.words and column[position + 1] == term:
+                    positions.extend(range(position + 1, self.span_end(layer, position)))
+        positions.sort()
+        return positions
+
+    def query(self, conditions, text_ids=None, corpora=None):
+        """The positions of the words matching every condition, in collection order.
+
+        `conditions` maps layers to a value or a list of values; a word matches a layer if
+        it has any of them. `text_ids` and `corpora` (slugs) restrict the search to those
+        texts and corpora. The most selective condition is read from its postings; the
+        others are checked against their columns at those positions only."""
+        clauses = []
+        for layer, values in conditions.items():
+            ids = self._layer(layer)
+            values = [values] if isinstance(values, str) else values
+            term_set = {ids[value] for value in values if value in ids} - {NO_TERM}
+            if not term_set:
+                return []
+            offsets = self.offsets[layer]
+            clauses.append((sum(offsets[t + 1] - offsets[t] for t in term_set), layer, term_set))
+        if not clauses:
+            raise ValueError("A token query needs at least one condition")
+        clauses.sort(key=lambda clause: clause[0])
+        _, layer, term_set = clauses[0]
+        positions = self._clause_positions(layer, term_set)
+        ranges = self._ranges(text_ids, corpora)
+        if ranges is not None:
+            positions = [
+                position
+                for start, end in ranges
+                for position in positions[bisect.bisect_left(positions, start) : bisect.bisect_left(positions, end)]
+            ]
+        for _, layer, term_set in clauses[1:]:
+            column = self.columns[layer]
+            positions = [position for position in positions if column[position] in term_set]
+        return positions
+
+    def cite(self, position):
+        """The occurrence at a position with what's needed to cite it: its text's URN, its
+        chapter, verse and translation, and its value in every layer."""
+        text, hit = self._occurrence(position)
+        hit["urn"] = text.get("urn")
+        hit["verse"] = self.span(VERSE_ELEMENT, position)
+        hit["translation"] = self.span(TRANSLATION_ELEMENT, position)
+        hit["word"] = {layer: self.terms[layer][self.columns[layer][position]] for layer in self.layers}
+        return hit
+
+
+_current = {"index": None, "build": None, "checked_at": None}
+_current_lock = threading.Lock()
+
+
+def current_build(root=None):
+    try:
+        with open(os.path.join(root or settings.TOKEN_INDEX_DIR, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def get_token_index():
+    """The current build of this process, or None if nothing has been built. Picks up new
+    builds at most RELOAD_CHECK_INTERVAL seconds after they are published."""
+    with _current_lock:
+        checked_at = _current["checked_at"]
+        if checked_at is None or time.monotonic() - checked_at > RELOAD_CHECK_INTERVAL:
+            build_name = current_build()
+            if build_name != _current["build"]:
+                _current["index"] = (
+                    TokenIndex(os.path.join(settings.TOKEN_INDEX_DIR, build_name)) if build_name else None
+                )
+                _current["build"] = build_name
+            _current["checked_at"] = time.monotonic()
+        return _current["index"]
+
+
+def reset():
+    """Forgets the index of this process, e.g. after building a new one in tests."""
+    with _current_lock:
+        _current.update(index=None, build=None, checked_at=None)
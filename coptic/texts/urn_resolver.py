@@ -0,0 +1,119 @@
+"""An in-memory prefix trie of the CTS URNs of all texts and corpora.
+
+URNs are split into their colon- and dot-delimited parts, keeping the delimiters as
+parts of their own, so that a path through the trie runs through the textgroup
+("urn:cts:copticLit:shenoute"), work ("...shenoute.a22"), edition ("...a22.monbyb")
+and passage ("...monbyb:801-825") levels. Every node keeps the texts at and under it
+sorted by slug, so that prefix lookups are a walk down the trie and no scan.
+
+Lookups are case-insensitive, like the regular expressions they replace. The trie of
+a process is rebuilt when ingest bumps the data generation (see texts.generation).
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+
+from texts.generation import PerGeneration
+from texts.models import Corpus, Text
+
+UrnText = namedtuple("UrnText", "id slug urn corpus")
+
+_DELIMITERS = re.compile(r"([.:])")
+
+
+def urn_path(urn):
+    """The parts of a URN, delimiters included, e.g. "urn:cts:x.y" -> urn : cts : x . y"""
+    return [part for part in _DELIMITERS.split(urn.strip().lower()) if part]
+
+
+class _Node:
+    __slots__ = ("children", "text", "corpus", "texts")
+
+    def __init__(self):
+        self.children = {}
+        self.text = None
+        self.corpus = None
+        self.texts = []
+
+
+class UrnTrie:
+    def __init__(self, texts, corpora, deprecated=None):
+        """texts are UrnTexts, corpora are Corpus objects, deprecated maps old URNs to new ones."""
+        self._root = _Node()
+        self._deprecated = {old.lower(): new for old, new in (deprecated or {}).items()}
+        for corpus in corpora:
+            if corpus.urn_code:
+                node = self._insert(corpus.urn_code)
+                node.corpus = node.corpus or corpus
+        for text in texts:
+            if not text.urn:
+                continue
+            node = self._root
+            for part in urn_path(text.urn):
+                node = node.children.setdefault(part, _Node())
+                node.texts.append(text)
+            node.text = node.text or text
+        self._sort(self._root)
+
+    @classmethod
+    def from_database(cls):
+        corpora = {corpus.id: corpus for corpus in Corpus.objects.all()}
+        texts = [
+            UrnText(id, slug, urn, corpora.get(corpus_id))
+            for id, slug, urn, corpus_id in Text.objects.exclude(document_cts_urn="")
+            .order_by("id")
+            .values_list("id", "slug", "document_cts_urn", "corpus_id")
+        ]
+        return cls(texts, corpora.values(), settings.DEPRECATED_URNS)
+
+    def _insert(self, urn):
+        node = self._root
+        for part in urn_path(urn):
+            node = node.children.setdefault(part, _Node())
+        return node
+
+    def _sort(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.texts.sort(key=lambda text: text.slug)
+            stack.extend(node.children.values())
+
+    def _find(self, urn):
+        node = self._root
+        for part in urn_path(urn):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def canonical(self, urn):
+        """The URN that replaced a deprecated one, or the URN itself."""
+        return self._deprecated.get(urn.strip().lower(), urn)
+
+    def resolve(self, urn):
+        """The text with exactly this (or the replacement of this deprecated) URN, else the
+        corpus with it, else None."""
+        node = self._find(self.canonical(urn))
+        if node is None:
+            return None
+        return node.text or node.corpus
+
+    def texts_under(self, urn):
+        """The texts whose URN is this one or starts with it followed by "." or ":", by slug."""
+        node = self._find(self.canonical(urn))
+        return list(node.texts) if node is not None else []
+
+
+_trie = PerGeneration(lambda generation: UrnTrie.from_database())
+
+
+def get_resolver():
+    """The URN trie of this process, rebuilt after every ingest."""
+    return _trie.get()
+
+
+def reset():
+    """Forgets the trie of this process, e.g. after changing texts in tests."""
+    _trie.reset()